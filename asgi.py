@@ -0,0 +1,17 @@
+"""ASGI entry point, for serving under an ASGI server instead of gunicorn's WSGI workers:
+
+    pip install asgiref uvicorn
+    uvicorn asgi:app --workers 2
+
+Requests still run the synchronous Flask app, each on a worker thread of the
+adapter's pool, so the event loop keeps accepting connections while a request
+waits on the model or the disk.
+"""
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError("asgi.py needs the optional 'asgiref' package: pip install asgiref") from e
+
+from flaskapp import app as wsgi_app
+
+app = WsgiToAsgi(wsgi_app)
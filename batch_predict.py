@@ -0,0 +1,80 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+
+NUM_FEATURES = ['Soil_pH', 'Temperature', 'Humidity', 'Wind_Speed', 'N', 'P', 'K', 'Soil_Quality']
+CAT_FEATURES = ['Crop_Type']
+FEATURES = NUM_FEATURES + CAT_FEATURES
+
+# Upper bound on rows accepted in one request, and rows sent to model.predict at once
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 10000))
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 2000))
+# Report negative predicted yields and interval bounds as 0; the history always keeps the model's own output
+CLIP_NEGATIVE_YIELDS = os.environ.get('CLIP_NEGATIVE_YIELDS', '0') == '1'
+
+
+class BatchError(ValueError):
+    """Raised when the request body as a whole cannot be turned into a batch"""
+
+
+def read_batch(req, max_rows=None):
+    """Read a JSON array or CSV upload from a Flask request into a DataFrame of raw values."""
+    max_rows = max_rows or BATCH_MAX_ROWS
+
+    upload = req.files.get('file')
+    if upload is not None or req.mimetype in ('text/csv', 'application/csv'):
+        stream = upload.stream if upload is not None else io.BytesIO(req.get_data())
+        try:
+            # Read one row past the limit so oversized uploads are detected without parsing them fully
+            df = pd.read_csv(stream, dtype=str, keep_default_na=False, nrows=max_rows + 1)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise BatchError(f"Could not parse CSV: {e}")
+        df.columns = df.columns.str.strip()
+    else:
+        payload = req.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get('rows')
+        if not isinstance(payload, list):
+            raise BatchError("Expected a JSON array of rows (or {\"rows\": [...]}) or a CSV upload")
+        if len(payload) > max_rows:
+            raise BatchError(f"Batch has {len(payload)} rows, the limit is {max_rows}")
+        if not all(isinstance(row, dict) for row in payload):
+            raise BatchError("Every row must be a JSON object")
+        df = pd.DataFrame.from_records(payload)
+
+    if len(df) > max_rows:
+        raise BatchError(f"Batch has more than {max_rows} rows")
+    if len(df) == 0:
+        raise BatchError("Batch is empty")
+    return df.reset_index(drop=True)
+
+
+def clip_yields(values):
+    """values with negatives raised to 0 when CLIP_NEGATIVE_YIELDS is on, unchanged otherwise."""
+    return np.maximum(values, 0.0) if CLIP_NEGATIVE_YIELDS else values
+
+
+def predict_batch(model, frame, chunk_size=None):
+    """Score a validated feature frame with one model.predict call per chunk."""
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    out = np.empty(len(frame), dtype=float)
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        out[start:start + len(chunk)] = model.predict(chunk)
+    return out
+
+
+def predict_batch_intervals(intervals, frame, chunk_size=None):
+    """Point estimates and (n, 3) p10/p50/p90 for a validated frame, one pass per chunk."""
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    point = np.empty(len(frame), dtype=float)
+    bounds = np.empty((len(frame), 3), dtype=float)
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        stop = start + len(chunk)
+        point[start:stop], bounds[start:stop] = intervals.predict_arrays(
+            chunk[NUM_FEATURES].to_numpy(dtype=float), chunk['Crop_Type'].tolist())
+    return point, bounds
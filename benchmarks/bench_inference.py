@@ -0,0 +1,46 @@
+"""Micro-benchmark: single-row model.predict on a DataFrame vs the compiled fast path.
+
+Run from the repository root:  python benchmarks/bench_inference.py [n_rows]
+"""
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fast_inference import compile_pipeline  # noqa: E402
+
+warnings.filterwarnings('ignore')
+
+
+def timed(fn, rows):
+    start = time.perf_counter()
+    out = [fn(r) for r in rows]
+    return (time.perf_counter() - start) / len(rows), out
+
+
+def main(n_rows=2000):
+    model = joblib.load('crop_yield_best_model2.pkl')
+    fast = compile_pipeline(model)
+    if fast is None:
+        sys.exit("Model is not supported by the fast path")
+
+    df = pd.read_csv('crop_yield_dataset.csv').dropna()
+    rows = df[fast.num_features + [fast.cat_feature]].sample(n_rows, random_state=0).to_dict(orient='records')
+
+    slow_t, slow = timed(lambda r: model.predict(pd.DataFrame([r]))[0], rows)
+    fast_t, quick = timed(fast.predict_row, rows)
+
+    identical = np.array_equal(np.asarray(slow), np.asarray(quick))
+    print(f"rows: {n_rows}, identical results: {identical}")
+    print(f"pipeline.predict(DataFrame): {slow_t * 1e6:8.1f} us/row")
+    print(f"compiled predict_row:        {fast_t * 1e6:8.1f} us/row")
+    print(f"speedup: {slow_t / fast_t:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
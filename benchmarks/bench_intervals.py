@@ -0,0 +1,62 @@
+"""Cost of p10/p50/p90 intervals relative to a plain point prediction.
+
+Loads the registry's active model the way the service does (or the given
+model file, which needs to be a forest to have intervals) and scores batches of rows from
+crop_yield_dataset.csv with the batch path's plain predict and with
+predict_batch_intervals. Forests get their intervals from the per-tree outputs
+and boosted models from residual quantiles (see prediction_intervals.py).
+
+Run from the repository root:  python benchmarks/bench_intervals.py [model.pkl]
+"""
+import os
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from batch_predict import FEATURES, predict_batch, predict_batch_intervals  # noqa: E402
+from data_loader import load_dataset  # noqa: E402
+from model_loader import load_model  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+
+warnings.filterwarnings('ignore')
+
+BATCH_SIZES = [1, 100, 2000]
+
+
+def seconds_per_call(fn, min_seconds=1.0):
+    fn()
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        fn()
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main(model_path=None):
+    os.chdir(ROOT)
+    registry = ModelRegistry()
+    version = None if model_path else registry.active_version()
+    if version:
+        loaded = load_model(registry.model_path(version), version, registry.metadata(version))
+    else:
+        loaded = load_model(model_path or 'crop_yield_best_model2.pkl')
+    if loaded.intervals is None:
+        sys.exit("This model has no intervals (register a boosted model with `python prediction_intervals.py calibrate`)")
+    data = load_dataset('crop_yield_dataset.csv').dropna()
+    frame = data.sample(max(BATCH_SIZES), replace=True, random_state=0)[FEATURES].reset_index(drop=True)
+    frame['Crop_Type'] = frame['Crop_Type'].astype(str)
+
+    print(f"{type(loaded.fast.regressor).__name__}, intervals from {loaded.intervals.method}")
+    print(f"{'rows':>6s} {'predict ms':>11s} {'intervals ms':>13s} {'ratio':>7s}")
+    for n in BATCH_SIZES:
+        chunk = frame.iloc[:n]
+        plain = seconds_per_call(lambda: predict_batch(loaded.predictor, chunk))
+        interval = seconds_per_call(lambda: predict_batch_intervals(loaded.intervals, chunk))
+        print(f"{n:6d} {plain * 1000:11.2f} {interval * 1000:13.2f} {interval / plain:6.2f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,79 @@
+"""Dataset merge at synthetic scale: the old row-wise mapping and many-to-many join
+vs merge_agri_datasets.merge_datasets (vectorised mapping, optional year aggregation).
+
+The real inputs are replicated: Kaggle rows `scale` times, and FAOSTAT to `years`
+years per crop. Reports time, output rows and in-memory size of each variant.
+
+Run from the repository root:  python benchmarks/bench_merge.py [scale] [years]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_loader import load_dataset  # noqa: E402
+import merge_agri_datasets  # noqa: E402
+
+
+def synthetic_inputs(scale, years):
+    os.chdir(ROOT)
+    kaggle = load_dataset('Crop_recommendation.csv')
+    faostat = load_dataset('FAOSTAT_data_en_10-5-2025.csv')
+    foodgrains = load_dataset('Foodgrains1.csv', columns=['Crop', 'Yield'])
+    oilseeds = load_dataset('oilseeds1.csv', columns=['Crops', 'Yield'])
+
+    kaggle = pd.concat([kaggle] * scale, ignore_index=True)
+    rng = np.random.default_rng(0)
+    first = faostat.groupby('Crop', observed=True).head(1)
+    faostat = pd.concat([first.assign(Year=np.int16(1900 + y), Yield=first['Yield'] * rng.uniform(0.8, 1.2, len(first)))
+                         for y in range(years)], ignore_index=True)
+    faostat['Yield'] = faostat['Yield'].astype(np.float32)
+    return kaggle, faostat, foodgrains, oilseeds
+
+
+def old_merge(kaggle, faostat, foodgrains, oilseeds):
+    # The previous script: plain object columns, the mapping dict rebuilt on every row
+    kaggle, faostat = kaggle.astype({'label': object}), faostat.astype({'Crop': object})
+    foodgrains, oilseeds = foodgrains.astype({'Crop': object}), oilseeds.astype({'Crops': object})
+
+    def map_crop_names(name):
+        crop_name_map = dict(merge_agri_datasets.CROP_NAME_MAP)
+        return crop_name_map.get(name.strip(), name.strip().lower().replace(' ', '').replace('&', 'and'))
+
+    faostat['crop_std'] = faostat['Crop'].apply(map_crop_names)
+    foodgrains['crop_std'] = foodgrains['Crop'].apply(lambda x: x.strip().lower())
+    oilseeds['crop_std'] = oilseeds['Crops'].apply(lambda x: x.strip().lower())
+    kaggle['crop_std'] = kaggle['label'].apply(lambda x: x.strip().lower())
+    kaggle_filtered = kaggle[kaggle['crop_std'].isin(faostat['crop_std'])]
+    merged = pd.merge(kaggle_filtered, faostat, on='crop_std', how='inner')
+    merged = pd.merge(merged, foodgrains.rename(columns={'Yield': 'Yield_foodgrains'})[['crop_std', 'Yield_foodgrains']],
+                      on='crop_std', how='left')
+    return pd.merge(merged, oilseeds.rename(columns={'Yield': 'Yield_oilseeds'})[['crop_std', 'Yield_oilseeds']],
+                    on='crop_std', how='left')
+
+
+def run(name, fn):
+    start = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - start
+    print(f"{name:28s} {seconds:7.2f}s  {len(out):>10d} rows  {out.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+    return out
+
+
+def main(scale=50, years=60):
+    inputs = synthetic_inputs(scale, years)
+    print(f"Kaggle {len(inputs[0])} rows, FAOSTAT {len(inputs[1])} rows ({years} years per crop)")
+    run('old (apply, object dtype)', lambda: old_merge(*inputs))
+    run('vectorised', lambda: merge_agri_datasets.merge_datasets(*inputs, log=None))
+    run('vectorised, --max-fanout 5', lambda: merge_agri_datasets.merge_datasets(*inputs, max_fanout=5, log=None))
+    run('vectorised, years averaged', lambda: merge_agri_datasets.merge_datasets(*inputs, year_aggregation='mean',
+                                                                                  log=None))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,113 @@
+"""Cold-start time and per-worker memory for each model loading mode under gunicorn.
+
+Starts gunicorn once per mode, waits until /ready answers 200, sends a few
+predictions, then reads RSS and PSS (RSS with shared pages divided between the
+processes sharing them) of every worker from /proc. Linux only.
+
+Run from the repository root:  python benchmarks/bench_model_loading.py [workers]
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'per-worker eager': {'GUNICORN_PRELOAD': '0', 'MODEL_LOAD_MODE': 'eager', 'MODEL_MMAP': '0'},
+    'per-worker lazy': {'GUNICORN_PRELOAD': '0', 'MODEL_LOAD_MODE': 'lazy', 'MODEL_MMAP': '0'},
+    'preload (copy-on-write)': {'GUNICORN_PRELOAD': '1', 'MODEL_LOAD_MODE': 'eager', 'MODEL_MMAP': '0'},
+    'preload + mmap': {'GUNICORN_PRELOAD': '1', 'MODEL_LOAD_MODE': 'eager', 'MODEL_MMAP': '1'},
+}
+
+FORM = urllib.parse.urlencode(dict(
+    Soil_pH=6.5, Temperature=20, Humidity=80, Wind_Speed=8, N=84, P=66, K=50, Soil_Quality=66, Crop_Type='Corn'
+)).encode()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    rss = pss = 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def children(pid):
+    out = subprocess.run(['pgrep', '-P', str(pid)], capture_output=True, text=True).stdout
+    return [int(p) for p in out.split()]
+
+
+def run_mode(name, overrides, workers):
+    port = free_port()
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, **overrides, LOG_LEVEL='WARNING',
+               HISTORY_PATH=os.path.join(tmp, 'history.db'), METRICS_DIR=os.path.join(tmp, 'metrics'))
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'flaskapp:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{port}'
+    try:
+        ready_after = None
+        while time.perf_counter() - start < 120:
+            try:
+                with urllib.request.urlopen(base + '/ready', timeout=5) as r:
+                    if r.status == 200:
+                        ready_after = time.perf_counter() - start
+                        break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.05)
+        for _ in range(workers * 4):
+            urllib.request.urlopen(base + '/', data=FORM, timeout=30).read()
+        first_prediction_after = time.perf_counter() - start
+
+        worker_pids = children(proc.pid)
+        master = memory_kb(proc.pid)
+        per_worker = [memory_kb(p) for p in worker_pids]
+        return {
+            "mode": name,
+            "workers": len(worker_pids),
+            "ready_seconds": round(ready_after, 2) if ready_after else None,
+            "first_predictions_seconds": round(first_prediction_after, 2),
+            "master_rss_mb": round(master[0] / 1024, 1),
+            "worker_rss_mb": [round(r / 1024, 1) for r, _ in per_worker],
+            "worker_pss_mb": [round(p / 1024, 1) for _, p in per_worker],
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main(workers=2):
+    results = [run_mode(name, overrides, workers) for name, overrides in MODES.items()]
+    for r in results:
+        print(f"{r['mode']:26s} ready {r['ready_seconds']}s, 4 predictions/worker done {r['first_predictions_seconds']}s, "
+              f"worker RSS {r['worker_rss_mb']} MB, worker PSS {r['worker_pss_mb']} MB, master RSS {r['master_rss_mb']} MB")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2)
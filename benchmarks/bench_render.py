@@ -0,0 +1,78 @@
+"""Requests/sec for the page route: per-request render_template_string of the old
+inline page vs the precompiled template with external CSS/JS.
+
+Run from the repository root:  python benchmarks/bench_render.py [n_requests]
+"""
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+warnings.filterwarnings('ignore')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ['HISTORY_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench_history.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template_string, request  # noqa: E402
+
+import flaskapp  # noqa: E402
+
+FORM = dict(Soil_pH=5.5, Temperature=9.4, Humidity=80, Wind_Speed=10, N=60, P=45, K=31, Soil_Quality=22, Crop_Type='Wheat')
+
+
+def inline_source():
+    # Rebuild the single-string page the app used to render: CSS and JS pasted inline
+    root = flaskapp.app.root_path
+    with open(os.path.join(root, 'templates', 'index.html')) as f:
+        source = f.read()
+    with open(os.path.join(root, 'static', 'app.css')) as f:
+        css = f.read()
+    with open(os.path.join(root, 'static', 'app.js')) as f:
+        js = f.read()
+    source = source.replace('''<link rel="stylesheet" href="{{ asset_url('app.css') }}">''', f'<style>\n{css}</style>')
+    return source.replace('''<script src="{{ asset_url('app.js') }}" defer></script>''', f'<script>\n{js}</script>')
+
+
+SOURCE = inline_source()
+
+
+@flaskapp.app.route('/__bench_inline', methods=['GET', 'POST'])
+def inline_page():
+    prediction = soil_quality = None
+    if request.method == 'POST':
+        prediction, soil_quality = 0.02, 22
+    return render_template_string(SOURCE, prediction=prediction, soil_quality=soil_quality, error=None)
+
+
+@flaskapp.app.route('/__bench_compiled', methods=['GET', 'POST'])
+def compiled_page():
+    prediction = soil_quality = None
+    if request.method == 'POST':
+        prediction, soil_quality = 0.02, 22
+    return flaskapp.page_template.render(request=request, prediction=prediction, soil_quality=soil_quality, error=None)
+
+
+def rps(client, method, url, n):
+    call = client.post if method == 'POST' else client.get
+    size = len(call(url, data=FORM).data)
+    start = time.perf_counter()
+    for _ in range(n):
+        call(url, data=FORM)
+    return n / (time.perf_counter() - start), size
+
+
+def main(n=500):
+    client = flaskapp.app.test_client()
+    for method in ('GET', 'POST'):
+        before, before_size = rps(client, method, '/__bench_inline', n)
+        after, after_size = rps(client, method, '/__bench_compiled', n)
+        print(f"{method} render_template_string (inline assets): {before:8.1f} req/s, {before_size} bytes")
+        print(f"{method} precompiled template (external assets): {after:8.1f} req/s, {after_size} bytes")
+        print(f"{method} speedup: {after / before:.1f}x")
+    full, _ = rps(client, 'POST', '/', n)
+    print(f"POST / end to end (predict + history + render): {full:8.1f} req/s")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
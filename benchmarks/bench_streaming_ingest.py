@@ -0,0 +1,110 @@
+"""Peak RSS and time of the in-memory training data path vs chunked streaming ingestion.
+
+Writes a synthetic CSV with the columns of crop_yield_dataset.csv (rows resampled
+from it with jitter and ~1% missing values), then in a fresh subprocess each:
+  in-memory  pd.read_csv + median fill + train_test_split + ColumnTransformer
+  streaming  StreamedDataset.build with the given memory budget
+and reports the child's peak RSS (VmHWM), also relative to its RSS after imports,
+and the median error of the streaming pass. Linux only.
+
+Run from the repository root:  python benchmarks/bench_streaming_ingest.py [rows] [budget_mb]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import model_comparison  # noqa: E402
+
+FEATURES = model_comparison.num_features + model_comparison.cat_features + [model_comparison.target]
+
+
+def make_csv(path, rows, seed=0):
+    base = pd.read_csv(os.path.join(ROOT, 'crop_yield_dataset.csv'))
+    rng = np.random.default_rng(seed)
+    written = 0
+    with open(path, 'w') as f:
+        while written < rows:
+            n = min(200_000, rows - written)
+            chunk = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+            for col in model_comparison.num_features:
+                chunk[col] = chunk[col] * rng.normal(1.0, 0.02, n)
+                chunk.loc[rng.random(n) < 0.01, col] = np.nan
+            chunk.to_csv(f, header=written == 0, index=False)
+            written += n
+
+
+def in_memory(path):
+    from sklearn.model_selection import train_test_split
+    df = pd.read_csv(path, usecols=FEATURES)
+    df = df.dropna(subset=['Crop_Yield', 'Crop_Type'])
+    for col in model_comparison.num_features:
+        df[col] = df[col].fillna(df[col].median())
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[model_comparison.num_features + model_comparison.cat_features], df['Crop_Yield'], test_size=0.2, random_state=42)
+    ct = model_comparison.make_preprocessor()
+    ct.fit_transform(X_train)
+    ct.transform(X_test)
+    return {col: float(df[col].median()) for col in model_comparison.num_features}
+
+
+def streaming(path, budget_mb, directory):
+    from streaming_ingest import StreamedDataset
+    dataset = StreamedDataset(path, model_comparison.num_features, 'Crop_Type', 'Crop_Yield', directory=directory,
+                              budget_mb=budget_mb).build(log=lambda *_: None)
+    return dict(zip(model_comparison.num_features, dataset.meta['medians']))
+
+
+def memory_mb(field):
+    # ru_maxrss would be no good here: Linux carries it over from the forking parent across exec
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+
+
+def child(mode, path, budget_mb, directory):
+    # Interpreter plus pandas/sklearn/xgboost imports, before any data is touched
+    baseline = memory_mb('VmRSS')
+    start = time.perf_counter()
+    medians = in_memory(path) if mode == 'in-memory' else streaming(path, budget_mb, directory)
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(time.perf_counter() - start, 2),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(memory_mb('VmHWM'), 1),
+        "medians": medians,
+    }))
+
+
+def main(rows=2_000_000, budget_mb=64):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'synthetic.csv')
+    make_csv(path, rows)
+    print(f"{rows} rows, {os.path.getsize(path) / 1e6:.0f} MB CSV, streaming budget {budget_mb} MB")
+    results = {}
+    for mode in ('in-memory', 'streaming'):
+        out = subprocess.run([sys.executable, '-W', 'ignore', __file__, '--child', mode, path, str(budget_mb),
+                              os.path.join(tmp, 'design')], capture_output=True, text=True, check=True, cwd=ROOT)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    exact, approx = results['in-memory']['medians'], results['streaming']['medians']
+    for r in results.values():
+        print(f"{r['mode']:10s} {r['seconds']:7.2f}s  peak RSS {r['peak_rss_mb']:8.1f} MB "
+              f"(+{r['peak_rss_mb'] - r['baseline_rss_mb']:.1f} MB over the {r['baseline_rss_mb']:.0f} MB after imports)")
+    worst = max(abs(approx[c] - exact[c]) / max(abs(exact[c]), 1e-9) for c in exact)
+    print(f"largest relative median error of the streaming pass: {worst:.2e}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], float(sys.argv[4]), sys.argv[5])
+    else:
+        main(*(int(a) for a in sys.argv[1:3]))
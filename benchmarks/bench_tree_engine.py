@@ -0,0 +1,62 @@
+"""Throughput of the saved regressor's own predict vs the flattened NumPy trees (tree_engine.py).
+
+Scores batches of transformed rows from crop_yield_dataset.csv at several sizes
+and reports rows/s for both, the largest difference between them and the size
+of the node arrays against the pickled estimator.
+
+Run from the repository root:  python benchmarks/bench_tree_engine.py [model.pkl]
+"""
+import os
+import pickle
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_loader import load_dataset  # noqa: E402
+from tree_engine import export_trees  # noqa: E402
+
+warnings.filterwarnings('ignore')
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def rows_per_second(fn, X, min_seconds=1.0):
+    fn(X)
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        fn(X)
+        calls += 1
+    return calls * len(X) / (time.perf_counter() - start)
+
+
+def main(model_path='crop_yield_best_model2.pkl'):
+    os.chdir(ROOT)
+    model = joblib.load(model_path)
+    regressor = model.steps[-1][1]
+    data = load_dataset('crop_yield_dataset.csv').dropna()
+    data = data.sample(max(BATCH_SIZES), replace=True, random_state=0)
+    X = np.asarray(model[:-1].transform(data), dtype=np.float64)
+
+    start = time.perf_counter()
+    engine = export_trees(regressor)
+    export_seconds = time.perf_counter() - start
+    diff = np.abs(engine.predict(X) - regressor.predict(X)).max()
+    print(f"{type(regressor).__name__}: {engine.n_trees} trees, {engine.n_nodes} nodes, depth {engine.depth}, "
+          f"exported in {export_seconds:.2f}s")
+    print(f"node arrays {engine.nbytes / 1e6:.2f} MB vs pickled estimator "
+          f"{len(pickle.dumps(regressor, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6:.2f} MB; max |diff| {diff:.3g}")
+    print(f"{'rows':>6s} {'native rows/s':>14s} {'engine rows/s':>14s} {'speedup':>8s}")
+    for n in BATCH_SIZES:
+        native = rows_per_second(regressor.predict, X[:n])
+        flat = rows_per_second(engine.predict, X[:n])
+        print(f"{n:6d} {native:14.0f} {flat:14.0f} {flat / native:7.2f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,288 @@
+"""Load test of the service under gunicorn: latency percentiles, throughput and worker memory.
+
+For every history size, a SQLite history database is seeded with that many
+synthetic records (seeds are cached in the temp directory and copied per run),
+gunicorn is started with gunicorn.conf.py against it, and each scenario is driven
+by `concurrency` client threads for `duration` seconds:
+
+  form     POST / with a random form (mostly prediction-cache misses)
+  history  GET /api/history, first page, alternating with a crop filter
+  batch    POST /api/predict/batch with `batch-rows` JSON rows
+
+Each result has p50/p95/p99/mean/max latency in ms, requests/s, error count and
+the RSS/PSS of every worker afterwards. Everything is written as one JSON file
+(with the git commit it ran on) so runs can be compared:
+
+  python benchmarks/load_test.py --history-sizes 0,100000,1000000 --concurrency 1,8,32
+  python benchmarks/load_test.py --compare before.json after.json
+
+Run from the repository root. Linux only (worker memory is read from /proc).
+Client and server share the machine's CPUs, so compare runs from the same host.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from bench_model_loading import children, free_port, memory_kb  # noqa: E402
+from history_store import SqliteHistoryStore  # noqa: E402
+
+CROPS = ['Barley', 'Corn', 'Cotton', 'Potato', 'Rice', 'Soybean', 'Sugarcane', 'Sunflower', 'Tomato', 'Wheat']
+RANGES = {
+    'Soil_pH': (4.5, 8.5), 'Temperature': (5, 40), 'Humidity': (20, 100), 'Wind_Speed': (0, 20),
+    'N': (20, 150), 'P': (10, 100), 'K': (10, 100), 'Soil_Quality': (10, 100),
+}
+SCENARIOS = ['form', 'history', 'batch']
+SEED_DIR = os.path.join(tempfile.gettempdir(), 'agripredict_loadtest')
+
+
+def random_input(rng):
+    row = {k: round(rng.uniform(lo, hi), 2) for k, (lo, hi) in RANGES.items()}
+    row['Crop_Type'] = rng.choice(CROPS)
+    return row
+
+
+def seeded_history(n, batch=50_000):
+    """Path of a SQLite history with n synthetic records, built once per size and reused."""
+    os.makedirs(SEED_DIR, exist_ok=True)
+    path = os.path.join(SEED_DIR, f'history-{n}.db')
+    if os.path.exists(path):
+        return path
+    tmp = path + '.building'
+    for leftover in (tmp, tmp + '-wal', tmp + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    store = SqliteHistoryStore(tmp)
+    rng = random.Random(n)
+    start = datetime(2024, 1, 1)
+    for offset in range(0, n, batch):
+        records = []
+        for i in range(offset, min(n, offset + batch)):
+            record = random_input(rng)
+            record.update({'yield': round(rng.uniform(0, 120), 2), 'model_version': 'legacy',
+                           'date': (start + timedelta(seconds=30 * i)).strftime('%Y-%m-%d %H:%M:%S')})
+            records.append(record)
+        store.append_many(records)
+    conn = store._connect()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    os.replace(tmp, path)
+    return path
+
+
+class Server:
+    def __init__(self, history_path, workers, threads, worker_class, extra_env=None):
+        self.tmp = tempfile.mkdtemp()
+        db = os.path.join(self.tmp, 'history.db')
+        shutil.copy(history_path, db)
+        self.port = free_port()
+        self.base = f'http://127.0.0.1:{self.port}'
+        env = dict(os.environ, LOG_LEVEL='WARNING', HISTORY_PATH=db, METRICS_DIR=os.path.join(self.tmp, 'metrics'),
+                   **(extra_env or {}))
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers),
+               '-k', worker_class, '--threads', str(threads), '-b', f'127.0.0.1:{self.port}', '--timeout', '120']
+        self.proc = subprocess.Popen(cmd + ['flaskapp:app'], cwd=ROOT, env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, timeout=180):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            try:
+                with urllib.request.urlopen(self.base + '/ready', timeout=5) as r:
+                    if r.status == 200:
+                        return
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("gunicorn did not become ready")
+
+    def memory(self):
+        workers = [memory_kb(p) for p in children(self.proc.pid)]
+        return {
+            "master_rss_mb": round(memory_kb(self.proc.pid)[0] / 1024, 1),
+            "worker_rss_mb": [round(r / 1024, 1) for r, _ in workers],
+            "worker_pss_mb": [round(p / 1024, 1) for _, p in workers],
+        }
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def make_request(scenario, base, rng, batch_rows, counter):
+    if scenario == 'form':
+        data = urllib.parse.urlencode(random_input(rng)).encode()
+        return urllib.request.Request(base + '/', data=data)
+    if scenario == 'history':
+        query = 'limit=50' if counter % 2 == 0 else f'limit=50&crop_type={rng.choice(CROPS)}'
+        return urllib.request.Request(f'{base}/api/history?{query}')
+    if scenario == 'batch':
+        body = json.dumps([random_input(rng) for _ in range(batch_rows)]).encode()
+        return urllib.request.Request(base + '/api/predict/batch', data=body,
+                                      headers={'Content-Type': 'application/json'})
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def drive(base, scenario, concurrency, duration, batch_rows, warmup=5):
+    """Run `concurrency` closed-loop clients for `duration` seconds; returns the summary dict."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    for i in range(warmup):
+        urllib.request.urlopen(make_request(scenario, base, random.Random(i), batch_rows, i), timeout=60).read()
+
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def client(i):
+        rng = random.Random(1000 + i)
+        n = 0
+        while time.perf_counter() < deadline:
+            req = make_request(scenario, base, rng, batch_rows, n)
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=60) as r:
+                    r.read()
+                    if r.status != 200:
+                        errors[i] += 1
+            except (urllib.error.URLError, ConnectionError, OSError):
+                errors[i] += 1
+            latencies[i].append(time.perf_counter() - t0)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lat = np.array([x for per_client in latencies for x in per_client]) * 1000
+    summary = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": int(len(lat)),
+        "errors": int(sum(errors)),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(lat) / elapsed, 1),
+        "latency_ms": {},
+    }
+    if len(lat):
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        summary["latency_ms"] = {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+                                 "mean": round(float(lat.mean()), 2), "max": round(float(lat.max()), 2)}
+    if scenario == 'batch':
+        summary["rows_per_second"] = round(len(lat) * batch_rows / elapsed, 1)
+    return summary
+
+
+def git_info():
+    def run(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": run('rev-parse', 'HEAD'), "dirty": bool(run('status', '--porcelain', '--untracked-files=no'))}
+
+
+def run_suite(args):
+    meta = {
+        **git_info(),
+        "started_at": datetime.now().isoformat(timespec='seconds'),
+        "host": platform.node(), "python": platform.python_version(), "cpus": os.cpu_count(),
+        "workers": args.workers, "threads": args.threads, "worker_class": args.worker_class, "duration": args.duration,
+        "batch_rows": args.batch_rows,
+    }
+    results = []
+    for size in args.history_sizes:
+        seed_start = time.perf_counter()
+        history = seeded_history(size)
+        print(f"history {size}: seed ready in {time.perf_counter() - seed_start:.1f}s", flush=True)
+        server = Server(history, args.workers, args.threads, args.worker_class)
+        try:
+            server.wait_ready()
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    r = drive(server.base, scenario, concurrency, args.duration, args.batch_rows)
+                    r.update(history_records=size, **server.memory())
+                    results.append(r)
+                    lat = r['latency_ms']
+                    print(f"  {scenario:8s} c={concurrency:<3d} {r['throughput_rps']:8.1f} req/s  "
+                          f"p50 {lat.get('p50')} p95 {lat.get('p95')} p99 {lat.get('p99')} ms  "
+                          f"errors {r['errors']}  worker RSS {r['worker_rss_mb']} MB", flush=True)
+        finally:
+            server.stop()
+    meta["finished_at"] = datetime.now().isoformat(timespec='seconds')
+    return {"meta": meta, "results": results}
+
+
+def compare(before_path, after_path):
+    """Print after/before ratios for every scenario present in both files."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    key = lambda r: (r['history_records'], r['scenario'], r['concurrency'])  # noqa: E731
+    old = {key(r): r for r in before['results']}
+    print(f"before {before['meta']['commit'][:10]}  after {after['meta']['commit'][:10]}  (ratio after/before)")
+    for r in after['results']:
+        o = old.get(key(r))
+        if o is None or not o['latency_ms'] or not r['latency_ms']:
+            continue
+        ratios = {p: r['latency_ms'][p] / o['latency_ms'][p] for p in ('p50', 'p95', 'p99') if o['latency_ms'][p]}
+        print(f"history {r['history_records']:>8d} {r['scenario']:8s} c={r['concurrency']:<3d} "
+              f"throughput x{r['throughput_rps'] / max(o['throughput_rps'], 1e-9):.2f}  "
+              + '  '.join(f"{p} x{v:.2f}" for p, v in ratios.items()))
+
+
+def int_list(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--history-sizes', type=int_list, default=[0, 10_000, 100_000])
+    parser.add_argument('--concurrency', type=int_list, default=[1, 8])
+    parser.add_argument('--scenarios', type=lambda s: s.split(','), default=SCENARIOS)
+    parser.add_argument('--duration', type=float, default=10, help="seconds per scenario and concurrency")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--worker-class', default='gthread', help="gunicorn worker class (gthread or sync)")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker (gthread only)")
+    parser.add_argument('--batch-rows', type=int, default=100)
+    parser.add_argument('--output', help="JSON results path (default benchmarks/results/load-<commit>-<time>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    report = run_suite(args)
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"load-{report['meta']['commit'][:10]}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
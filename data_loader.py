@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (pandas' Parquet engine)
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+
+# Typed copies of the CSVs live here; safe to delete at any time
+DATA_CACHE_DIR = os.environ.get('DATA_CACHE_DIR', '.data_cache')
+
+CATEGORY = 'category'
+FLOAT = 'float32'
+
+
+def date(fmt):
+    return ('date', fmt)
+
+
+# Explicit column types per source file (column names after stripping whitespace).
+# Columns not listed keep the type pandas infers.
+SCHEMAS = {
+    'crop_yield_dataset.csv': {
+        'Date': date('%d-%m-%Y'),
+        'Crop_Type': CATEGORY, 'Soil_Type': CATEGORY,
+        'Soil_pH': FLOAT, 'Temperature': FLOAT, 'Humidity': FLOAT, 'Wind_Speed': FLOAT,
+        'N': FLOAT, 'P': FLOAT, 'K': FLOAT, 'Crop_Yield': FLOAT, 'Soil_Quality': FLOAT,
+    },
+    'Crop_recommendation.csv': {
+        'N': FLOAT, 'P': FLOAT, 'K': FLOAT, 'temperature': FLOAT, 'humidity': FLOAT, 'ph': FLOAT,
+        'rainfall': FLOAT, 'label': CATEGORY,
+    },
+    'FAOSTAT_data_en_10-5-2025.csv': {
+        'Country': CATEGORY, 'Crop': CATEGORY, 'Year': 'int16', 'Unit': CATEGORY, 'Yield': FLOAT,
+    },
+    'Foodgrains1.csv': {
+        'Crop': CATEGORY, 'Area': FLOAT, 'Production': FLOAT, 'Yield': FLOAT,
+    },
+    'oilseeds1.csv': {
+        'Crops': CATEGORY, 'Area': FLOAT, 'Production': FLOAT, 'Yield': FLOAT,
+    },
+    'projectdata.csv': {
+        'N': FLOAT, 'P': FLOAT, 'K': FLOAT, 'temperature': FLOAT, 'humidity': FLOAT, 'ph': FLOAT,
+        'rainfall': FLOAT, 'label': CATEGORY, 'crop_std': CATEGORY, 'Country': CATEGORY, 'Crop': CATEGORY,
+        'Year': 'int16', 'Unit': CATEGORY, 'Yield': FLOAT, 'Yield_foodgrains': FLOAT, 'Yield_oilseeds': FLOAT,
+    },
+    'final_expanded_cleaned.csv': {
+        'crop_std': CATEGORY, 'country': CATEGORY, 'unit': CATEGORY,
+        **{c: FLOAT for c in ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'year', 'yield',
+                              'yield_foodgrains', 'yield_oilseeds', 'n_norm', 'p_norm', 'k_norm',
+                              'temperature_norm', 'humidity_norm', 'ph_norm', 'rainfall_norm', 'year_norm']},
+    },
+}
+# The cleaned EDA input has the same layout as the final expanded dataset
+SCHEMAS['projectdata_cleaned.csv'] = SCHEMAS['final_expanded_cleaned.csv']
+# merge_agri_datasets.py output; Year is fractional when FAOSTAT years are averaged
+SCHEMAS['final_agri_full_dataset.csv'] = dict(SCHEMAS['projectdata.csv'], Year=FLOAT)
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's bytes, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_sha256(*parts):
+    """Hex SHA-256 of bytes parts and JSON-serialisable parts (keys sorted), in order."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def apply_schema(df, schema):
+    """Strip column names and cast the listed columns in place; returns df."""
+    df.columns = df.columns.str.strip()
+    for column, dtype in schema.items():
+        if column not in df:
+            continue
+        if isinstance(dtype, tuple):
+            df[column] = pd.to_datetime(df[column], format=dtype[1])
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def read_csv(path, schema=None):
+    """Parse a CSV and apply its schema (looked up by file name when not given)."""
+    if schema is None:
+        schema = SCHEMAS.get(os.path.basename(path), {})
+    return apply_schema(pd.read_csv(path), schema)
+
+
+class DatasetCache:
+    """Typed columnar copies of source CSVs, rebuilt only when the source changes.
+
+    Each cached file sits next to a small JSON sidecar holding the source's
+    size, mtime and SHA-256. A matching size and mtime is trusted as is; when
+    they differ the source is hashed, and an unchanged hash (e.g. after a fresh
+    checkout) only refreshes the sidecar. The cache file name includes a hash of
+    the schema, so editing SCHEMAS rebuilds the affected datasets.
+    Parquet is used when pyarrow is installed (and then only the requested
+    columns are read from disk), a pickle otherwise.
+    """
+
+    def __init__(self, directory=DATA_CACHE_DIR, fmt=CACHE_FORMAT):
+        self.directory = directory
+        self.fmt = fmt
+
+    def paths(self, source, schema):
+        schema_key = content_sha256(schema)[:8]
+        stem = f"{os.path.splitext(os.path.basename(source))[0]}-{schema_key}"
+        extension = 'parquet' if self.fmt == 'parquet' else 'pkl'
+        base = os.path.join(self.directory, stem)
+        return f'{base}.{extension}', f'{base}.json'
+
+    def _is_fresh(self, source, data_path, meta_path):
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        st = os.stat(source)
+        if meta.get('size') == st.st_size and meta.get('mtime_ns') == st.st_mtime_ns:
+            return True
+        if meta.get('size') != st.st_size or meta.get('sha256') != file_sha256(source):
+            return False
+        self._write_meta(meta_path, source, meta['sha256'])
+        return True
+
+    def _write_meta(self, meta_path, source, sha256):
+        st = os.stat(source)
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(
+            {"source": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+             "sha256": sha256, "format": self.fmt}).encode()))
+
+    def _write_atomic(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def build(self, source, schema):
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self.paths(source, schema)
+        sha256 = file_sha256(source)
+        df = read_csv(source, schema)
+        if self.fmt == 'parquet':
+            self._write_atomic(data_path, lambda f: df.to_parquet(f, index=False))
+        else:
+            self._write_atomic(data_path, lambda f: pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write_meta(meta_path, source, sha256)
+        return df
+
+    def load(self, source, columns=None, schema=None):
+        if schema is None:
+            schema = SCHEMAS.get(os.path.basename(source), {})
+        data_path, meta_path = self.paths(source, schema)
+        if not self._is_fresh(source, data_path, meta_path):
+            df = self.build(source, schema)
+            return df[columns] if columns is not None else df
+        if self.fmt == 'parquet':
+            return pd.read_parquet(data_path, columns=columns)
+        with open(data_path, 'rb') as f:
+            df = pickle.load(f)
+        return df[columns] if columns is not None else df
+
+
+_default_cache = None
+
+
+def load_dataset(path, columns=None, cache=True):
+    """Typed DataFrame of a source CSV, optionally only the given columns.
+
+    Served from the columnar cache in DATA_CACHE_DIR unless cache=False or
+    DATA_CACHE=0, in which case the CSV is parsed directly.
+    """
+    global _default_cache
+    if not cache or os.environ.get('DATA_CACHE', '1') == '0':
+        return read_csv(path) if columns is None else read_csv(path)[columns]
+    if _default_cache is None:
+        _default_cache = DatasetCache()
+    return _default_cache.load(path, columns)
+
+
+if __name__ == '__main__':
+    # python data_loader.py [file.csv ...]  builds (or refreshes) the cache ahead of time
+    sources = sys.argv[1:] or [name for name in SCHEMAS if os.path.exists(name)]
+    for source in sources:
+        df = load_dataset(source)
+        print(f"{source}: {len(df)} rows, {df.memory_usage(deep=True).sum() / 1e6:.2f} MB in memory")
@@ -0,0 +1,298 @@
+"""Online drift monitoring of the features arriving at the prediction routes.
+
+The baseline is the training distribution of each numeric feature, overall
+and per crop: count, mean, standard deviation and the share of rows in each
+of DRIFT_BINS bins, whose edges are the overall training quantiles (deciles by
+default). model_comparison.py stores it in the registry metadata
+("drift_baseline"). For a model outside the registry it is computed from
+TRAINING_DATA once per process.
+
+DriftMonitor keeps the same statistics for the traffic a worker sees, in
+fixed-size arrays: a Welford running mean and variance and a histogram on the
+baseline's edges, per feature, for all rows and for each crop. A prediction
+updates them in O(features). The histograms are exported as counters and
+summed across workers; a report compares the summed histograms with the
+baseline by the population stability index,
+
+    PSI = sum over bins of (observed - expected) * ln(observed / expected)
+
+with the usual reading: below DRIFT_PSI_WARN (0.1) stable, above
+DRIFT_PSI_ALERT (0.25) a significant shift.
+"""
+import bisect
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import NUM_FEATURES
+from validation import TRAINING_DATA
+
+
+logger = logging.getLogger('agripredict.model')
+
+# Set to 0 to stop tracking incoming features
+DRIFT_MONITOR = os.environ.get('DRIFT_MONITOR', '1') != '0'
+# Histogram bins per feature (training quantiles)
+DRIFT_BINS = int(os.environ.get('DRIFT_BINS', 10))
+# Rows a group needs before its PSI is reported
+DRIFT_MIN_COUNT = int(os.environ.get('DRIFT_MIN_COUNT', 100))
+DRIFT_PSI_WARN = float(os.environ.get('DRIFT_PSI_WARN', 0.1))
+DRIFT_PSI_ALERT = float(os.environ.get('DRIFT_PSI_ALERT', 0.25))
+
+# Name of the exported bin counters, summed across workers for the PSI
+DRIFT_BIN_METRIC = 'agripredict_drift_bin_total'
+# crop_type label of the all-rows group
+GROUP_ALL = 'all'
+
+# Floor for bin shares in the PSI, so an empty bin does not make it infinite
+PSI_EPSILON = 1e-4
+
+
+def _feature_stats(values, edges):
+    values = values[np.isfinite(values)]
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return {
+        "count": int(len(values)),
+        "mean": round(float(values.mean()), 6) if len(values) else None,
+        "std": round(float(values.std()), 6) if len(values) else None,
+        "proportions": (counts / max(len(values), 1)).round(6).tolist(),
+    }
+
+
+def training_baseline(frame, bins=DRIFT_BINS):
+    """Baseline statistics of the training features, for the registry metadata."""
+    edges = {}
+    for f in NUM_FEATURES:
+        values = frame[f].to_numpy(dtype=np.float64)
+        values = values[np.isfinite(values)]
+        # Repeated quantiles (features with few distinct values) collapse into one edge
+        edges[f] = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]).round(6)).tolist()
+    crops = frame['Crop_Type'].astype(str)
+    return {
+        "bins": bins,
+        "rows": int(len(frame)),
+        "edges": edges,
+        "overall": {f: _feature_stats(frame[f].to_numpy(dtype=np.float64), edges[f]) for f in NUM_FEATURES},
+        "per_crop": {
+            crop: {f: _feature_stats(group[f].to_numpy(dtype=np.float64), edges[f]) for f in NUM_FEATURES}
+            for crop, group in frame.groupby(crops, observed=True)
+        },
+    }
+
+
+@functools.lru_cache(maxsize=4)
+def dataset_baseline(path=TRAINING_DATA):
+    """Baseline of the training CSV, computed once per process; None when it is not available."""
+    from data_loader import load_dataset
+
+    try:
+        return training_baseline(load_dataset(path, columns=NUM_FEATURES + ['Crop_Type']))
+    except (OSError, ValueError, KeyError) as e:
+        logger.info("Drift baseline unavailable: %s", e)
+        return None
+
+
+def load_baseline(metadata):
+    return (metadata or {}).get('drift_baseline') or dataset_baseline()
+
+
+def psi(observed, expected):
+    observed = np.maximum(np.asarray(observed, dtype=np.float64), PSI_EPSILON)
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((observed - expected) * np.log(observed / expected)))
+
+
+def drift_status(value):
+    if value is None:
+        return 'insufficient_data'
+    if value >= DRIFT_PSI_ALERT:
+        return 'drift'
+    if value >= DRIFT_PSI_WARN:
+        return 'warning'
+    return 'stable'
+
+
+def baseline_id(baseline):
+    """Short content hash naming a baseline in the exported bin counts."""
+    return hashlib.sha256(json.dumps(baseline, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class DriftMonitor:
+    """Per-feature statistics of incoming rows, overall and per crop, against a training baseline.
+
+    Group 0 is all rows, group i the i-th crop of the baseline. Rows of crops
+    the baseline does not have only count towards group 0.
+
+    The bin counts are kept per baseline and never reset. bin_totals() hands
+    them to the metrics registry, which sums them across workers, and the PSI
+    is computed from those sums (report and max_psi take them as `totals`), so
+    every worker reports the same drift for all traffic. The Welford mean and
+    standard deviation are this worker's own and start again on every bind.
+    """
+
+    def __init__(self, baseline=None, min_count=DRIFT_MIN_COUNT):
+        self.min_count = min_count
+        self.lock = threading.Lock()
+        self.baseline = None
+        # baseline id -> (group labels, cumulative [group][feature][bin] counts)
+        self._hists = {}
+        self.bind(baseline)
+
+    def bind(self, baseline):
+        """Track against a (new) baseline; the running mean and variance start again when it changes."""
+        with self.lock:
+            if baseline is self.baseline or (baseline is not None and baseline == self.baseline):
+                return
+            self.baseline = baseline
+            self.baseline_id = baseline_id(baseline) if baseline else None
+            self.crops = list(baseline['per_crop']) if baseline else []
+            self.crop_index = {c: i + 1 for i, c in enumerate(self.crops)}
+            self.edges = [list(baseline['edges'][f]) for f in NUM_FEATURES] if baseline else [[] for _ in NUM_FEATURES]
+            self.n_bins = max(len(e) for e in self.edges) + 1
+            # Plain lists, not arrays: a single-row update touches 8 values per group, where
+            # NumPy's per-call overhead would cost more than the arithmetic
+            groups, features = len(self.crops) + 1, len(NUM_FEATURES)
+            self.count = [0] * groups
+            self.mean = [[0.0] * features for _ in range(groups)]
+            self.m2 = [[0.0] * features for _ in range(groups)]
+            if baseline:
+                # Counts keep growing if this baseline comes back, so the exported counters stay monotonic
+                self.hist = self._hists.setdefault(self.baseline_id, (
+                    [GROUP_ALL] + self.crops,
+                    [[[0] * self.n_bins for _ in range(features)] for _ in range(groups)],
+                ))[1]
+            self._features = np.arange(features)
+
+    def observe(self, row):
+        """Add one validated feature dict (Crop_Type optional)."""
+        if self.baseline is None:
+            return
+        x = [float(row[f]) for f in NUM_FEATURES]
+        with self.lock:
+            # Under the lock, so a concurrent bind() cannot swap the edges in between
+            bins = [bisect.bisect_right(e, v) for e, v in zip(self.edges, x)]
+            groups = (0, self.crop_index[row['Crop_Type']]) if row.get('Crop_Type') in self.crop_index else (0,)
+            for g in groups:
+                self.count[g] += 1
+                n, mean, m2, hist = self.count[g], self.mean[g], self.m2[g], self.hist[g]
+                for i, v in enumerate(x):
+                    # Welford: the mean moves by delta / n, M2 by delta times the distance to the new mean
+                    delta = v - mean[i]
+                    mean[i] += delta / n
+                    m2[i] += delta * (v - mean[i])
+                    hist[i][bins[i]] += 1
+
+    def observe_batch(self, numeric, crops=None):
+        """Add an (n, 8) block of validated rows, merging each group's batch statistics in one step."""
+        numeric = np.asarray(numeric, dtype=np.float64)
+        if self.baseline is None or not len(numeric):
+            return
+        with self.lock:
+            bins = np.column_stack([np.searchsorted(e, numeric[:, i], side='right') for i, e in enumerate(self.edges)])
+            codes = np.zeros(len(numeric), dtype=np.intp)
+            if crops is not None:
+                codes = pd.Series(crops, dtype=object).map(self.crop_index).fillna(0).to_numpy(dtype=np.intp)
+            self._merge(0, numeric, bins)
+            for g in np.unique(codes[codes > 0]).tolist():
+                mine = codes == g
+                self._merge(g, numeric[mine], bins[mine])
+
+    def _merge(self, g, x, bins):
+        # Chan et al.'s pairwise update: combine the group's (n, mean, M2) with the batch's
+        n_a, n_b = self.count[g], len(x)
+        mean_a, m2_a = np.array(self.mean[g]), np.array(self.m2[g])
+        mean_b = x.mean(axis=0)
+        m2_b = ((x - mean_b) ** 2).sum(axis=0)
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        self.mean[g] = (mean_a + delta * (n_b / n)).tolist()
+        self.m2[g] = (m2_a + m2_b + delta ** 2 * (n_a * n_b / n)).tolist()
+        self.count[g] = n
+        # (features, n_bins) counts of the batch's bin indices
+        flat = self._features[None, :] * self.n_bins + bins
+        counts = np.bincount(flat.ravel(), minlength=len(NUM_FEATURES) * self.n_bins).reshape(len(NUM_FEATURES), -1)
+        for row, added in zip(self.hist[g], counts.tolist()):
+            for b, k in enumerate(added):
+                row[b] += k
+
+    def bin_totals(self):
+        """{(baseline, crop_type, feature, bin): rows} of every baseline this worker has used, for the metrics collector."""
+        with self.lock:
+            return {
+                (bid, label, f, str(b)): k
+                for bid, (labels, hist) in self._hists.items()
+                for label, group in zip(labels, hist)
+                for f, row in zip(NUM_FEATURES, group)
+                for b, k in enumerate(row) if k
+            }
+
+    def _counts(self, totals):
+        """[group][feature][bin] counts of the current baseline from (summed) bin totals."""
+        counts = np.zeros((len(self.crops) + 1, len(NUM_FEATURES), self.n_bins), dtype=np.int64)
+        groups = {label: g for g, label in enumerate([GROUP_ALL] + self.crops)}
+        features = {f: i for i, f in enumerate(NUM_FEATURES)}
+        for (bid, label, f, b), k in totals.items():
+            if bid == self.baseline_id and label in groups and f in features and int(b) < self.n_bins:
+                counts[groups[label], features[f], int(b)] += int(k)
+        return counts
+
+    def _group_report(self, g, expected, counts):
+        # Every row counts once in each feature's histogram, so any feature gives the group's row count
+        n = int(counts[0].sum())
+        worker_n = self.count[g]
+        features = {}
+        for i, f in enumerate(NUM_FEATURES):
+            base = expected.get(f) or {}
+            value = None
+            if n >= self.min_count and base.get('proportions'):
+                value = round(psi(counts[i, :len(base['proportions'])] / n, base['proportions']), 4)
+            features[f] = {
+                "psi": value,
+                "status": drift_status(value),
+                "baseline_mean": base.get('mean'),
+                "baseline_std": base.get('std'),
+                "worker_mean": round(self.mean[g][i], 4) if worker_n else None,
+                "worker_std": round(math.sqrt(max(self.m2[g][i], 0.0) / worker_n), 4) if worker_n else None,
+            }
+        scores = [v["psi"] for v in features.values() if v["psi"] is not None]
+        worst = max(scores) if scores else None
+        return {"count": n, "worker_count": worker_n, "max_psi": worst, "status": drift_status(worst),
+                "features": features}
+
+    def report(self, crop_type=None, totals=None):
+        """PSI per feature, overall and per crop (or for one crop), from `totals` (default: this worker's)."""
+        if self.baseline is None:
+            return {"enabled": False, "pid": os.getpid()}
+        if totals is None:
+            totals = self.bin_totals()
+        with self.lock:
+            counts = self._counts(totals)
+            return {
+                "enabled": True,
+                "pid": os.getpid(),
+                "baseline": self.baseline_id,
+                "baseline_rows": self.baseline.get('rows'),
+                "min_count": self.min_count,
+                "edges": dict(zip(NUM_FEATURES, self.edges)),
+                "overall": self._group_report(0, self.baseline['overall'], counts[0]),
+                "per_crop": {
+                    crop: self._group_report(i + 1, self.baseline['per_crop'][crop], counts[i + 1])
+                    for i, crop in enumerate(self.crops) if crop_type is None or crop == crop_type
+                },
+            }
+
+    def max_psi(self, totals=None):
+        """Largest overall PSI across features, or 0 while there are too few rows."""
+        if self.baseline is None:
+            return 0.0
+        if totals is None:
+            totals = self.bin_totals()
+        with self.lock:
+            return self._group_report(0, self.baseline['overall'], self._counts(totals)[0])["max_psi"] or 0.0
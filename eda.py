@@ -1,13 +1,14 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from data_loader import load_dataset
 
-df = pd.read_csv('projectdata_cleaned.csv')
+numeric_features = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'yield']
 
-print(df.describe())
+df = load_dataset('projectdata_cleaned.csv', columns=numeric_features + ['crop_std'])
 
+print(df.describe())
 
-numeric_features = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'yield']
 
 for feature in numeric_features:
     plt.figure(figsize=(6,3))
@@ -0,0 +1,145 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+
+logger = logging.getLogger('agripredict.inference')
+
+
+class CompiledPipeline:
+    """Single-row inference for the saved Pipeline(preprocess -> reg) without pandas.
+
+    The StandardScaler statistics and the OneHotEncoder category positions are
+    read out of the fitted ColumnTransformer once, so scoring a row is a few
+    NumPy operations on a preallocated buffer followed by regressor.predict.
+    The arithmetic mirrors StandardScaler.transform exactly, so results are
+    identical to pipeline.predict.
+    """
+
+    def __init__(self, pipeline):
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            raise ValueError("Expected a two-step Pipeline(preprocess, regressor)")
+        ct, self.regressor = pipeline.steps[0][1], pipeline.steps[1][1]
+        if not isinstance(ct, ColumnTransformer):
+            raise ValueError("First pipeline step must be a ColumnTransformer")
+
+        scaler = encoder = None
+        for name, transformer, columns in ct.transformers_:
+            if name == 'remainder':
+                if transformer != 'drop' and len(columns):
+                    raise ValueError("Remainder columns are not supported")
+                continue
+            if isinstance(transformer, StandardScaler) and scaler is None and encoder is None:
+                scaler, self.num_features = transformer, list(columns)
+            elif isinstance(transformer, OneHotEncoder) and encoder is None and len(columns) == 1:
+                encoder, self.cat_feature = transformer, columns[0]
+            else:
+                raise ValueError(f"Unsupported transformer '{name}'")
+        if scaler is None or encoder is None:
+            raise ValueError("Expected a StandardScaler followed by a single-column OneHotEncoder")
+        if encoder.drop is not None or getattr(encoder, '_infrequent_enabled', False):
+            raise ValueError("OneHotEncoder with drop/infrequent categories is not supported")
+
+        n_num = len(self.num_features)
+        self.mean = scaler.mean_ if scaler.with_mean else None
+        self.scale = scaler.scale_ if scaler.with_std else None
+        categories = list(encoder.categories_[0])
+        self.categories = categories
+        # Crop_Type -> column of its one-hot flag in the design matrix; unknown crops stay all zeros
+        self.category_index = {c: n_num + i for i, c in enumerate(categories)}
+        self.n_num = n_num
+        self.n_columns = n_num + len(categories)
+        self._local = threading.local()
+
+    def _buffer(self):
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, self.n_columns), dtype=np.float64)
+        return row
+
+    def transform_row(self, values):
+        """Fill the per-thread buffer from a feature dict and return it."""
+        row = self._buffer()
+        num = row[0, :self.n_num]
+        for i, name in enumerate(self.num_features):
+            num[i] = values[name]
+        if self.mean is not None:
+            num -= self.mean
+        if self.scale is not None:
+            num /= self.scale
+        row[0, self.n_num:] = 0.0
+        index = self.category_index.get(values[self.cat_feature])
+        if index is not None:
+            row[0, index] = 1.0
+        return row
+
+    def crop_block(self, values):
+        """Design matrix with one row per known category, all sharing the numeric features in `values`.
+
+        The one-hot part is built once per thread and reused; only the scaled
+        numeric columns are rewritten for each call.
+        """
+        block = getattr(self._local, 'block', None)
+        if block is None:
+            block = self._local.block = np.zeros((len(self.categories), self.n_columns), dtype=np.float64)
+            block[:, self.n_num:] = np.eye(len(self.categories))
+        num = np.array([float(values[name]) for name in self.num_features], dtype=np.float64)
+        if self.mean is not None:
+            num -= self.mean
+        if self.scale is not None:
+            num /= self.scale
+        block[:, :self.n_num] = num
+        return block
+
+    def transform_arrays(self, numeric, crops):
+        """Vectorized transform: numeric is (n, n_num), crops a sequence of n category labels."""
+        numeric = np.asarray(numeric, dtype=np.float64)
+        X = np.zeros((len(numeric), self.n_columns), dtype=np.float64)
+        num = X[:, :self.n_num]
+        num[:] = numeric
+        if self.mean is not None:
+            num -= self.mean
+        if self.scale is not None:
+            num /= self.scale
+        cols = np.fromiter((self.category_index.get(c, -1) for c in crops), dtype=np.intp, count=len(X))
+        known = cols >= 0
+        X[np.flatnonzero(known), cols[known]] = 1.0
+        return X
+
+    def predict_row(self, values):
+        return self.regressor.predict(self.transform_row(values))[0]
+
+    def predict_arrays(self, numeric, crops):
+        return self.regressor.predict(self.transform_arrays(numeric, crops))
+
+    def predict_all_crops(self, values):
+        """Predicted yield of every known category (in self.categories order) for one set of features."""
+        return self.regressor.predict(self.crop_block(values))
+
+    def predict(self, frame):
+        """pipeline.predict for a DataFrame with the feature columns."""
+        return self.predict_arrays(frame[self.num_features].to_numpy(), frame[self.cat_feature].tolist())
+
+
+def compile_pipeline(pipeline, sample=None):
+    """Build a CompiledPipeline and check it against pipeline.predict; returns None if unsupported."""
+    try:
+        compiled = CompiledPipeline(pipeline)
+    except (ValueError, AttributeError) as e:
+        logger.warning("Fast inference disabled: %s", e)
+        return None
+
+    if sample is None:
+        centre = compiled.mean if compiled.mean is not None else np.zeros(compiled.n_num)
+        sample = dict(zip(compiled.num_features, centre.tolist()))
+        sample[compiled.cat_feature] = compiled.categories[0]
+    expected = pipeline.predict(pd.DataFrame([sample]))[0]
+    if compiled.predict_row(sample) != expected:
+        logger.warning("Fast inference disabled: result differs from pipeline.predict")
+        return None
+    return compiled
@@ -1,533 +1,203 @@
-from flask import Flask, request, render_template_string, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import pandas as pd
-import joblib
+import csv
+import hmac
+import io
 import json
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import numpy as np
+from logging_setup import configure_logging
+from metrics import registry as metrics_registry, STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, PREDICTIONS, ERRORS
+from history_store import HISTORY_FIELDS, get_history_store
+from history_writer import HISTORY_ASYNC, BackgroundHistoryWriter
+from history_cache import HistoryCache
+from model_loader import ModelLoader
+from prediction_cache import PredictionCache
+from static_assets import StaticAssets
+from batch_predict import (NUM_FEATURES, BatchError, clip_yields, read_batch, predict_batch,
+                           predict_batch_intervals)
+from prediction_intervals import QUANTILE_NAMES
+from scenario import ScenarioError, parse_scenario, sweep
+from validation import ValidationError
+from drift_monitor import DRIFT_BIN_METRIC, DRIFT_MONITOR, DriftMonitor, load_baseline
 
 
-app = Flask(__name__)
+# Static files are served by the /static route below, from memory and precompressed
+app = Flask(__name__, static_folder=None)
+logger = configure_logging()
 
+static_assets = StaticAssets(os.path.join(app.root_path, 'static'))
+app.jinja_env.globals['asset_url'] = static_assets.url
 
-# Load the pretrained pipeline (including preprocessing)
-model = joblib.load('crop_yield_best_model2.pkl')
+# Parse and compile the page template once per process instead of on every request
+page_template = app.jinja_env.get_template('index.html')
 
 
-HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_predictions_history.json')
+# Repeated feature vectors are answered from an LRU/TTL cache tied to the model file's hash
+prediction_cache = PredictionCache()
 
+# Incoming features against the serving model's training distribution; PSI uses the bin counts of all workers
+drift_monitor = DriftMonitor() if DRIFT_MONITOR else None
 
-def load_history():
+# The pretrained pipeline (including preprocessing) is loaded according to MODEL_LOAD_MODE / MODEL_MMAP
+model_loader = ModelLoader()
+model_loader.on_load(lambda loaded: prediction_cache.bind(loaded.sha256))
+if drift_monitor is not None:
+    model_loader.on_load(lambda loaded: drift_monitor.bind(load_baseline(loaded.metadata)))
+model_loader.start()
+
+
+# Prediction history lives in an append-only store (SQLite by default, see history_store.py)
+history_store = get_history_store()
+# Predictions queue their history record and return; a background thread writes them in batches
+history_writer = BackgroundHistoryWriter(history_store) if HISTORY_ASYNC else None
+# Per-crop, per-day aggregates of the history, synced incrementally for /api/history/summary
+history_cache = HistoryCache(history_store)
+# Crop names are summarised under the serving model's spelling
+model_loader.on_load(lambda loaded: history_cache.bind(loaded.validator.canonical))
+
+metrics_registry.gauge('agripredict_history_records', 'Records in the prediction history store', history_cache.count)
+if drift_monitor is not None:
+    metrics_registry.gauge('agripredict_drift_max_psi', 'Largest PSI of any feature against the training baseline, all workers',
+                           lambda: drift_monitor.max_psi(metrics_registry.samples(DRIFT_BIN_METRIC)))
+    metrics_registry.add_collector(lambda: {
+        (DRIFT_BIN_METRIC, "Incoming feature values per bin of a model's training baseline",
+         ('baseline', 'crop_type', 'feature', 'bin')): drift_monitor.bin_totals(),
+    })
+metrics_registry.add_collector(lambda: {
+    ('agripredict_cache_hits_total', 'Prediction cache hits'): prediction_cache.hits,
+    ('agripredict_cache_misses_total', 'Prediction cache misses'): prediction_cache.misses,
+})
+if history_writer is not None:
+    metrics_registry.gauge('agripredict_history_queue_depth', 'History records waiting to be written in this worker',
+                           lambda: history_writer.stats()['queue_depth'])
+    metrics_registry.add_collector(lambda: {
+        ('agripredict_history_written_total', 'History records written by the background writer'): history_writer.written,
+        ('agripredict_history_dropped_total', 'History records dropped because the write queue was full'): history_writer.dropped,
+        ('agripredict_history_write_failures_total', 'History records lost to write errors'): history_writer.failed,
+    })
+
+
+def load_history(limit=None, **filters):
     try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r') as f:
-                content = f.read()
-                if content.strip():  # Check if file is not empty
-                    try:
-                        return json.loads(content)
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}. Creating backup and starting fresh.")
-                        # Backup corrupted file
-                        backup_file = HISTORY_FILE + '.backup'
-                        with open(backup_file, 'w') as backup:
-                            backup.write(content)
-                        print(f"Corrupted file backed up to: {backup_file}")
-                        # Return empty list and file will be recreated on next save
-                        return []
-        return []
-    except Exception as e:
-        print(f"Error loading history: {e}")
+        return history_store.load(limit=limit, **filters)
+    except Exception:
+        logger.exception("Error loading history")
         return []
 
 
-def save_history(history):
+def save_history(record):
+    if history_writer is not None:
+        history_writer.submit(record)
+        return
     try:
-        # Write to a temporary file first
-        temp_file = HISTORY_FILE + '.tmp'
-        with open(temp_file, 'w') as f:
-            json.dump(history, f, indent=2)
-        
-        # On Windows, need to delete the original file first before renaming
-        if os.path.exists(HISTORY_FILE):
-            os.remove(HISTORY_FILE)
-        
-        os.rename(temp_file, HISTORY_FILE)
-        
-        print(f"Successfully saved {len(history)} records to history")
-        print(f"History file location: {HISTORY_FILE}")
-    except Exception as e:
-        print(f"Error saving history: {e}")
-        import traceback
-        traceback.print_exc()
-        # If atomic save fails, try direct write as fallback
-        try:
-            print("Attempting direct write as fallback...")
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(history, f, indent=2)
-            print("Direct write successful")
-        except Exception as e2:
-            print(f"Direct write also failed: {e2}")
-
-
-form_template = '''
-<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1.0">
-  <title>AgriPredict - AI-Powered Crop Yield Forecasting</title>
-  <style>
-    * { margin: 0; padding: 0; box-sizing: border-box; }
-    body {
-      font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', sans-serif;
-      background: linear-gradient(135deg, #fad0c4 0%, #ffd1ff 100%);
-      min-height: 100vh;
-      color: #3b223a;
-      padding: 20px;
-    }
-    .header-bar {
-      background: rgba(255, 200, 220, 0.39);
-      backdrop-filter: blur(16px);
-      border: 1px solid rgba(255, 170, 210, 0.17);
-      border-radius: 16px;
-      padding: 20px 30px;
-      margin-bottom: 30px;
-      display: flex;
-      justify-content: space-between;
-      align-items: center;
-      box-shadow: 0 4px 24px 0 rgba(220, 105, 180, 0.12);
-    }
-    .logo-section { display: flex; align-items: center; gap: 15px; }
-    .logo-icon {
-      width: 50px; height: 50px;
-      background: linear-gradient(135deg, #fbbedc 0%, #fad0c4 100%);
-      border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 24px;
-      box-shadow: 0 4px 12px 0 rgba(255,182,213,0.19);
-    }
-    .logo-text h1 { font-size: 28px; font-weight: 700; color: #db2072; margin-bottom: 2px; }
-    .logo-text p { font-size: 13px; color: #9e4784; font-weight: 400; }
-    .nav-buttons { display: flex; gap: 10px; }
-    .nav-btn {
-      background: rgba(255, 190, 220, 0.39);
-      border: 1px solid rgba(255, 95, 187, 0.11);
-      color: #c84b7d;
-      padding: 12px 24px; border-radius: 10px; cursor: pointer;
-      font-size: 14px; font-weight: 500;
-      transition: all 0.3s ease;
-      display: flex; align-items: center; gap: 8px;
-      box-shadow: 0 2px 12px rgba(255, 180, 230, 0.11);
-    }
-    .nav-btn:hover, .nav-btn.active {
-      background: linear-gradient(135deg, #fbbedc 20%, #ffd6e0 100%);
-      border-color: #f39fc3;
-      color: #b51c67;
-      box-shadow: 0 4px 14px rgba(255, 145, 207, 0.14);
-    }
-    .section-container { position: relative; min-height: 500px; }
-    .main-container {
-      max-width: 1400px; margin: 0 auto;
-      display: grid; grid-template-columns: 1fr 1fr; gap: 24px;
-      transition: opacity 0.4s, transform 0.4s;
-    }
-    .main-container.slide-in {
-      opacity: 1;
-      transform: translateX(0);
-      pointer-events: auto;
-      z-index: 2;
-      position: relative;
-    }
-    .main-container.slide-out {
-      opacity: 0;
-      transform: translateX(-100%);
-      pointer-events: none;
-      z-index: 1;
-      position: absolute;
-      width: 100%;
-      top: 0;
-      left: 0;
-    }
-    .card {
-      background: rgba(255, 235, 245, 0.39);
-      backdrop-filter: blur(22px);
-      border: 1px solid rgba(255, 124, 188, 0.11);
-      border-radius: 20px;
-      padding: 28px;
-      box-shadow: 0 4px 24px rgba(255, 128, 187, 0.11);
-    }
-    .card-header { display: flex; align-items: center; gap: 15px; margin-bottom: 28px; }
-    .card-icon {
-      width: 48px; height: 48px;
-      background: linear-gradient(135deg, #eaafc8 0%, #fde1ff 100%);
-      border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 24px;
-      box-shadow: 0 4px 10px rgba(255, 145, 207, 0.15);
-    }
-    .card-title h2 { font-size: 22px; font-weight: 600; color: #b51c67; margin-bottom: 4px; }
-    .card-title p { font-size: 13px; color: #9e4784; }
-    .form-group { margin-bottom: 20px; }
-    .form-group label { display: block; margin-bottom: 8px; font-size: 14px; font-weight: 500; color: #bb3e7a; }
-    .form-group input, .form-group select {
-      width: 100%; padding: 12px 16px;
-      background: rgba(255, 200, 220, 0.14);
-      border: 1px solid rgba(255, 95, 187, 0.13); border-radius: 12px;
-      color: #3d1150; font-size: 14px; transition: all 0.3s ease;
-    }
-    .form-group input:focus, .form-group select:focus {
-      outline: none; border-color: #ea7ea0;
-      box-shadow: 0 0 0 3px rgba(255, 190, 220, 0.08);
-    }
-    .form-group input::placeholder { color: #c07ea9; }
-    .grid-3 { display: grid; grid-template-columns: repeat(3, 1fr); gap: 16px; margin-bottom: 20px; }
-    .submit-btn {
-      width: 100%;
-      background: linear-gradient(135deg, #fcadc2 0%, #fea9de 100%);
-      border: none; color: #fff;
-      padding: 14px 24px; border-radius: 10px; cursor: pointer;
-      font-size: 15px; font-weight: 600;
-      display: flex; align-items: center; justify-content: center; gap: 10px;
-      transition: all 0.3s ease;
-      box-shadow: 0 4px 12px rgba(250, 167, 223, 0.09);
-      margin-top: 24px;
-    }
-    .submit-btn:hover {
-      background: linear-gradient(135deg, #ffcee4 0%, #eaafc8 100%);
-      transform: translateY(-2px);
-    }
-    .result-box {
-      background: linear-gradient(135deg, rgba(251, 190, 220, 0.15) 0%, rgba(255, 209, 255, 0.12) 100%);
-      border: 1px solid rgba(255,190,220,0.16);
-      border-radius: 16px;
-      padding: 32px; text-align: center;
-    }
-    .result-label { font-size: 14px; color: #b989bb; margin-bottom: 12px; font-weight: 500; text-transform: uppercase; letter-spacing: 0.5px; }
-    .result-value { font-size: 56px; font-weight: 700; color: #fb5693; margin-bottom: 8px; text-shadow: 0 0 20px rgba(251, 86, 147, 0.11); }
-    .result-unit { font-size: 18px; color: #c07ea9; font-weight: 500; }
-    .quality-section {
-      background: rgba(255, 190, 220, 0.21);
-      border-radius: 14px; padding: 24px; margin-top: 24px;
-      box-shadow: 0 2px 8px #f4d3ec2a; border: 1px solid #ffd6e03a;
-    }
-    .quality-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 16px; }
-    .quality-label { font-size: 13px; color: #c07ea9; text-transform: uppercase; letter-spacing: 0.5px; font-weight: 500; }
-    .quality-status { display: flex; align-items: center; gap: 12px; }
-    .quality-text { font-size: 20px; font-weight: 600; color: #ea7ea0; }
-    .quality-percentage { font-size: 28px; font-weight: 700; color: #db2072; }
-    .progress-bar { width: 100%; height: 8px; background: rgba(255, 167, 223, 0.17); border-radius: 4px; overflow: hidden; position: relative; }
-    .progress-fill { height: 100%; background: linear-gradient(90deg, #ea7ea0 0%, #f3a3bb 100%); border-radius: 4px; width: 0; transition: width 1.5s cubic-bezier(0.4, 0, 0.2, 1); }
-    .recommendations { margin-top: 24px; }
-    .rec-header { display: flex; align-items: center; gap: 10px; margin-bottom: 16px; font-size: 14px; color: #c874aa; font-weight: 500; }
-    .rec-item { background: rgba(253, 136, 203, 0.07); border: 1px solid rgba(250, 167, 223, 0.11); border-radius: 10px; padding: 14px 16px; display: flex; align-items: center; gap: 12px; color: #b5457c; font-size: 14px; line-height: 1.5; }
-    .rec-icon { color: #ea7ea0; font-size: 18px; }
-    .empty-state { text-align: center; padding: 60px 20px; }
-    .empty-state-icon { font-size: 64px; margin-bottom: 16px; opacity: 0.20; }
-    .empty-state p { color: #c07ea9; font-size: 15px; }
-    .error-box { background: rgba(255, 99, 132, 0.13); border: 1px solid rgba(234,126,160,0.22); border-radius: 14px; color: #e7588f; font-size: 14px; text-align: center; padding: 16px; }
-    /* History styles: update inner table colors to match */
-    #history-content table th, #history-content table td { color: #b5457c !important; }
-    #history-content table th { background: rgba(237, 113, 183, 0.06) !important; }
-    #history-content table tr { background: rgba(255,255,255,0.02) !important; }
-    @media (max-width: 1024px) { .main-container { grid-template-columns: 1fr; } }
-  </style>
-</head>
-<body>
-  <div class="header-bar">
-    <div class="logo-section">
-      <div class="logo-icon">🌸</div>
-      <div class="logo-text">
-        <h1>AgriPredict</h1>
-        <p>AI-Powered Crop Yield Forecasting</p>
-      </div>
-    </div>
-    <div class="nav-buttons">
-      <button class="nav-btn active" onclick="showTab('predict')">📈 Predict Yield</button>
-      <button class="nav-btn" onclick="showTab('history')">🕐 History</button>
-    </div>
-  </div>
-
-  <div class="section-container">
-    <div id="predict-section" class="main-container slide-in">
-      <div class="card">
-        <div class="card-header">
-          <div class="card-icon">🌸</div>
-          <div class="card-title">
-            <h2>Soil Analysis</h2>
-            <p>Enter your field's NPK values</p>
-          </div>
-        </div>
-        <form method="POST">
-          <div class="form-group">
-            <label for="Soil_pH">Soil pH</label>
-            <input id="Soil_pH" name="Soil_pH" type="number" step="any" placeholder="6.5" value="{{ request.form.get('Soil_pH', '') }}" required />
-          </div>
-          <div class="form-group">
-            <label for="Temperature">Temperature (°C)</label>
-            <input id="Temperature" name="Temperature" type="number" step="any" placeholder="15.2" value="{{ request.form.get('Temperature', '') }}" required />
-          </div>
-          <div class="form-group">
-            <label for="Humidity">Humidity (%)</label>
-            <input id="Humidity" name="Humidity" type="number" step="any" placeholder="80" value="{{ request.form.get('Humidity', '') }}" required />
-          </div>
-          <div class="form-group">
-            <label for="Wind_Speed">Wind Speed (km/h)</label>
-            <input id="Wind_Speed" name="Wind_Speed" type="number" step="any" placeholder="6.7" value="{{ request.form.get('Wind_Speed', '') }}" required />
-          </div>
-          <div class="grid-3">
-            <div class="form-group">
-              <label for="N">Nitrogen (N)</label>
-              <input id="N" name="N" type="number" step="any" placeholder="63" value="{{ request.form.get('N', '') }}" required />
-            </div>
-            <div class="form-group">
-              <label for="P">Phosphorus (P)</label>
-              <input id="P" name="P" type="number" step="any" placeholder="60" value="{{ request.form.get('P', '') }}" required />
-            </div>
-            <div class="form-group">
-              <label for="K">Potassium (K)</label>
-              <input id="K" name="K" type="number" step="any" placeholder="55" value="{{ request.form.get('K', '') }}" required />
-            </div>
-          </div>
-          <div class="form-group">
-            <label for="Soil_Quality">Soil Quality</label>
-            <input id="Soil_Quality" name="Soil_Quality" type="number" step="any" placeholder="59.3" value="{{ request.form.get('Soil_Quality', '') }}" required />
-          </div>
-          <div class="form-group">
-            <label for="Crop_Type">Crop Type</label>
-            <input id="Crop_Type" name="Crop_Type" type="text" placeholder="Soybean" value="{{ request.form.get('Crop_Type', '') }}" required autocomplete="off" />
-          </div>
-          <button type="submit" class="submit-btn">
-            <span>📊</span>
-            Predict Yield
-          </button>
-        </form>
-      </div>
-      <div class="card">
-        <div class="card-header">
-          <div class="card-icon">📊</div>
-          <div class="card-title">
-            <h2>Prediction Results</h2>
-            <p>AI-powered yield forecast</p>
-          </div>
-        </div>
-        {% if prediction is not none %}
-        <div class="result-box">
-          <div class="result-label">Predicted Yield</div>
-          <div class="result-value" id="yield-value">0</div>
-          <div class="result-unit">tons/ha</div>
-        </div>
-        <script>
-          setTimeout(() => {
-            const targetYield = {{ prediction }};
-            const yieldElement = document.getElementById('yield-value');
-            let currentYield = 0;
-            const step = targetYield / 50;
-            
-            const animateYield = () => {
-              if (currentYield < targetYield) {
-                currentYield = Math.min(currentYield + step, targetYield);
-                yieldElement.textContent = currentYield.toFixed(2);
-                requestAnimationFrame(animateYield);
-              }
-            };
-            
-            animateYield();
-          }, 300);
-        </script>
-        <div class="quality-section">
-          <div class="quality-header">
-            <span class="quality-label">Soil Quality Assessment</span>
-            <div class="quality-status">
-              <span class="quality-text">{% if soil_quality >= 70 %}Excellent{% elif soil_quality >= 50 %}Good{% else %}Fair{% endif %}</span>
-              <span class="quality-percentage" id="quality-percentage">0%</span>
-            </div>
-          </div>
-          <div class="progress-bar">
-            <div class="progress-fill" id="progress-fill"></div>
-          </div>
-          <script>
-            setTimeout(() => {
-              const targetPercentage = {{ soil_quality }};
-              const progressFill = document.getElementById('progress-fill');
-              const percentageText = document.getElementById('quality-percentage');
-              let currentPercentage = 0;
-              const animate = () => {
-                if (currentPercentage < targetPercentage) {
-                  currentPercentage += 1;
-                  percentageText.textContent = `${currentPercentage}%`;
-                  progressFill.style.width = `${currentPercentage}%`;
-                  requestAnimationFrame(animate);
-                }
-              };
-              animate();
-            }, 300);
-          </script>
-        </div>
-        <div class="recommendations">
-          <div class="rec-header">
-            <span>💡</span>
-            <span>Recommendations</span>
-          </div>
-          <div class="rec-item">
-            <span class="rec-icon">✓</span>
-            <span>{% if soil_quality >= 70 %}Optimal conditions detected. Continue current soil management practices.{% elif soil_quality >= 50 %}Good soil conditions. Consider minor nutrient adjustments for optimal yield.{% else %}Soil quality needs improvement. Consider soil amendments and nutrient supplementation.{% endif %}</span>
-          </div>
-        </div>
-        {% elif error %}
-        <div class="error-box">{{ error }}</div>
-        {% else %}
-        <div class="empty-state">
-          <div class="empty-state-icon">📈</div>
-          <p>Enter soil and crop data to get yield prediction</p>
-        </div>
-        {% endif %}
-      </div>
-    </div>
-    <div id="history-section" class="main-container slide-out">
-      <div class="card" style="grid-column: 1 / -1;">
-        <div class="card-header">
-          <div class="card-icon">🕐</div>
-          <div class="card-title">
-            <h2>Prediction History</h2>
-            <p>Your past predictions</p>
-          </div>
-        </div>
-        <div id="history-content">
-          <div class="empty-state">
-            <div class="empty-state-icon">📋</div>
-            <p>Loading history...</p>
-          </div>
-        </div>
-      </div>
-    </div>
-  </div>
-  <script>
-    function showTab(tab) {
-      const predictSection = document.getElementById('predict-section');
-      const historySection = document.getElementById('history-section');
-      const buttons = document.querySelectorAll('.nav-btn');
-      if (tab === 'predict') {
-        historySection.classList.add('slide-out');
-        historySection.classList.remove('slide-in');
-        predictSection.classList.remove('slide-out');
-        predictSection.classList.add('slide-in');
-        buttons[0].classList.add('active');
-        buttons[1].classList.remove('active');
-      } else {
-        predictSection.classList.add('slide-out');
-        predictSection.classList.remove('slide-in');
-        historySection.classList.remove('slide-out');
-        historySection.classList.add('slide-in');
-        buttons[0].classList.remove('active');
-        buttons[1].classList.add('active');
-        loadHistory();
-      }
-    }
-    async function loadHistory() {
-      try {
-        const response = await fetch('/api/history');
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        
-        // Check if there's an error in the response
-        if (data.error) {
-          throw new Error(data.error);
-        }
-        
-        const history = data;
-        const content = document.getElementById('history-content');
-        
-        console.log('History loaded:', history); // Debug output
-        
-        if (!history || history.length === 0) {
-          content.innerHTML = `
-            <div class="empty-state">
-              <div class="empty-state-icon">📋</div>
-              <p>No predictions yet</p>
-            </div>
-          `;
-          return;
-        }
-        let html = '<div style="overflow-x: auto;"><table style="width: 100%; border-collapse: collapse;">';
-        html += `
-          <thead>
-            <tr style="border-bottom: 1px solid rgba(255,124,188,0.14);">
-              <th style="padding: 12px; text-align: left;">Date</th>
-              <th style="padding: 12px; text-align: left;">Crop</th>
-              <th style="padding: 12px; text-align: left;">N-P-K</th>
-              <th style="padding: 12px; text-align: left;">Soil pH</th>
-              <th style="padding: 12px; text-align: left;">Soil Quality</th>
-              <th style="padding: 12px; text-align: left;">Yield</th>
-            </tr>
-          </thead>
-          <tbody>
-        `;
-        history.forEach((record) => {
-          html += `
-            <tr style="border-bottom: 1px solid rgba(255,124,188,0.12);">
-              <td style="padding: 12px;">${record.date || 'N/A'}</td>
-              <td style="padding: 12px;">${record.Crop_Type || 'N/A'}</td>
-              <td style="padding: 12px;">${record.N || 0}-${record.P || 0}-${record.K || 0}</td>
-              <td style="padding: 12px;">${record.Soil_pH || 'N/A'}</td>
-              <td style="padding: 12px;">${record.Soil_Quality || 'N/A'}</td>
-              <td style="padding: 12px; color: #fb5693; font-weight: 600;">${record.yield || 'N/A'} tons/ha</td>
-            </tr>
-          `;
-        });
-        html += '</tbody></table></div>';
-        content.innerHTML = html;
-      } catch (error) {
-        console.error('Error loading history:', error);
-        const content = document.getElementById('history-content');
-        content.innerHTML = `
-          <div class="empty-state">
-            <div class="empty-state-icon">⚠️</div>
-            <p>Error loading history: ${error.message}</p>
-            <p style="font-size: 12px; margin-top: 8px;">Check browser console for details</p>
-          </div>
-        `;
-      }
-    }
-  </script>
-</body>
-</html>
-'''
+        history_store.append(record)
+    except Exception:
+        logger.exception("Error saving history")
+
+
+@contextmanager
+def stage(name):
+    """Time a block of the current request; the totals go into the request's summary log line."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name, seconds):
+    g.timings[name] = g.timings.get(name, 0.0) + seconds * 1000
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.timings = {}
+    g.log_extra = {}
+    # Pick up a newly activated model version; the reload itself runs in the background
+    model_loader.check_for_update()
+
+
+@app.after_request
+def log_request(response):
+    # One summary line per request, with per-stage timings in milliseconds
+    elapsed = time.perf_counter() - g.request_start
+    duration = elapsed * 1000
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 400 or 'error' in g.log_extra:
+        ERRORS.inc(endpoint=endpoint)
+    logger.info("%s %s %s", request.method, request.path, response.status_code, extra={
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(duration, 2),
+        "stages_ms": {k: round(v, 2) for k, v in g.timings.items()},
+        **g.log_extra
+    })
+    return response
+
+
+def predict_one(current, input_dict):
+    if current.fast is not None:
+        with stage('transform'):
+            row = current.fast.transform_row(input_dict)
+        with stage('model'):
+            return current.fast.regressor.predict(row)[0]
+    with stage('transform'):
+        input_df = pd.DataFrame([input_dict])
+    with stage('model'):
+        return current.pipeline.predict(input_df)[0]
+
+
+def crop_label(crop):
+    # Metric label for a crop: the encoder's spelling for known crops, 'other' for anything else
+    current = model_loader.current
+    return (current.validator.canonical(crop) if current else None) or 'other'
+
 
 @app.route('/', methods=['GET', 'POST'])
 def predict():
     prediction = None
+    interval = None
+    warnings = None
     soil_quality = None
     error = None
     if request.method == 'POST':
         try:
-            input_dict = {
-                'Soil_pH': float(request.form['Soil_pH']),
-                'Temperature': float(request.form['Temperature']),
-                'Humidity': float(request.form['Humidity']),
-                'Wind_Speed': float(request.form['Wind_Speed']),
-                'N': float(request.form['N']),
-                'P': float(request.form['P']),
-                'K': float(request.form['K']),
-                'Soil_Quality': float(request.form['Soil_Quality']),
-                'Crop_Type': request.form['Crop_Type'].strip()
-            }
-            
-            print(f"Input data: {input_dict}")
-            
-            input_df = pd.DataFrame([input_dict])
-            print("Making prediction...")
-            prediction_value = model.predict(input_df)[0]
-            print(f"Raw prediction value: {prediction_value}, type: {type(prediction_value)}")
+            current = model_loader.get()
+            parse_start = time.perf_counter()
+            input_dict, warnings = current.validator.validate_row(request.form)
+            record_stage('parse', time.perf_counter() - parse_start)
+            logger.debug("Input data", extra={"input": input_dict})
+
+            prediction_value = prediction_cache.get_or_compute(
+                input_dict, lambda: predict_one(current, input_dict), current.sha256
+            )
             
             # Ensure prediction is a valid number
             if prediction_value is None or not isinstance(prediction_value, (int, float, np.number)):
                 raise ValueError(f"Invalid prediction value: {prediction_value}")
             
-            prediction = round(float(prediction_value), 2)
+            prediction = round(float(clip_yields(float(prediction_value))), 2)
+            if current.intervals is not None:
+                with stage('interval'):
+                    interval = current.intervals.predict_row(input_dict)
             soil_quality = round(input_dict['Soil_Quality'])
-            
-            print(f"Rounded prediction: {prediction}")
-            
+            g.log_extra.update(crop=input_dict['Crop_Type'], prediction=prediction, model_version=current.version)
+            if warnings:
+                g.log_extra['warnings'] = warnings
+            PREDICTIONS.inc(crop_type=crop_label(input_dict['Crop_Type']))
+            if drift_monitor is not None:
+                drift_monitor.observe(input_dict)
+
             # Save to history - ensure all values are JSON serializable
-            history = load_history()
             record = {
                 'Soil_pH': float(input_dict['Soil_pH']),
                 'Temperature': float(input_dict['Temperature']),
@@ -538,68 +208,388 @@ def predict():
                 'K': float(input_dict['K']),
                 'Soil_Quality': float(input_dict['Soil_Quality']),
                 'Crop_Type': str(input_dict['Crop_Type']),
-                'yield': float(prediction),
-                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                # The model's own output, even where CLIP_NEGATIVE_YIELDS reports it as 0
+                'yield': round(float(prediction_value), 2),
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'model_version': current.version
             }
-            
-            print(f"Record to save: {record}")
-            print(f"Record yield value: {record['yield']}, type: {type(record['yield'])}")
-            
-            history.insert(0, record)
-            
-            print(f"About to save history with {len(history)} records")
-            save_history(history)
-            print("History save completed")
-            
+
+            with stage('history_save'):
+                save_history(record)
+
+        except ValidationError as e:
+            error = f"Invalid input: {e}"
+            g.log_extra['error'] = str(e)
         except Exception as e:
             error = f"Invalid input or error during prediction: {e}"
-            print(f"Error during prediction: {e}")
-            import traceback
-            traceback.print_exc()
-            
-    return render_template_string(form_template, prediction=prediction, soil_quality=soil_quality, error=error)
+            g.log_extra['error'] = str(e)
+            logger.exception("Error during prediction")
+
+    with stage('render'):
+        return page_template.render(request=request, prediction=prediction, interval=interval,
+                                    warnings=warnings, soil_quality=soil_quality, error=error)
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch_api():
+    try:
+        raw = read_batch(request)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with_intervals = request.args.get('intervals', '0').lower() in ('1', 'true', 'yes')
+    try:
+        current = model_loader.get()
+        with stage('validate'):
+            frame, errors, warnings = current.validator.validate_frame(raw)
+        g.log_extra.update(rows=len(raw), failed=len(errors))
+        if with_intervals and current.intervals is None:
+            return jsonify({"error": f"Model {current.version} does not provide prediction intervals"}), 400
+        with stage('model'):
+            if with_intervals:
+                yields, bounds = predict_batch_intervals(current.intervals, frame)
+                bounds = clip_yields(bounds)
+            else:
+                yields = predict_batch(current.predictor, frame)
+            yields = clip_yields(yields)
+    except Exception as e:
+        logger.exception("Error during batch prediction")
+        return jsonify({"error": f"Error during prediction: {e}"}), 500
+
+    for crop, count in frame['Crop_Type'].map(crop_label).value_counts().items():
+        PREDICTIONS.inc(count, crop_type=crop)
+    if drift_monitor is not None:
+        drift_monitor.observe_batch(frame[NUM_FEATURES].to_numpy(dtype=float), frame['Crop_Type'])
+
+    predicted = dict(zip(frame.index.tolist(), np.round(yields, 2).tolist()))
+    if with_intervals:
+        ranges = dict(zip(frame.index.tolist(), np.round(bounds, 2).tolist()))
+    results = []
+    for i in range(len(raw)):
+        if i in errors:
+            results.append({"row": i, "errors": errors[i]})
+            continue
+        result = {"row": i, "yield": predicted[i]}
+        if with_intervals:
+            result.update(zip(QUANTILE_NAMES, ranges[i]))
+        if i in warnings:
+            result["warnings"] = warnings[i]
+        results.append(result)
+
+    return jsonify({
+        "model_version": current.version,
+        "count": len(raw),
+        "predicted": len(frame),
+        "failed": len(errors),
+        "warned": len(warnings),
+        "results": results
+    })
+
+RECOMMEND_DEFAULT_K = 3
+
+
+@app.route('/api/recommend', methods=['POST'])
+def recommend():
+    """Rank every crop the model knows by predicted yield for one field's conditions"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object with the numeric features"}), 400
+    try:
+        k = int(payload.get('k', RECOMMEND_DEFAULT_K))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+    with_intervals = request.args.get('intervals', '0').lower() in ('1', 'true', 'yes')
+    try:
+        current = model_loader.get()
+        try:
+            values, warnings = current.validator.validate_row({f: payload.get(f) for f in NUM_FEATURES},
+                                                              crop_required=False)
+        except ValidationError as e:
+            return jsonify({"errors": e.errors}), 400
+        if with_intervals and current.intervals is None:
+            return jsonify({"error": f"Model {current.version} does not provide prediction intervals"}), 400
+        with stage('model'):
+            if current.fast is not None:
+                crops = current.fast.categories
+                if with_intervals:
+                    yields, bounds = current.intervals.predict(current.fast.crop_block(values), crops)
+                else:
+                    yields = current.fast.predict_all_crops(values)
+            else:
+                crops = current.validator.categories
+                yields = current.pipeline.predict(pd.DataFrame([dict(values, Crop_Type=c) for c in crops]))
+    except Exception as e:
+        logger.exception("Error during recommendation")
+        return jsonify({"error": f"Error during prediction: {e}"}), 500
+
+    k = max(1, min(k, len(crops)))
+    yields = clip_yields(np.asarray(yields, dtype=float))
+    if with_intervals:
+        bounds = clip_yields(bounds)
+    top = np.argsort(-yields, kind='stable')[:k]
+    recommendations = []
+    for rank, i in enumerate(top.tolist(), 1):
+        entry = {"rank": rank, "crop": str(crops[i]), "yield": round(float(yields[i]), 2)}
+        if with_intervals:
+            entry.update(zip(QUANTILE_NAMES, np.round(bounds[i], 2).tolist()))
+        recommendations.append(entry)
+    g.log_extra.update(top_crop=recommendations[0]["crop"])
+    if drift_monitor is not None:
+        drift_monitor.observe(values)
+    return jsonify({
+        "model_version": current.version,
+        "crops_scored": len(crops),
+        "recommendations": recommendations,
+        "warnings": warnings,
+    })
+
+@app.route('/api/scenario', methods=['POST'])
+def scenario():
+    """Yield surface over a grid of one or two swept features around a base row"""
+    try:
+        current = model_loader.get()
+    except Exception as e:
+        logger.exception("Error during scenario sweep")
+        return jsonify({"error": f"Error during prediction: {e}"}), 500
+    try:
+        row, sweeps, warnings = parse_scenario(request.get_json(silent=True), current.validator)
+    except ValidationError as e:
+        return jsonify({"errors": e.errors}), 400
+    except ScenarioError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        with stage('model'):
+            surface = sweep(current, row, sweeps)
+    except Exception as e:
+        logger.exception("Error during scenario sweep")
+        return jsonify({"error": f"Error during prediction: {e}"}), 500
+
+    best = np.unravel_index(int(np.argmax(surface)), surface.shape)
+    g.log_extra.update(cells=int(surface.size))
+    return jsonify({
+        "model_version": current.version,
+        "base": row,
+        "axes": [{"feature": f, "values": np.round(v, 6).tolist()} for f, v in sweeps],
+        "cells": int(surface.size),
+        "yields": np.round(surface, 2).tolist(),
+        "min_yield": round(float(surface.min()), 2),
+        "max_yield": round(float(surface.max()), 2),
+        "best": dict({f: float(v[i]) for (f, v), i in zip(sweeps, best)}, **{"yield": round(float(surface[best]), 2)}),
+        "warnings": warnings,
+    })
+
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = int(os.environ.get('HISTORY_PAGE_MAX', 1000))
+
+
+def parse_history_query(args):
+    """Turn /api/history query parameters into store filters; raises ValueError on bad input."""
+    filters = {}
+    if args.get('crop_type'):
+        filters['crop_type'] = args['crop_type'].strip()
+    for name in ('date_from', 'date_to'):
+        value = args.get(name, '').strip()
+        if value:
+            try:
+                datetime.strptime(value[:10], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"{name} must look like YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+            # A bare day as the upper bound includes the whole day
+            if name == 'date_to' and len(value) == 10:
+                value += ' 23:59:59'
+            filters[name] = value
+    for name in ('min_yield', 'max_yield'):
+        if args.get(name, '').strip():
+            try:
+                filters[name] = float(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number")
+
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in HISTORY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    cursor = args.get('cursor') or None
+    if cursor is not None and not cursor.isdigit():
+        raise ValueError("cursor must be a value returned as next_cursor")
+    return filters, fields, cursor
+
+
+def project(record, fields):
+    if fields is None:
+        return record
+    return {f: record.get(f) for f in fields}
+
+
+def export_history(fmt, filters, fields, limit=None, cursor=None):
+    """Stream matching records as NDJSON or CSV without holding them all in memory, from `cursor` on."""
+    def records():
+        for i, record in enumerate(history_store.iter_records(cursor, **filters)):
+            if limit is not None and i >= limit:
+                break
+            yield project(record, fields)
+
+    if fmt == 'ndjson':
+        body = (json.dumps(r) + '\n' for r in records())
+        mimetype = 'application/x-ndjson'
+    else:
+        columns = fields or HISTORY_FIELDS
+
+        def rows():
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            for r in records():
+                writer.writerow(r)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+        body = rows()
+        mimetype = 'text/csv'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=prediction_history.{fmt}'
+    return response
+
 
 @app.route('/api/history')
 def get_history():
     try:
-        history = load_history()
-        print(f"History file path: {HISTORY_FILE}")
-        print(f"File exists: {os.path.exists(HISTORY_FILE)}")
-        print(f"Loaded {len(history)} history records")
-        if history:
-            print(f"First record: {history[0]}")
-        return jsonify(history)
+        filters, fields, cursor = parse_history_query(request.args)
+        limit = request.args.get('limit', type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson', 'csv'):
+        return jsonify({"error": "format must be json, ndjson or csv"}), 400
+    try:
+        if fmt != 'json':
+            return export_history(fmt, filters, fields, limit, cursor)
+
+        limit = max(1, min(limit or HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX))
+        with stage('history_load'):
+            records, next_cursor = history_store.page(limit, cursor, **filters)
+        g.log_extra.update(records=len(records))
+        return jsonify({
+            "records": [project(r, fields) for r in records],
+            "next_cursor": str(next_cursor) if next_cursor is not None else None,
+            "limit": limit
+        })
     except Exception as e:
-        print(f"Error in get_history: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_history")
         return jsonify({"error": str(e)}), 500
 
+HISTORY_SUMMARY_MAX_DAYS = 3660
+
+
+@app.route('/api/history/summary')
+def history_summary():
+    """Yield statistics per crop and daily prediction counts, from the in-memory history cache"""
+    days = request.args.get('days', 30, type=int)
+    if days is None or not 1 <= days <= HISTORY_SUMMARY_MAX_DAYS:
+        return jsonify({"error": f"days must be an integer between 1 and {HISTORY_SUMMARY_MAX_DAYS}"}), 400
+    try:
+        with stage('history_summary'):
+            summary = history_cache.summary(crop_type=request.args.get('crop_type', '').strip() or None, days=days)
+        return jsonify(summary)
+    except Exception as e:
+        logger.exception("Error in history_summary")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/static/<path:name>')
+def static_file(name):
+    return static_assets.response(name, request)
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/ready')
+def ready():
+    # In lazy mode the first readiness probe starts loading the model in the background
+    if not model_loader.ready():
+        model_loader.load_in_background()
+    status = model_loader.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+def admin_authorized():
+    # Admin endpoints are disabled unless ADMIN_TOKEN is set
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('X-Admin-Token') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+    # Bytes, not str: compare_digest rejects str with non-ASCII characters
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+@app.route('/api/admin/models', methods=['GET'])
+def list_models():
+    if not admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    info = model_loader.registry.describe()
+    info["serving"] = model_loader.status()
+    return jsonify(info)
+
+@app.route('/api/admin/models/activate', methods=['POST'])
+def activate_model():
+    """Make a registered version active: warmed up and swapped in here, picked up by other workers on their next check"""
+    if not admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    payload = request.get_json(silent=True) or {}
+    version = payload.get('version')
+    if not version:
+        return jsonify({"error": "version is required"}), 400
+    if version not in model_loader.registry.versions():
+        return jsonify({"error": f"Unknown model version '{version}'"}), 404
+    try:
+        model_loader.reload(version)
+    except Exception as e:
+        return jsonify({"error": f"Model {version} failed to load: {e}"}), 500
+    model_loader.registry.activate(version)
+    return jsonify(model_loader.status())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics_registry.exposition(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/drift')
+def drift():
+    """PSI against the training baseline from all workers' bin counts, overall and per crop, plus this worker's means"""
+    if drift_monitor is None:
+        return jsonify({"enabled": False})
+    current = model_loader.current
+    crop_type = request.args.get('crop_type', '').strip() or None
+    if crop_type and current is not None:
+        crop_type = current.validator.canonical(crop_type) or crop_type
+    with stage('drift_report'):
+        report = drift_monitor.report(crop_type, metrics_registry.samples(DRIFT_BIN_METRIC))
+    report["model_version"] = current.version if current else None
+    return jsonify(report)
+
+@app.route('/api/history/writer')
+def history_writer_stats():
+    """Queue depth and counters of this worker's background history writer"""
+    if history_writer is None:
+        return jsonify({"async": False})
+    return jsonify(dict(history_writer.stats(), **{"async": True}))
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
 @app.route('/api/debug')
 def debug_history():
-    """Debug route to check history file"""
+    """Debug route to check the history store"""
     try:
-        file_path = HISTORY_FILE
-        exists = os.path.exists(file_path)
-        
-        debug_info = {
-            "file_path": file_path,
-            "file_exists": exists,
-            "current_dir": os.getcwd()
-        }
-        
-        if exists:
-            with open(file_path, 'r') as f:
-                content = f.read()
-                debug_info["file_size"] = len(content)
-                debug_info["file_content_preview"] = content[:500] if content else "EMPTY"
-                try:
-                    data = json.loads(content) if content.strip() else []
-                    debug_info["records_count"] = len(data)
-                    debug_info["data"] = data
-                except json.JSONDecodeError as e:
-                    debug_info["json_error"] = str(e)
-        
+        debug_info = history_store.describe()
+        debug_info["current_dir"] = os.getcwd()
+        debug_info["latest_records"] = load_history(limit=5)
         return jsonify(debug_info)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,39 @@
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+
+# Workers share metrics through per-process snapshot files in METRICS_DIR (see metrics.py).
+# Set it here, before any worker starts, and clear what a previous run left behind.
+metrics_dir = os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'agripredict_metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+# Threaded workers: a request waiting on disk or the network only holds one thread, and the
+# model, caches and history writer are shared by all threads of a worker.
+# GUNICORN_WORKER_CLASS=sync restores one request at a time per worker.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def worker_exit(server, worker):
+    # Write out queued history records before the worker goes away
+    app_module = sys.modules.get('flaskapp')
+    if app_module is not None and app_module.history_writer is not None:
+        app_module.history_writer.close()
+    from metrics import registry
+    registry.flush()
+
+
+# Import the app (and load the model) once in the master so workers share its memory copy-on-write.
+# Set GUNICORN_PRELOAD=0 to load in every worker instead, e.g. together with MODEL_LOAD_MODE=lazy.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the GC's reach so collections in workers
+    # do not touch (and so copy) the pages holding the preloaded model
+    gc.freeze()
@@ -0,0 +1,270 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# Relative accuracy of the yield percentile sketches
+HISTORY_SKETCH_ACCURACY = float(os.environ.get('HISTORY_SKETCH_ACCURACY', 0.01))
+# Minimum seconds between two syncs with the store; summaries in between use the cached columns
+HISTORY_CACHE_SYNC_INTERVAL = float(os.environ.get('HISTORY_CACHE_SYNC_INTERVAL', 1.0))
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+MISSING_DATE = np.iinfo(np.int64).min
+DAY_SECONDS = 86400
+
+
+class QuantileSketch:
+    """Mergeable percentile sketch with bounded relative error (DDSketch-style).
+
+    A positive value v is counted in bucket ceil(log_gamma(v)), with
+    gamma = (1 + accuracy) / (1 - accuracy), so any quantile is answered to
+    within `accuracy` of the true value. The number of buckets grows with the
+    log of the value range, not with the number of values. Negative values go
+    to a mirrored bucket map keyed by their magnitude, and exact zeros to a
+    bucket of their own.
+    """
+
+    def __init__(self, accuracy=HISTORY_SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _key(self, magnitudes):
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+
+    def _value(self, key):
+        # Midpoint of the bucket (gamma^(key-1), gamma^key] in relative terms
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.zeros += int(np.count_nonzero(values == 0))
+        for buckets, magnitudes in ((self.buckets, values[values > 0]), (self.negative, -values[values < 0])):
+            keys, counts = np.unique(self._key(magnitudes), return_counts=True)
+            for key, n in zip(keys.tolist(), counts.tolist()):
+                buckets[key] = buckets.get(key, 0) + n
+
+    def merge(self, other):
+        for buckets, theirs in ((self.buckets, other.buckets), (self.negative, other.negative)):
+            for key, n in theirs.items():
+                buckets[key] = buckets.get(key, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Most negative first: the largest magnitudes of the mirrored map
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if rank < seen:
+                return -self._value(key)
+        seen += self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return self._value(key)
+        return self._value(max(self.buckets)) if self.buckets else 0.0
+
+
+class DayAggregate:
+    """Record count and yield count, sum, min, max and sketch of one crop's records on one day."""
+
+    __slots__ = ('records', 'count', 'total', 'low', 'high', 'sketch')
+
+    def __init__(self, accuracy):
+        self.records = 0
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.sketch = QuantileSketch(accuracy)
+
+    def add(self, values):
+        self.records += len(values)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.count += len(values)
+            self.total += float(values.sum())
+            self.low = min(self.low, float(values.min()))
+            self.high = max(self.high, float(values.max()))
+            self.sketch.add(values)
+
+    def merge(self, other):
+        self.records += other.records
+        self.count += other.count
+        self.total += other.total
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, quantiles):
+        if not self.count:
+            return {"records": self.records, "count": 0, "mean_yield": None, "min_yield": None, "max_yield": None,
+                    "percentiles": {f"p{round(q * 100):g}": None for q in quantiles}}
+        return {
+            "records": self.records,
+            "count": self.count,
+            "mean_yield": round(self.total / self.count, 4),
+            "min_yield": round(self.low, 4),
+            "max_yield": round(self.high, 4),
+            "percentiles": {f"p{round(q * 100):g}": round(self.sketch.quantile(q), 4) for q in quantiles},
+        }
+
+
+class HistoryCache:
+    """In-process aggregates of the prediction history, updated incrementally.
+
+    sync() reads only what was appended to the store since the last sync
+    (store.read_since), so every worker sees records written by the others.
+    Each appended batch updates one DayAggregate per crop and day: record
+    count, yield count, sum, min and max, and a percentile sketch. The records
+    themselves are not kept. A summary of the last N days looks up at most
+    min(N, stored days) aggregates per crop, however long the history is.
+    Records without a parseable date belong to no day, so no summary counts
+    them.
+
+    Crop names go through `canonical`, the serving model's
+    InputValidator.canonical, so 'soyabean' and 'Soybean' are one crop. Names
+    it does not know are folded to lower case and reported with the first
+    spelling seen.
+    """
+
+    def __init__(self, store, sync_interval=HISTORY_CACHE_SYNC_INTERVAL, accuracy=HISTORY_SKETCH_ACCURACY,
+                 canonical=None):
+        self.store = store
+        self.sync_interval = sync_interval
+        self.accuracy = accuracy
+        self.canonical = canonical
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.position = None
+        self.size = 0
+        self.crops = []
+        self._crop_index = {}
+        # Per crop code: {day since the epoch: DayAggregate}
+        self.daily = []
+        self.last_sync = None
+
+    def bind(self, canonical):
+        """Use a new model's crop-name mapping; the aggregates are rebuilt from the store on the next sync."""
+        with self._lock:
+            if canonical != self.canonical:
+                self.canonical = canonical
+                self._reset()
+
+    def _name(self, name):
+        name = str(name).strip()
+        return (self.canonical(name) if self.canonical and name else None) or name
+
+    def _codes(self, names):
+        codes = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            name = self._name(name)
+            key = name.lower()
+            code = self._crop_index.get(key)
+            if code is None:
+                code = self._crop_index[key] = len(self.crops)
+                self.crops.append(name)
+                self.daily.append({})
+            codes[i] = code
+        return codes
+
+    def append(self, rows):
+        """Add (date, crop_type, yield) rows, oldest first, to the per-day aggregates."""
+        if not rows:
+            return
+        dates, names, values = zip(*rows)
+        codes = self._codes(names)
+        epoch = (pd.to_datetime(pd.Series(dates, dtype=object), format=DATE_FORMAT, errors='coerce')
+                 .to_numpy('datetime64[s]').astype(np.int64))
+        epoch[epoch == np.datetime64('NaT').astype(np.int64)] = MISSING_DATE
+        values = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        self.size += len(rows)
+
+        # Group the dated rows by (crop, day) with one sort instead of a mask per pair
+        dated = np.flatnonzero(epoch != MISSING_DATE)
+        days = epoch[dated] // DAY_SECONDS
+        order = np.lexsort((days, codes[dated]))
+        pairs = np.stack([codes[dated][order], days[order]], axis=1)
+        if not len(pairs):
+            return
+        keys, starts = np.unique(pairs, axis=0, return_index=True)
+        for (code, day), chunk in zip(keys.tolist(), np.split(values[dated][order], starts[1:])):
+            aggregate = self.daily[code].get(day)
+            if aggregate is None:
+                aggregate = self.daily[code][day] = DayAggregate(self.accuracy)
+            aggregate.add(chunk)
+
+    def sync(self, force=False):
+        """Pull records appended to the store since the last sync; returns how many were added."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.last_sync is not None and now - self.last_sync < self.sync_interval:
+                return 0
+            rows, position = self.store.read_since(self.position)
+            self.append(rows)
+            self.position = position
+            self.last_sync = now
+            return len(rows)
+
+    def summary(self, crop_type=None, days=30, quantiles=(0.1, 0.5, 0.9)):
+        """Yield statistics, overall and per crop, and daily record counts of the last `days` days up to today."""
+        self.sync()
+        today = int(np.datetime64(datetime.now(), 'D').astype(np.int64))
+        window = range(today - days + 1, today + 1)
+        with self._lock:
+            if crop_type:
+                code = self._crop_index.get(self._name(crop_type).lower())
+                codes = [code] if code is not None else []
+            else:
+                codes = range(len(self.crops))
+
+            overall = DayAggregate(self.accuracy)
+            crops, volumes = {}, {}
+            for code in codes:
+                daily = self.daily[code]
+                # Look the window's days up, or scan the crop's days when it has fewer than the window
+                if len(window) < len(daily):
+                    found = ((day, daily[day]) for day in window if day in daily)
+                else:
+                    found = ((day, a) for day, a in daily.items() if day in window)
+                crop = DayAggregate(self.accuracy)
+                for day, aggregate in found:
+                    crop.merge(aggregate)
+                    volumes[day] = volumes.get(day, 0) + aggregate.records
+                if crop.records:
+                    overall.merge(crop)
+                    crops[self.crops[code]] = crop.summary(quantiles)
+            return dict(
+                overall.summary(quantiles),
+                crops=crops,
+                daily_volumes=[{"date": str(np.datetime64(day, 'D')), "count": volumes[day]} for day in sorted(volumes)],
+                days=days,
+                sketch_accuracy=self.accuracy,
+            )
+
+    def count(self):
+        """Records in the store, kept current by the incremental sync instead of a full read."""
+        self.sync()
+        return self.size
+
+    def stats(self):
+        return {"records": self.size, "crops": len(self.crops),
+                "aggregates": sum(len(daily) for daily in self.daily), "position": self.position}
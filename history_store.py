@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends still go out as a single O_APPEND write
+    fcntl = None
+
+
+logger = logging.getLogger('agripredict.history')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_HISTORY_FILE = os.path.join(BASE_DIR, 'crop_predictions_history.json')
+
+HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'sqlite')
+DEFAULT_PATHS = {
+    'sqlite': os.path.join(BASE_DIR, 'crop_predictions_history.db'),
+    'jsonl': os.path.join(BASE_DIR, 'crop_predictions_history.jsonl'),
+}
+
+# Column order for CSV export and the set of names accepted for field projection
+HISTORY_FIELDS = [
+    'Soil_pH', 'Temperature', 'Humidity', 'Wind_Speed', 'N', 'P', 'K', 'Soil_Quality',
+    'Crop_Type', 'yield', 'date', 'model_version'
+]
+
+
+class HistoryStore:
+    """Append-only store of prediction records.
+
+    Records are plain dicts with at least 'date' ("YYYY-MM-DD HH:MM:SS"),
+    'Crop_Type' and 'yield'. Reads return the most recently added record first,
+    the same order the old JSON file kept.
+
+    Filters accepted by the read methods: crop_type (case-insensitive),
+    date_from/date_to (inclusive, compared as strings) and min_yield/max_yield.
+    Paging uses an opaque integer cursor: pass the next_cursor of one page to
+    get the records after it.
+    """
+
+    backend = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        raise NotImplementedError
+
+    def scan(self, cursor=None, **filters):
+        """Yield (cursor, record) pairs, newest first, starting after the given cursor."""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def read_since(self, position=None):
+        """Summary columns of the records added after `position`, oldest first.
+
+        Returns ([(date, crop_type, yield), ...], position); pass the returned
+        position to the next call to get only what was appended since.
+        """
+        raise NotImplementedError
+
+    def iter_records(self, cursor=None, **filters):
+        for _, record in self.scan(cursor, **filters):
+            yield record
+
+    def page(self, limit, cursor=None, **filters):
+        """Return up to `limit` records and the cursor for the next page (None on the last page)."""
+        records = []
+        last = None
+        for key, record in self.scan(cursor, **filters):
+            if len(records) == limit:
+                return records, last
+            records.append(record)
+            last = key
+        return records, None
+
+    def load(self, limit=None, **filters):
+        records = []
+        for record in self.iter_records(**filters):
+            if limit is not None and len(records) >= limit:
+                break
+            records.append(record)
+        return records
+
+    def describe(self):
+        return {
+            "backend": self.backend,
+            "path": self.path,
+            "exists": os.path.exists(self.path),
+            "records_count": self.count(),
+        }
+
+
+class SqliteHistoryStore(HistoryStore):
+    """SQLite store in WAL mode: O(1) appends, safe across processes, indexed by date and crop."""
+
+    backend = 'sqlite'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    crop_type TEXT NOT NULL COLLATE NOCASE,
+                    yield REAL,
+                    record TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_history_date ON history (date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_history_crop ON history (crop_type)')
+
+    def _connect(self):
+        # One connection per thread and per process; connections must not cross a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append_many(self, records):
+        rows = [
+            (r['date'], str(r.get('Crop_Type', '')), r.get('yield'), json.dumps(r))
+            for r in records
+        ]
+        with self._connect() as conn:
+            conn.executemany('INSERT INTO history (date, crop_type, yield, record) VALUES (?, ?, ?, ?)', rows)
+
+    def _where(self, cursor=None, crop_type=None, date_from=None, date_to=None, min_yield=None, max_yield=None):
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append('id < ?')
+            params.append(int(cursor))
+        if crop_type:
+            clauses.append('crop_type = ?')
+            params.append(crop_type)
+        if date_from:
+            clauses.append('date >= ?')
+            params.append(date_from)
+        if date_to:
+            clauses.append('date <= ?')
+            params.append(date_to)
+        if min_yield is not None:
+            clauses.append('yield >= ?')
+            params.append(min_yield)
+        if max_yield is not None:
+            clauses.append('yield <= ?')
+            params.append(max_yield)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def scan(self, cursor=None, **filters):
+        where, params = self._where(cursor, **filters)
+        rows = self._connect().execute(f'SELECT id, record FROM history{where} ORDER BY id DESC', params)
+        for key, record in rows:
+            yield key, json.loads(record)
+
+    def page(self, limit, cursor=None, **filters):
+        where, params = self._where(cursor, **filters)
+        rows = self._connect().execute(
+            f'SELECT id, record FROM history{where} ORDER BY id DESC LIMIT ?', params + [int(limit) + 1]
+        ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [json.loads(r) for _, r in rows[:limit]], next_cursor
+
+    def load(self, limit=None, **filters):
+        if limit is None:
+            return list(self.iter_records(**filters))
+        return self.page(limit, **filters)[0]
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def read_since(self, position=None):
+        # Served from the indexed columns; the JSON record is not decoded
+        rows = self._connect().execute(
+            'SELECT id, date, crop_type, yield FROM history WHERE id > ? ORDER BY id', (int(position or 0),)
+        ).fetchall()
+        if not rows:
+            return [], position
+        return [r[1:] for r in rows], rows[-1][0]
+
+    def migrate_from(self, records):
+        """Import records (newest first) into an empty store; returns how many were imported."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT EXISTS (SELECT 1 FROM history)').fetchone()[0]:
+                conn.rollback()
+                return 0
+            conn.executemany(
+                'INSERT INTO history (date, crop_type, yield, record) VALUES (?, ?, ?, ?)',
+                [(r.get('date', ''), str(r.get('Crop_Type', '')), r.get('yield'), json.dumps(r)) for r in reversed(records)]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(records)
+
+
+class JsonlHistoryStore(HistoryStore):
+    """Append-only JSON-lines log. Appends are O(1); reads scan the file."""
+
+    backend = 'jsonl'
+
+    def append_many(self, records):
+        data = ''.join(json.dumps(r) + '\n' for r in records).encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _reverse_lines(self, before=None, block_size=1 << 16):
+        """Yield (offset, line) for each line ending before byte `before`, last line first."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END) if before is None else int(before)
+            tail = b''
+            while pos > 0:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + tail).split(b'\n')
+                # lines[0] may continue in the previous block unless we are at the start of the file
+                tail = lines[0]
+                offset = pos + len(tail) + 1
+                starts = []
+                for line in lines[1:]:
+                    starts.append((offset, line))
+                    offset += len(line) + 1
+                for start, line in reversed(starts):
+                    if line.strip():
+                        yield start, line
+            if tail.strip():
+                yield 0, tail
+
+    def scan(self, cursor=None, crop_type=None, date_from=None, date_to=None, min_yield=None, max_yield=None):
+        crop = crop_type.lower() if crop_type else None
+        for offset, line in self._reverse_lines(cursor):
+            try:
+                r = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crashed writer; skip it
+                continue
+            if crop and str(r.get('Crop_Type', '')).lower() != crop:
+                continue
+            date = r.get('date', '')
+            if (date_from and date < date_from) or (date_to and date > date_to):
+                continue
+            y = r.get('yield')
+            if min_yield is not None and (y is None or y < min_yield):
+                continue
+            if max_yield is not None and (y is None or y > max_yield):
+                continue
+            yield offset, r
+
+    def count(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            return sum(1 for line in f if line.strip())
+
+    def read_since(self, position=None):
+        # Position is a byte offset; a last line without its newline is still being written
+        if not os.path.exists(self.path):
+            return [], position
+        with open(self.path, 'rb') as f:
+            f.seek(int(position or 0))
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        rows = []
+        for line in data[:end].split(b'\n'):
+            try:
+                r = json.loads(line) if line.strip() else None
+            except json.JSONDecodeError:
+                continue
+            if r is not None:
+                rows.append((r.get('date', ''), str(r.get('Crop_Type', '')), r.get('yield')))
+        return rows, int(position or 0) + end
+
+    def migrate_from(self, records):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size:
+                return 0
+            os.write(fd, ''.join(json.dumps(r) + '\n' for r in reversed(records)).encode('utf-8'))
+        finally:
+            os.close(fd)
+        return len(records)
+
+
+BACKENDS = {
+    'sqlite': SqliteHistoryStore,
+    'jsonl': JsonlHistoryStore,
+}
+
+
+def migration_marker(store):
+    return store.path + '.migrated'
+
+
+def migrate_json_history(store, json_path=LEGACY_HISTORY_FILE, force=False):
+    """One-shot import of the old whole-file JSON history.
+
+    Imports only into an empty store (store.migrate_from checks that under its
+    lock). Afterwards a marker file next to the store records that migration
+    is settled, so later startups cost two stat calls instead of counting the
+    history. force=True ignores the marker, for an explicit import.
+    """
+    marker = migration_marker(store)
+    if not os.path.exists(json_path) or (not force and os.path.exists(marker)):
+        return 0
+    with open(json_path, 'r') as f:
+        content = f.read()
+    try:
+        records = json.loads(content) if content.strip() else []
+    except json.JSONDecodeError as e:
+        # A corrupt or truncated legacy file must not stop the app from starting
+        backup = json_path + '.bak'
+        os.replace(json_path, backup)
+        logger.warning("Legacy history %s is not valid JSON (%s); moved it to %s and started empty",
+                       json_path, e, backup)
+        return 0
+    count = store.migrate_from(records)
+    with open(marker, 'w') as f:
+        json.dump({"source": json_path, "records": count}, f)
+    return count
+
+
+def get_history_store(backend=None, path=None, migrate=True):
+    backend = backend or HISTORY_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown history backend '{backend}', expected one of {sorted(BACKENDS)}")
+    path = path or os.environ.get('HISTORY_PATH') or DEFAULT_PATHS[backend]
+    store = BACKENDS[backend](path)
+    if migrate:
+        migrate_json_history(store)
+    return store
+
+
+if __name__ == '__main__':
+    # python history_store.py migrate [legacy.json]
+    if len(sys.argv) >= 2 and sys.argv[1] == 'migrate':
+        source = sys.argv[2] if len(sys.argv) > 2 else LEGACY_HISTORY_FILE
+        store = get_history_store(migrate=False)
+        count = migrate_json_history(store, source, force=True)
+        print(f"Imported {count} records from {source} into {store.path}")
+    else:
+        print("Usage: python history_store.py migrate [legacy_history.json]")
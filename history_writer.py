@@ -0,0 +1,148 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger('agripredict.history')
+
+# Write history on a background thread (set HISTORY_ASYNC=0 to write inside the request again)
+HISTORY_ASYNC = os.environ.get('HISTORY_ASYNC', '1') != '0'
+# Records waiting to be written; when full, new records are dropped rather than blocking requests
+HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+# Most records written in one append_many call
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 500))
+# How long the writer waits for more records before writing a partial batch
+HISTORY_BATCH_WAIT = float(os.environ.get('HISTORY_BATCH_WAIT', 0.05))
+# Longest a graceful shutdown waits for the queue to drain
+HISTORY_FLUSH_TIMEOUT = float(os.environ.get('HISTORY_FLUSH_TIMEOUT', 10))
+
+
+class BackgroundHistoryWriter:
+    """Moves history writes off the request path.
+
+    submit() puts the record on a bounded in-memory queue and returns at once.
+    A daemon thread takes whatever has queued up (up to batch_size records,
+    waiting at most batch_wait for more) and writes it with a single
+    store.append_many call, i.e. one SQLite transaction or one appended block
+    of JSON lines. When the queue is full the record is dropped and counted,
+    so a stalled disk costs history, never request latency.
+
+    Records are readable once written, normally within batch_wait. close()
+    (registered with atexit and called from gunicorn's worker_exit hook)
+    writes everything still queued. The thread is started lazily in each
+    process, so a gunicorn master that imports the app before forking does
+    not hand a dead thread to its workers.
+    """
+
+    def __init__(self, store, maxsize=HISTORY_QUEUE_SIZE, batch_size=HISTORY_BATCH_SIZE, batch_wait=HISTORY_BATCH_WAIT):
+        self.store = store
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._init_process()
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._init_process)
+
+    def _init_process(self):
+        self._queue = queue.Queue(self.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._closed = False
+        self.submitted = self.written = self.dropped = self.failed = self.batches = 0
+        self.last_write_seconds = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, record):
+        """Queue a record for writing; returns False if it was dropped because the queue is full."""
+        if self._closed:
+            return self._write([record])
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._count_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning("History queue full, dropping records", extra={"dropped": dropped})
+            return False
+        with self._count_lock:
+            self.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.batch_wait
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size or waiters:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for event in waiters:
+                event.set()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            self.store.append_many(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Error writing history batch", extra={"records": len(batch)})
+            return False
+        self.written += len(batch)
+        self.batches += 1
+        self.last_write_seconds = time.perf_counter() - start
+        return True
+
+    def flush(self, timeout=HISTORY_FLUSH_TIMEOUT):
+        """Block until every record submitted before this call is written (or timeout); returns success."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=HISTORY_FLUSH_TIMEOUT):
+        """Write what is queued; later submits are written synchronously."""
+        if self._closed:
+            return
+        self._closed = True
+        if not self.flush(timeout):
+            logger.warning("History writer did not drain before shutdown", extra={"pending": self._queue.qsize()})
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.maxsize,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_write_ms": round(self.last_write_seconds * 1000, 3) if self.last_write_seconds is not None else None,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, ParameterSampler
+
+from data_loader import content_sha256
+
+try:
+    import lightgbm
+except ImportError:
+    lightgbm = None
+
+
+# Finished (rung, candidate, fold) evaluations are appended here, one file per search configuration
+SEARCH_DIR = os.environ.get('SEARCH_DIR', 'search_results')
+
+# Sampled without replacement by ParameterSampler; plain lists keep every value JSON-serialisable
+SEARCH_SPACES = {
+    'XGBoost': {
+        'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'max_depth': [4, 6, 8, 10],
+        'subsample': [0.7, 0.8, 0.9, 1.0],
+        'colsample_bytree': [0.6, 0.8, 1.0],
+        'min_child_weight': [1, 3, 5],
+        'reg_lambda': [0.5, 1.0, 2.0],
+    },
+    'LightGBM': {
+        'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'num_leaves': [15, 31, 63, 127],
+        'max_depth': [-1, 8, 12],
+        'subsample': [0.7, 0.8, 0.9, 1.0],
+        'colsample_bytree': [0.6, 0.8, 1.0],
+        'min_child_samples': [10, 20, 40],
+    },
+    'RandomForest': {
+        'n_estimators': [100, 200, 300],
+        'max_depth': [8, 12, 16, None],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': [1.0, 0.6, 'sqrt'],
+    },
+}
+
+# Boosted models get a generous round budget and stop on an inner holdout instead of tuning n_estimators
+BOOSTED = {'XGBoost', 'LightGBM'}
+MAX_BOOSTING_ROUNDS = 2000
+EARLY_STOPPING_ROUNDS = 50
+EARLY_STOPPING_HOLDOUT = 0.1
+
+# Per-process fold matrices, filled once by _init_worker rather than shipped with every task
+_folds = None
+_build_regressor = None
+
+
+def make_folds(X, y, make_preprocessor, n_splits=3, seed=42):
+    """Split once and fit the preprocessing once per fold.
+
+    Each fold is (X_train, y_train, X_val, y_val) as transformed arrays. Training
+    rows are shuffled up front so that every rung's subsample is simply a prefix.
+    """
+    folds = []
+    rng = np.random.RandomState(seed)
+    for train_idx, val_idx in KFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X):
+        train_idx = rng.permutation(train_idx)
+        ct = make_preprocessor()
+        X_train = np.asarray(ct.fit_transform(X.iloc[train_idx]), dtype=np.float32)
+        X_val = np.asarray(ct.transform(X.iloc[val_idx]), dtype=np.float32)
+        folds.append((X_train, np.asarray(y.iloc[train_idx]), X_val, np.asarray(y.iloc[val_idx])))
+    return folds
+
+
+def data_fingerprint(X, y):
+    """Content hash of the training data, so a changed dataset of the same shape does not resume old scores."""
+    return content_sha256(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes(),
+                          pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+
+
+def _init_worker(folds, build_regressor):
+    global _folds, _build_regressor
+    _folds = folds
+    _build_regressor = build_regressor
+
+
+def evaluate(task):
+    """Fit one (candidate, fold) at the rung's row fraction and score it on the whole validation fold."""
+    X_train, y_train, X_val, y_val = _folds[task['fold']]
+    n_rows = max(50, int(len(X_train) * task['fraction']))
+    X_train, y_train = X_train[:n_rows], y_train[:n_rows]
+    name, params = task['model'], dict(task['params'])
+
+    start = time.perf_counter()
+    best_iteration = None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if name in BOOSTED:
+            split = int(n_rows * (1 - EARLY_STOPPING_HOLDOUT))
+            X_fit, y_fit, X_stop, y_stop = X_train[:split], y_train[:split], X_train[split:], y_train[split:]
+            params['n_estimators'] = MAX_BOOSTING_ROUNDS
+            if name == 'XGBoost':
+                params['early_stopping_rounds'] = EARLY_STOPPING_ROUNDS
+                reg = _build_regressor(name, task['threads'], params)
+                reg.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)], verbose=False)
+                best_iteration = int(reg.best_iteration) + 1
+            else:
+                reg = _build_regressor(name, task['threads'], params)
+                reg.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)],
+                        callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+                best_iteration = int(reg.best_iteration_ or MAX_BOOSTING_ROUNDS)
+        else:
+            reg = _build_regressor(name, task['threads'], params)
+            reg.fit(X_train, y_train)
+        y_pred = reg.predict(X_val)
+
+    return dict(
+        {k: task[k] for k in ('model', 'rung', 'candidate', 'fold', 'params')},
+        rows=n_rows,
+        r2=float(r2_score(y_val, y_pred)),
+        mae=float(mean_absolute_error(y_val, y_pred)),
+        best_iteration=best_iteration,
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+def rung_fractions(n_candidates, eta, min_fraction):
+    """Training-row fraction for each rung: the last rung uses every row, each earlier one 1/eta as many."""
+    n_rungs = max(1, int(math.floor(math.log(max(n_candidates, 1), eta))) + 1)
+    return [max(min_fraction, eta ** (k - n_rungs + 1)) for k in range(n_rungs)]
+
+
+class HalvingSearch:
+    """Randomised search with successive halving over cross-validation folds, resumable from disk.
+
+    Every candidate starts on a small fraction of each fold's training rows;
+    after each rung only the best 1/eta (by mean R2 across folds) continue with
+    eta times as many rows. Each finished (rung, candidate, fold) evaluation is
+    appended to a JSON-lines file named after a hash of the search
+    configuration and of the data's shape and content, so running the same
+    search again skips everything already done. Changing any setting or any
+    training value starts a fresh file.
+    """
+
+    def __init__(self, names, build_regressor, make_preprocessor, n_candidates=16, eta=3, n_splits=3,
+                 min_fraction=0.05, seed=42, workers=1, threads=1, directory=SEARCH_DIR, log=print):
+        self.names = names
+        self.build_regressor = build_regressor
+        self.make_preprocessor = make_preprocessor
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.n_splits = n_splits
+        self.min_fraction = min_fraction
+        self.seed = seed
+        self.workers = workers
+        self.threads = threads
+        self.directory = directory
+        self.log = log
+
+    def results_path(self, name, X, fingerprint):
+        config = {
+            "model": name, "space": SEARCH_SPACES[name], "n_candidates": self.n_candidates, "eta": self.eta,
+            "n_splits": self.n_splits, "min_fraction": self.min_fraction, "seed": self.seed,
+            "rows": len(X), "columns": list(X.columns), "data": fingerprint,
+            "boosting": [MAX_BOOSTING_ROUNDS, EARLY_STOPPING_ROUNDS, EARLY_STOPPING_HOLDOUT] if name in BOOSTED else None,
+        }
+        key = content_sha256(config)[:12]
+        return os.path.join(self.directory, f'{name}-{key}.jsonl')
+
+    @staticmethod
+    def load_results(path):
+        done = {}
+        if not os.path.exists(path):
+            return done
+        with open(path) as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                done[(r['rung'], r['candidate'], r['fold'])] = r
+        return done
+
+    def candidates(self, name):
+        sampler = ParameterSampler(SEARCH_SPACES[name], n_iter=self.n_candidates, random_state=self.seed)
+        return [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in p.items()} for p in sampler]
+
+    def run(self, X, y):
+        """Search every model; returns {name: {"params", "cv_r2", "cv_mae", ...}} for the winners."""
+        os.makedirs(self.directory, exist_ok=True)
+        folds = make_folds(X, y, self.make_preprocessor, self.n_splits, self.seed)
+        _init_worker(folds, self.build_regressor)
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=(folds, self.build_regressor))
+        try:
+            fingerprint = data_fingerprint(X, y)
+            return {name: self._search(name, X, fingerprint, pool) for name in self.names if name in SEARCH_SPACES}
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _search(self, name, X, fingerprint, pool):
+        path = self.results_path(name, X, fingerprint)
+        done = self.load_results(path)
+        candidates = self.candidates(name)
+        fractions = rung_fractions(len(candidates), self.eta, self.min_fraction)
+        self.log(f"{name}: {len(candidates)} candidates, {len(fractions)} rungs {[round(f, 3) for f in fractions]}, "
+                 f"{len(done)} evaluations already in {path}")
+
+        alive = list(range(len(candidates)))
+        start = time.perf_counter()
+        with open(path, 'a') as out:
+            for rung, fraction in enumerate(fractions):
+                tasks = [
+                    {"model": name, "rung": rung, "candidate": c, "fold": fold, "params": candidates[c],
+                     "fraction": fraction, "threads": self.threads}
+                    for c in alive for fold in range(self.n_splits)
+                    if (rung, c, fold) not in done
+                ]
+                for r in self._map(tasks, pool):
+                    done[(r['rung'], r['candidate'], r['fold'])] = r
+                    out.write(json.dumps(r) + '\n')
+                    out.flush()
+
+                scores = {c: self._summary(done, rung, c) for c in alive}
+                alive.sort(key=lambda c: scores[c]['cv_r2'], reverse=True)
+                best = scores[alive[0]]
+                self.log(f"  rung {rung} ({fraction:.0%} of rows): {len(alive)} candidates, "
+                         f"best R2={best['cv_r2']:.4f} MAE={best['cv_mae']:.3f}")
+                if rung < len(fractions) - 1:
+                    alive = alive[:max(1, math.ceil(len(alive) / self.eta))]
+
+        winner = dict(self._summary(done, len(fractions) - 1, alive[0]), params=candidates[alive[0]])
+        if name in BOOSTED:
+            # Refit on all rows with the round count early stopping settled on
+            winner['params'] = dict(winner['params'], n_estimators=winner['n_estimators'])
+        winner['seconds'] = round(time.perf_counter() - start, 1)
+        self.log(f"  {name} best: {winner['params']}")
+        return winner
+
+    def _summary(self, done, rung, candidate):
+        rows = [done[(rung, candidate, fold)] for fold in range(self.n_splits)]
+        summary = {
+            "cv_r2": float(np.mean([r['r2'] for r in rows])),
+            "cv_mae": float(np.mean([r['mae'] for r in rows])),
+            "candidate": candidate,
+        }
+        iterations = [r['best_iteration'] for r in rows if r.get('best_iteration')]
+        if iterations:
+            summary['n_estimators'] = int(round(np.mean(iterations)))
+        return summary
+
+    def _map(self, tasks, pool):
+        if pool is None:
+            for task in tasks:
+                yield evaluate(task)
+            return
+        for future in as_completed([pool.submit(evaluate, task) for task in tasks]):
+            yield future.result()
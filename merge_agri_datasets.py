@@ -1,54 +1,178 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
-df_faostat = pd.read_csv('FAOSTAT_data_en_10-5-2025.csv')
-df_kaggle = pd.read_csv('Crop_recommendation.csv')
-df_foodgrains = pd.read_csv('Foodgrains1.csv')
-df_oilseeds = pd.read_csv('oilseeds1.csv')
+from data_loader import load_dataset
+
+# Source crop names (FAOSTAT / Indian foodgrain and oilseed tables) -> standard lower-case name
+CROP_NAME_MAP = {
+    'Maize (corn)': 'maize',
+    'Rice': 'rice',
+    'Wheat': 'wheat',
+    'Gram': 'chickpea',
+    'Mung (Green Gram)': 'mungbean',
+    'Udad': 'blackgram',
+    'Tur (Red Gram)': 'pigeonpeas',
+    'Jowar': 'sorghum',
+    'Bajra': 'pearlmillet',
+    'Ragi': 'fingermillet',
+    'Math ': 'mothbeans',
+    'Other Pulses': 'other pulses',
+    'Soyabean': 'soybean',
+    'Groundnut': 'groundnut',
+    'Castor seed': 'castor',
+    'Sesamum': 'sesame',
+    'Rapeseed & Mustard': 'mustard',
+}
 
-df_foodgrains.columns = df_foodgrains.columns.str.strip()
-df_oilseeds.columns = df_oilseeds.columns.str.strip()
 
 def map_crop_names(name):
-    crop_name_map = {
-        'Maize (corn)': 'maize',
-        'Rice': 'rice',
-        'Wheat': 'wheat',
-        'Gram': 'chickpea',
-        'Mung (Green Gram)': 'mungbean',
-        'Udad': 'blackgram',
-        'Tur (Red Gram)': 'pigeonpeas',
-        'Jowar': 'sorghum',
-        'Bajra': 'pearlmillet',
-        'Ragi': 'fingermillet',
-        'Math ': 'mothbeans',
-        'Other Pulses': 'other pulses',
-        'Soyabean': 'soybean',
-        'Groundnut': 'groundnut',
-        'Castor seed': 'castor',
-        'Sesamum': 'sesame',
-        'Rapeseed & Mustard': 'mustard',
-    }
-    return crop_name_map.get(name.strip(), name.strip().lower().replace(' ', '').replace('&', 'and'))
+    return CROP_NAME_MAP.get(name.strip(), name.strip().lower().replace(' ', '').replace('&', 'and'))
+
+
+def simple_crop_name(name):
+    return name.strip().lower()
+
+
+def standardize(values, rule=map_crop_names):
+    """Apply a crop-name rule once per distinct value and return a categorical.
+
+    Only the categories go through the Python function; rows are remapped through
+    their integer codes, and names that collapse to the same standard name share
+    one category.
+    """
+    cat = pd.Categorical(values)
+    mapped = np.array([rule(str(c)) for c in cat.categories], dtype=object)
+    names, inverse = np.unique(mapped, return_inverse=True)
+    codes = np.where(cat.codes >= 0, inverse[cat.codes], -1)
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+def with_shared_categories(frames, column):
+    """Give `column` one CategoricalDtype across frames so joins stay on integer codes."""
+    dtype = pd.CategoricalDtype(sorted(set().union(*(f[column].cat.categories for f in frames))))
+    for f in frames:
+        f[column] = f[column].cat.set_categories(dtype.categories)
+    return dtype
+
+
+def fanout(left, right, key):
+    """Rows each key contributes to an inner join: per-key left count, right count and output rows."""
+    counts = pd.DataFrame({
+        'left': left[key].value_counts(),
+        'right': right[key].value_counts(),
+    }).fillna(0).astype(np.int64)
+    counts = counts[(counts['left'] > 0) & (counts['right'] > 0)]
+    counts['rows'] = counts['left'] * counts['right']
+    return counts.sort_values('rows', ascending=False)
+
+
+def aggregate_years(faostat, how='mean'):
+    """One FAOSTAT row per (crop, country, unit): the mean over years, or the latest year."""
+    keys = ['crop_std', 'Country', 'Unit']
+    if how == 'latest':
+        return faostat.sort_values('Year').groupby(keys, observed=True).tail(1).reset_index(drop=True)
+    if how != 'mean':
+        raise ValueError(f"Unknown year aggregation '{how}'")
+    out = faostat.groupby(keys, observed=True).agg(
+        Crop=('Crop', 'first'), Year=('Year', 'mean'), Yield=('Yield', 'mean')).reset_index()
+    out['Year'] = out['Year'].astype(np.float32)
+    out['Yield'] = out['Yield'].astype(np.float32)
+    return out[faostat.columns]
+
+
+def cap_fanout(faostat, max_fanout):
+    """Keep the most recent `max_fanout` FAOSTAT rows per crop."""
+    return (faostat.sort_values('Year', ascending=False)
+            .groupby('crop_std', observed=True).head(max_fanout)
+            .sort_index())
+
+
+def prepare_sources(kaggle, faostat, foodgrains, oilseeds, max_fanout=None, year_aggregation=None):
+    """Add the shared categorical crop_std key to each source and apply the FAOSTAT year options."""
+    faostat = faostat.copy()
+    kaggle = kaggle.copy()
+    faostat['crop_std'] = standardize(faostat['Crop'])
+    kaggle['crop_std'] = standardize(kaggle['label'], simple_crop_name)
+    foodgrains = pd.DataFrame({'crop_std': standardize(foodgrains['Crop'], simple_crop_name),
+                               'Yield_foodgrains': foodgrains['Yield']})
+    oilseeds = pd.DataFrame({'crop_std': standardize(oilseeds['Crops'], simple_crop_name),
+                             'Yield_oilseeds': oilseeds['Yield']})
+
+    if year_aggregation:
+        faostat = aggregate_years(faostat, year_aggregation)
+    if max_fanout:
+        faostat = cap_fanout(faostat, max_fanout)
+
+    with_shared_categories([kaggle, faostat, foodgrains, oilseeds], 'crop_std')
+    return kaggle, faostat, foodgrains, oilseeds
+
+
+def merge_prepared(kaggle, faostat, foodgrains, oilseeds, log=print):
+    kaggle_filtered = kaggle[kaggle['crop_std'].isin(faostat['crop_std'])]
 
-df_faostat['crop_std'] = df_faostat['Crop'].apply(map_crop_names)
-df_foodgrains['crop_std'] = df_foodgrains['Crop'].apply(lambda x: x.strip().lower())
-df_oilseeds['crop_std'] = df_oilseeds['Crops'].apply(lambda x: x.strip().lower())
-df_kaggle['crop_std'] = df_kaggle['label'].apply(lambda x: x.strip().lower())
+    counts = fanout(kaggle_filtered, faostat, 'crop_std')
+    if log:
+        log(f"Join fan-out: {len(kaggle_filtered)} Kaggle rows x up to {int(counts['right'].max()) if len(counts) else 0} "
+            f"FAOSTAT rows per crop -> {int(counts['rows'].sum())} rows")
+        for crop, row in counts.head(10).iterrows():
+            log(f"  {crop}: {row['left']} x {row['right']} = {row['rows']}")
+        for name, side in (('foodgrains', foodgrains), ('oilseeds', oilseeds)):
+            duplicated = side['crop_std'].value_counts()
+            duplicated = duplicated[duplicated > 1]
+            if len(duplicated):
+                log(f"  {name} has repeated crops {list(duplicated.index)}; their rows multiply too")
 
+    merged_df = pd.merge(kaggle_filtered, faostat, on='crop_std', how='inner')
+    merged_df = pd.merge(merged_df, foodgrains, on='crop_std', how='left')
+    merged_df = pd.merge(merged_df, oilseeds, on='crop_std', how='left')
+    merged_df['crop_std'] = merged_df['crop_std'].cat.remove_unused_categories()
+    return merged_df
 
-kaggle_filtered = df_kaggle[df_kaggle['crop_std'].isin(df_faostat['crop_std'])]
 
+def merge_datasets(kaggle, faostat, foodgrains, oilseeds, max_fanout=None, year_aggregation=None, log=print):
+    prepared = prepare_sources(kaggle, faostat, foodgrains, oilseeds, max_fanout, year_aggregation)
+    return merge_prepared(*prepared, log=log)
 
-merged_df = pd.merge(kaggle_filtered, df_faostat, on='crop_std', how='inner')
 
+def load_sources():
+    # Column names come back stripped of the stray spaces in the source headers
+    return (
+        load_dataset('Crop_recommendation.csv'),
+        load_dataset('FAOSTAT_data_en_10-5-2025.csv'),
+        load_dataset('Foodgrains1.csv', columns=['Crop', 'Yield']),
+        load_dataset('oilseeds1.csv', columns=['Crops', 'Yield']),
+    )
 
-df_foodgrains = df_foodgrains.rename(columns={'Yield': 'Yield_foodgrains'})
-df_oilseeds = df_oilseeds.rename(columns={'Yield': 'Yield_oilseeds'})
 
+def write_output(df, path):
+    """CSV by default; .parquet/.feather (with pyarrow) or .pkl keep the column types."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        df.to_parquet(path, index=False)
+    elif ext == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    elif ext == '.pkl':
+        df.to_pickle(path)
+    else:
+        df.to_csv(path, index=False)
 
-merged_df = pd.merge(merged_df, df_foodgrains[['crop_std', 'Yield_foodgrains']], on='crop_std', how='left')
-merged_df = pd.merge(merged_df, df_oilseeds[['crop_std', 'Yield_oilseeds']], on='crop_std', how='left')
 
+def main(output='final_agri_full_dataset.csv', max_fanout=None, year_aggregation=None):
+    merged_df = merge_datasets(*load_sources(), max_fanout, year_aggregation)
+    write_output(merged_df, output)
+    print(f'Merged dataset saved to {output} ({len(merged_df)} rows, '
+          f'{merged_df.memory_usage(deep=True).sum() / 1e6:.2f} MB in memory)')
 
-merged_df.to_csv('final_agri_full_dataset.csv', index=False)
 
-print('Merged dataset saved to final_agri_full_dataset.csv')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge the Kaggle, FAOSTAT, foodgrain and oilseed tables")
+    parser.add_argument('--output', default='final_agri_full_dataset.csv',
+                        help=".csv, or .parquet/.feather/.pkl to keep the column types")
+    parser.add_argument('--max-fanout', type=int, default=None,
+                        help="join each Kaggle row with at most this many (most recent) FAOSTAT rows")
+    parser.add_argument('--aggregate-years', choices=['mean', 'latest'], default=None,
+                        help="collapse FAOSTAT years to one row per crop before the join")
+    args = parser.parse_args()
+    main(args.output, args.max_fanout, args.aggregate_years)
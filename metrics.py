@@ -0,0 +1,255 @@
+"""Minimal Prometheus-style metrics that aggregate across gunicorn worker processes.
+
+Every process keeps its metrics in memory and a background thread writes a
+snapshot to METRICS_DIR/<pid>-<start ns>.json at most every
+METRICS_FLUSH_INTERVAL seconds. The start time in the name keeps a process
+that reuses a dead worker's pid from overwriting its file. A scrape flushes the
+local snapshot, then sums the snapshots of all processes, including ones that
+have exited, so counters and histograms stay monotonic. Without METRICS_DIR
+only the local process is reported.
+"""
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+# Label values beyond this many per metric are folded into "other" to bound cardinality
+MAX_LABEL_VALUES = 64
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+
+    def _key(self, labels):
+        values = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        if values not in self.samples and len(self.samples) >= MAX_LABEL_VALUES:
+            values = tuple('other' for _ in self.labelnames)
+        return values
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self.registry.lock:
+            key = self._key(labels)
+            self.samples[key] = self.samples.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        with self.registry.lock:
+            key = self._key(labels)
+            sample = self.samples.get(key)
+            if sample is None:
+                # Non-cumulative bucket counts, then +Inf, sum and count
+                sample = self.samples[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            sample[i] += 1
+            sample[-2] += value
+            sample[-1] += 1
+        self.registry.maybe_flush()
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        self.gauges = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        self._file = self._snapshot_name()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+        # A forked worker starts from zero; whatever the parent recorded stays in the parent's file
+        os.register_at_fork(after_in_child=self._reset)
+
+    @staticmethod
+    def _snapshot_name():
+        return f'{os.getpid()}-{time.time_ns()}.json'
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self._dirty = False
+        self._file = self._snapshot_name()
+        for metric in self.metrics.values():
+            metric.samples = {}
+
+    def counter(self, name, help, labelnames=()):
+        return self.metrics.setdefault(name, Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        """A value computed at scrape time by this process (not summed across workers)."""
+        self.gauges[name] = (help, fn)
+
+    def add_collector(self, fn):
+        """fn() returns {(name, help): value} of per-process counters that are summed across workers.
+
+        A labelled counter is keyed (name, help, labelnames) with a {label values tuple: value} dict.
+        """
+        self.collectors.append(fn)
+
+    def _snapshot(self):
+        with self.lock:
+            snap = {
+                m.name: {
+                    "type": m.type,
+                    "help": m.help,
+                    "labelnames": list(m.labelnames),
+                    "buckets": list(getattr(m, 'buckets', [])),
+                    "samples": [[list(k), v if isinstance(v, (int, float)) else list(v)] for k, v in m.samples.items()],
+                }
+                for m in self.metrics.values()
+            }
+        for collect in self.collectors:
+            for (name, help, *labelnames), value in collect().items():
+                labelnames = list(labelnames[0]) if labelnames else []
+                samples = [[list(k), v] for k, v in value.items()] if labelnames else [[[], value]]
+                snap[name] = {"type": "counter", "help": help, "labelnames": labelnames, "buckets": [], "samples": samples}
+        return snap
+
+    def maybe_flush(self):
+        # Updates only mark the registry dirty; a daemon thread per process writes the snapshot
+        self._dirty = True
+        if self.directory and self._flusher_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        self._dirty = False
+        path = os.path.join(self.directory, self._file)
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _collect_all(self):
+        if not self.directory:
+            return [self._snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced right now; its next version is picked up on the next scrape
+        return snapshots
+
+    def _merged(self):
+        merged = {}
+        for snap in self._collect_all():
+            for name, metric in snap.items():
+                target = merged.setdefault(name, dict(metric, samples={}))
+                for labels, value in metric["samples"]:
+                    key = tuple(labels)
+                    if key not in target["samples"]:
+                        target["samples"][key] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list):
+                        target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+                    else:
+                        target["samples"][key] += value
+        return merged
+
+    def samples(self, name):
+        """{label values tuple: value} of one metric, summed over processes."""
+        metric = self._merged().get(name)
+        return metric["samples"] if metric else {}
+
+    def exposition(self):
+        """Render all metrics, summed over processes, in Prometheus text format."""
+        merged = self._merged()
+        lines = []
+        for name in sorted(merged):
+            metric = merged[name]
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["type"]}')
+            for labels, value in sorted(metric["samples"].items()):
+                pairs = list(zip(metric["labelnames"], labels))
+                if metric["type"] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric["buckets"] + [math.inf], value):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else repr(float(bound))
+                        lines.append(f'{name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(pairs)} {value[-2]}')
+                    lines.append(f'{name}_count{_labels(pairs)} {value[-1]}')
+                else:
+                    lines.append(f'{name}{_labels(pairs)} {value}')
+
+        for name, (help, fn) in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'agripredict_stage_seconds', 'Time spent in each stage of a request', ['stage'])
+REQUEST_SECONDS = registry.histogram(
+    'agripredict_request_seconds', 'Total request latency', ['endpoint'])
+REQUESTS = registry.counter(
+    'agripredict_requests_total', 'Requests served', ['endpoint', 'status'])
+PREDICTIONS = registry.counter(
+    'agripredict_predictions_total', 'Yield predictions made', ['crop_type'])
+ERRORS = registry.counter(
+    'agripredict_errors_total', 'Requests that failed validation or prediction', ['endpoint'])
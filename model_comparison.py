@@ -1,12 +1,23 @@
+import argparse
+import os
+import time
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, GridSearchCV
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 import warnings
+from data_loader import load_dataset
+from model_registry import ModelRegistry
+from hyperparameter_search import HalvingSearch
+from prediction_intervals import residual_quantiles
+from streaming_ingest import STREAM_MEMORY_BUDGET_MB, StreamedDataset
+from validation import feature_ranges
+from drift_monitor import training_baseline
 
 # Try to import boosted trees, fall back to RF
 try:
@@ -19,78 +30,217 @@ except ImportError:
     LGBMRegressor = None
 from sklearn.ensemble import RandomForestRegressor
 
-df = pd.read_csv('crop_yield_dataset.csv')
-
-# Drop date column if present and handle NA
-df = df.drop(columns=['Date'], errors='ignore')
-df = df.dropna(subset=['Crop_Yield', 'Crop_Type'])
-for col in ['Soil_pH', 'Temperature', 'Humidity', 'Wind_Speed', 'N', 'P', 'K', 'Soil_Quality']:
-    if col in df:
-        df[col] = df[col].fillna(df[col].median())
-
 num_features = ['Soil_pH', 'Temperature', 'Humidity', 'Wind_Speed', 'N', 'P', 'K', 'Soil_Quality']
 cat_features = ['Crop_Type']  # You can add 'Soil_Type' here to compare
 target = 'Crop_Yield'
 
-X = df[num_features + cat_features]
-y = df[target]
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Preprocessing
-ct = ColumnTransformer([
-    ('num', StandardScaler(), num_features),
-    ('cat', OneHotEncoder(handle_unknown='ignore'), cat_features)
-])
+def available_candidates():
+    names = []
+    if XGBRegressor:
+        names.append('XGBoost')
+    if LGBMRegressor:
+        names.append('LightGBM')
+    # Always add Random Forest
+    names.append('RandomForest')
+    return names
 
-models = []
-# Add XGBoost if available
-if XGBRegressor:
-    xgb_pipe = Pipeline([
-        ('preprocess', ct),
-        ('reg', XGBRegressor(n_estimators=200, learning_rate=0.05, max_depth=8, subsample=0.9, n_jobs=-1, random_state=42))
+
+# Hyperparameters used when no search result is given
+DEFAULT_PARAMS = {
+    'XGBoost': dict(n_estimators=200, learning_rate=0.05, max_depth=8, subsample=0.9),
+    'LightGBM': dict(n_estimators=200, learning_rate=0.05, max_depth=8, subsample=0.9),
+    'RandomForest': dict(n_estimators=300, max_depth=12),
+}
+
+
+def build_regressor(name, n_jobs, params=None):
+    """The candidate regressor with the given (or default) hyperparameters and a fixed thread budget."""
+    params = dict(DEFAULT_PARAMS[name] if params is None else params, n_jobs=n_jobs, random_state=42)
+    if name == 'XGBoost':
+        return XGBRegressor(**params)
+    if name == 'LightGBM':
+        # LightGBM only bags rows when subsample_freq > 0; without it `subsample` does nothing.
+        # Set here so the search and the final fit build the same estimator.
+        params.setdefault('subsample_freq', 1)
+        params.setdefault('verbose', -1)
+        return LGBMRegressor(**params)
+    if name == 'RandomForest':
+        return RandomForestRegressor(**params)
+    raise ValueError(f"Unknown candidate {name}")
+
+
+def _as_array(data):
+    # Streamed design matrices are passed by path and memory-mapped in the worker instead of pickled
+    return np.load(data, mmap_mode='r') if isinstance(data, str) else data
+
+
+def fit_candidate(name, n_jobs, X_train, y_train, X_test, y_test, params=None):
+    """Fit one regressor on the already transformed design matrix; runs in a worker process."""
+    start = time.perf_counter()
+    X_train, y_train, X_test, y_test = (_as_array(a) for a in (X_train, y_train, X_test, y_test))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        reg = build_regressor(name, n_jobs, params)
+        reg.fit(X_train, y_train)
+        y_pred = reg.predict(X_test)
+    return {
+        "name": name,
+        "model": reg,
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def load_training_data(path='crop_yield_dataset.csv'):
+    # Typed, cached columns only; Date and Soil_Type are never read
+    df = load_dataset(path, columns=num_features + cat_features + [target])
+
+    # Handle NA
+    df = df.dropna(subset=['Crop_Yield', 'Crop_Type'])
+    for col in num_features:
+        if col in df:
+            df[col] = df[col].fillna(df[col].median())
+    return df[num_features + cat_features], df[target]
+
+
+def make_preprocessor():
+    return ColumnTransformer([
+        ('num', StandardScaler(), num_features),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), cat_features)
     ])
-    models.append(('XGBoost', xgb_pipe))
 
-# Add LightGBM if available
-if LGBMRegressor:
-    lgbm_pipe = Pipeline([
+
+def held_out_intervals(model, ct, Xt_test, y_test):
+    """Residual quantiles of the fitted regressor on the test split, for boosted-model intervals."""
+    Xt_test, y_test = np.asarray(_as_array(Xt_test)), np.asarray(_as_array(y_test))
+    # Recover each row's crop from its one-hot columns; rows of unknown crops have none set
+    categories = np.append(ct.named_transformers_['cat'].categories_[0].astype(object), None)
+    onehot = Xt_test[:, len(num_features):]
+    codes = np.where(onehot.any(axis=1), onehot.argmax(axis=1), len(categories) - 1)
+    return residual_quantiles(y_test, model.predict(Xt_test), categories[codes])
+
+
+def cpu_budget():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main(workers=None, output='crop_yield_best_model2.pkl', register=True, models=None, search=False,
+         search_candidates=16, search_folds=3, stream=False, memory_budget_mb=None):
+    if stream:
+        if search:
+            raise ValueError("--search needs the in-memory data; run it without --stream")
+        dataset = StreamedDataset('crop_yield_dataset.csv', num_features, cat_features[0], target,
+                                  budget_mb=memory_budget_mb or STREAM_MEMORY_BUDGET_MB).build()
+        ct = dataset.preprocessor(make_preprocessor)
+        # The regressors read the matrices straight from disk
+        Xt_train, y_train, Xt_test, y_test = (dataset.path(n) for n in ('X_train', 'y_train', 'X_test', 'y_test'))
+        n_train, n_test = dataset.meta['rows']['train'], dataset.meta['rows']['test']
+    else:
+        X, y = load_training_data()
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        n_train, n_test = len(X_train), len(X_test)
+
+    candidates = [name for name in available_candidates() if not models or name in models]
+    cpus = cpu_budget()
+    workers = max(1, min(workers or len(candidates), len(candidates), cpus))
+    # Split the cores between concurrently running candidates so they do not oversubscribe
+    threads = max(1, cpus // workers)
+
+    params = {}
+    searched = {}
+    if search:
+        # Tune on the training split only; the test split stays untouched for the comparison below
+        search_workers = max(1, min(cpus, search_folds * len(candidates)))
+        searched = HalvingSearch(candidates, build_regressor, make_preprocessor, n_candidates=search_candidates,
+                                 n_splits=search_folds, workers=search_workers,
+                                 threads=max(1, cpus // search_workers)).run(X_train, y_train)
+        params = {name: result['params'] for name, result in searched.items()}
+
+    if not stream:
+        # Fit the preprocessing once and hand every candidate the same design matrix
+        # instead of refitting an identical ColumnTransformer inside each Pipeline
+        ct = make_preprocessor()
+        Xt_train = ct.fit_transform(X_train)
+        Xt_test = ct.transform(X_test)
+
+    print(f"Comparing models ... ({len(candidates)} candidates, {workers} processes x {threads} threads)")
+    wall_start = time.perf_counter()
+    results = []
+    if workers == 1:
+        for name in candidates:
+            results.append(fit_candidate(name, threads, Xt_train, y_train, Xt_test, y_test, params.get(name)))
+            r = results[-1]
+            print(f"{r['name']}: MAE={r['mae']:.2f}, R2={r['r2']:.4f}, fit+score {r['seconds']:.1f}s")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fit_candidate, name, threads, Xt_train, y_train, Xt_test, y_test, params.get(name)) for name in candidates]
+            for future in as_completed(futures):
+                r = future.result()
+                results.append(r)
+                print(f"{r['name']}: MAE={r['mae']:.2f}, R2={r['r2']:.4f}, fit+score {r['seconds']:.1f}s")
+    print(f"All candidates done in {time.perf_counter() - wall_start:.1f}s wall-clock")
+
+    # Keep the original selection rule: best R2, ties broken by MAE, in candidate order
+    results.sort(key=lambda r: candidates.index(r['name']))
+    best = results[0]
+    for r in results[1:]:
+        if r['r2'] > best['r2'] or (r['r2'] == best['r2'] and r['mae'] < best['mae']):
+            best = r
+
+    best_model = Pipeline([
         ('preprocess', ct),
-        ('reg', LGBMRegressor(n_estimators=200, learning_rate=0.05, max_depth=8, subsample=0.9, n_jobs=-1, random_state=42))
+        ('reg', best['model'])
     ])
-    models.append(('LightGBM', lgbm_pipe))
-
-# Always add Random Forest
-rf_pipe = Pipeline([
-    ('preprocess', ct),
-    ('reg', RandomForestRegressor(n_estimators=300, max_depth=12, random_state=42, n_jobs=-1))
-])
-models.append(('RandomForest', rf_pipe))
-
-best_score = -np.inf
-best_mae = np.inf
-best_model = None
-best_name = ""
-
-print("Comparing models ...")
-for name, pipe in models:
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        pipe.fit(X_train, y_train)
-        y_pred = pipe.predict(X_test)
-        mae = mean_absolute_error(y_test, y_pred)
-        r2 = r2_score(y_test, y_pred)
-        print(f"{name}: MAE={mae:.2f}, R2={r2:.4f}")
-        if r2 > best_score or (r2 == best_score and mae < best_mae):
-            best_score = r2
-            best_mae = mae
-            best_model = pipe
-            best_name = name
-
-print(f"\nBest model: {best_name} (MAE={best_mae:.2f}, R2={best_score:.4f})")
-joblib.dump(best_model, 'crop_yield_best_model2.pkl')
-print(" Model and preprocessors saved as crop_yield_best_model2.pkl")
-
-# Demo prediction
-first = X_test.iloc[[0]]
-print("Sample prediction input:", first.to_dict(orient='records')[0])
-print("Pred:", best_model.predict(first)[0], "Actual:", y_test.iloc[0])
+    print(f"\nBest model: {best['name']} (MAE={best['mae']:.2f}, R2={best['r2']:.4f})")
+    joblib.dump(best_model, output)
+    print(f" Model and preprocessors saved as {output}")
+
+    if register:
+        # Register the run as a new version; running services pick it up without a restart
+        version = ModelRegistry().register(best_model, name=best['name'], metrics={"mae": best['mae'], "r2": best['r2']}, extra={
+            "features": num_features + cat_features,
+            "target": target,
+            "train_rows": n_train,
+            "test_rows": n_test,
+            "candidates": {r['name']: {"mae": r['mae'], "r2": r['r2'], "seconds": round(r['seconds'], 2)} for r in results},
+            "params": params.get(best['name'], DEFAULT_PARAMS[best['name']]),
+            "search": {name: {k: v for k, v in result.items() if k != 'params'} for name, result in searched.items()},
+            "intervals": held_out_intervals(best['model'], ct, Xt_test, y_test),
+            # Input range checks and drift baseline; after a streamed run the service computes them from the dataset
+            "feature_ranges": None if stream else feature_ranges(X_train),
+            "drift_baseline": None if stream else training_baseline(X_train),
+        })
+        print(f" Registered and activated model version {version}")
+
+    if stream:
+        return best_model
+
+    # Demo prediction
+    first = X_test.iloc[[0]]
+    print("Sample prediction input:", first.to_dict(orient='records')[0])
+    print("Pred:", best_model.predict(first)[0], "Actual:", y_test.iloc[0])
+    return best_model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train and compare yield regressors, keep the best one")
+    parser.add_argument('--workers', type=int, default=None, help="candidate models fitted in parallel (default: all)")
+    parser.add_argument('--output', default='crop_yield_best_model2.pkl')
+    parser.add_argument('--no-register', action='store_true', help="do not add the model to the registry")
+    parser.add_argument('--models', help="comma-separated subset of XGBoost,LightGBM,RandomForest")
+    parser.add_argument('--search', action='store_true', help="tune hyperparameters first (resumes from SEARCH_DIR)")
+    parser.add_argument('--search-candidates', type=int, default=16, help="random configurations per model")
+    parser.add_argument('--search-folds', type=int, default=3)
+    parser.add_argument('--stream', action='store_true', help="ingest the CSV in chunks into an on-disk design matrix")
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help="working-set budget for --stream ingestion (default STREAM_MEMORY_BUDGET_MB)")
+    args = parser.parse_args()
+    main(workers=args.workers, output=args.output, register=not args.no_register,
+         models=args.models.split(',') if args.models else None, search=args.search,
+         search_candidates=args.search_candidates, search_folds=args.search_folds, stream=args.stream,
+         memory_budget_mb=args.memory_budget_mb)
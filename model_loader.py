@@ -0,0 +1,239 @@
+import logging
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from fast_inference import compile_pipeline
+from prediction_intervals import build_interval_predictor
+from tree_engine import compile_trees
+from validation import build_validator
+from data_loader import file_sha256
+from model_registry import LEGACY_VERSION, ModelRegistry
+
+
+logger = logging.getLogger('agripredict.model')
+
+# Served when the registry has no active version
+MODEL_FILE = os.environ.get('MODEL_FILE', 'crop_yield_best_model2.pkl')
+# 'eager' loads at import time (and so in the gunicorn master when preload_app is on);
+# 'lazy' defers loading to the first request that needs the model
+MODEL_LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'eager')
+# Memory-map the large NumPy arrays inside the pickle instead of copying them onto the heap
+MODEL_MMAP = os.environ.get('MODEL_MMAP', '0') == '1'
+# How often (seconds) a worker checks the registry's ACTIVE file for a new version; 0 turns watching off
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+# 'trees' scores small batches and single rows with the flattened NumPy trees of tree_engine.py;
+# 'native' keeps the estimator's own predict
+INFERENCE_ENGINE = os.environ.get('INFERENCE_ENGINE', 'native')
+
+
+class LoadedModel:
+    """A fitted pipeline together with everything derived from it at load time."""
+
+    def __init__(self, version, path, pipeline, sha256, load_seconds, metadata=None):
+        self.version = version
+        self.path = path
+        self.pipeline = pipeline
+        self.sha256 = sha256
+        self.load_seconds = load_seconds
+        self.metadata = metadata or {"version": version}
+        self.loaded_at = time.time()
+        # Pandas-free single-row path built from the same pipeline (set FAST_INFERENCE=0 to disable)
+        self.fast = compile_pipeline(pipeline) if os.environ.get('FAST_INFERENCE', '1') != '0' else None
+        # What batch predictions call .predict(frame) on
+        self.predictor = pipeline
+        self.engine = 'native'
+        if INFERENCE_ENGINE == 'trees' and self.fast is not None:
+            trees = compile_trees(self.fast.regressor, self.fast.transform_arrays(*self._sample()))
+            if trees is not None:
+                self.fast.regressor = trees
+                self.predictor = self.fast
+                self.engine = 'trees'
+        # p10/p50/p90 for forests and boosted models with a calibration in their metadata; None when unavailable
+        self.intervals = build_interval_predictor(self.fast, self.metadata) if self.fast is not None else None
+        try:
+            categories = pipeline.named_steps['preprocess'].named_transformers_['cat'].categories_[0]
+        except (AttributeError, KeyError):
+            categories = []
+        # Input checks and crop-name normalisation for every prediction path
+        self.validator = build_validator(categories, self.metadata)
+
+    def _sample(self):
+        """Feature rows around the training mean, one per known crop, as (numeric, crops)."""
+        centre = self.fast.mean if self.fast.mean is not None else np.zeros(self.fast.n_num)
+        spread = self.fast.scale if self.fast.scale is not None else np.ones(self.fast.n_num)
+        offsets = np.linspace(-2, 2, 5)[:, None] * spread
+        numeric = np.vstack([centre + offsets for _ in self.fast.categories])
+        crops = [c for c in self.fast.categories for _ in offsets]
+        return numeric, crops
+
+    def warm_up(self):
+        """Run a few predictions so the first real request does not pay for lazy initialisation."""
+        if self.fast is None:
+            return
+        centre = self.fast.mean if self.fast.mean is not None else [0.0] * self.fast.n_num
+        rows = [dict(zip(self.fast.num_features, list(centre)), **{self.fast.cat_feature: c}) for c in self.fast.categories]
+        self.pipeline.predict(pd.DataFrame(rows))
+        self.fast.predict_row(rows[0])
+
+
+def load_model(path, version=LEGACY_VERSION, metadata=None, mmap=MODEL_MMAP):
+    start = time.perf_counter()
+    pipeline = joblib.load(path, mmap_mode='r' if mmap else None)
+    loaded = LoadedModel(version, path, pipeline, file_sha256(path), time.perf_counter() - start, metadata)
+    loaded.warm_up()
+    logger.info("Loaded model", extra={
+        "model_version": version, "model_path": path, "mmap": mmap, "load_seconds": round(loaded.load_seconds, 3)
+    })
+    return loaded
+
+
+class ModelLoader:
+    """Holds the process's current model, loads it eagerly or on first use, and hot-swaps it.
+
+    The model to serve is the registry's ACTIVE version, or MODEL_FILE when the
+    registry is empty. A new model is fully loaded and warmed up before it
+    replaces the current one in a single reference assignment, so requests in
+    flight finish on the model they started with. Callbacks registered with
+    on_load run after every successful load, e.g. to rebind caches.
+    """
+
+    def __init__(self, registry=None, fallback_path=MODEL_FILE, mode=MODEL_LOAD_MODE, mmap=MODEL_MMAP,
+                 watch_interval=MODEL_WATCH_INTERVAL):
+        if mode not in ('eager', 'lazy'):
+            raise ValueError(f"MODEL_LOAD_MODE must be 'eager' or 'lazy', not '{mode}'")
+        self.registry = registry or ModelRegistry()
+        self.fallback_path = fallback_path
+        self.mode = mode
+        self.mmap = mmap
+        self.watch_interval = watch_interval
+        self.current = None
+        self.error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._loading = None
+        self._loading_lock = threading.Lock()
+        self._next_check = 0.0
+        self._source = None
+        self._failed_source = None
+
+    def on_load(self, callback):
+        self._callbacks.append(callback)
+        if self.current is not None:
+            callback(self.current)
+
+    def start(self):
+        if self.mode == 'eager':
+            self.get()
+
+    def ready(self):
+        return self.current is not None
+
+    def resolve(self):
+        """(version, path, metadata) of the model that should be served right now."""
+        version = self.registry.active_version()
+        if version is None:
+            return LEGACY_VERSION, self.fallback_path, {"version": LEGACY_VERSION, "path": self.fallback_path}
+        return version, self.registry.model_path(version), self.registry.metadata(version)
+
+    def _signature(self, path):
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return path, None
+
+    def _load(self, version=None):
+        if version is None:
+            version, path, metadata = self.resolve()
+        else:
+            path, metadata = self.registry.model_path(version), self.registry.metadata(version)
+        try:
+            loaded = load_model(path, version, metadata, self.mmap)
+        except Exception:
+            # Remember the broken artifact so the watcher does not retry it every interval
+            self._failed_source = (version, self._signature(path))
+            raise
+        for callback in self._callbacks:
+            callback(loaded)
+        self._source = self._signature(path)
+        self.current = loaded
+        self.error = None
+        return loaded
+
+    def get(self):
+        current = self.current
+        if current is not None:
+            return current
+        with self._lock:
+            if self.current is None:
+                try:
+                    self._load()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+        return self.current
+
+    def reload(self, version=None):
+        """Load (and warm up) the given or currently active version, then swap it in."""
+        with self._lock:
+            try:
+                return self._load(version)
+            except Exception as e:
+                self.error = str(e)
+                logger.exception("Model reload failed; still serving the previous model")
+                raise
+
+    def load_in_background(self):
+        """Start loading or reloading on a background thread unless one is already running."""
+        with self._loading_lock:
+            if self._loading is not None and self._loading.is_alive():
+                return
+            self._loading = threading.Thread(target=self._load_quietly, name='model-load', daemon=True)
+            self._loading.start()
+
+    def _load_quietly(self):
+        try:
+            if self.current is None:
+                self.get()
+            else:
+                self.reload()
+        except Exception:
+            pass  # already logged and kept in self.error
+
+    def check_for_update(self):
+        """Cheap periodic check of the registry; starts a background reload when the active model changed."""
+        if not self.watch_interval or self.current is None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.watch_interval
+        version, path, _ = self.resolve()
+        signature = self._signature(path)
+        if (version, signature) == self._failed_source:
+            return
+        if version != self.current.version or signature != self._source:
+            logger.info("Active model changed, reloading", extra={"model_version": version})
+            self.load_in_background()
+
+    def status(self):
+        current = self.current
+        return {
+            "ready": current is not None,
+            "mode": self.mode,
+            "mmap": self.mmap,
+            "model_version": current.version if current else None,
+            "model_path": current.path if current else None,
+            "model_sha256": current.sha256 if current else None,
+            "load_seconds": round(current.load_seconds, 3) if current else None,
+            "fast_inference": bool(current and current.fast),
+            "inference_engine": current.engine if current else None,
+            "intervals": current.intervals.method if current and current.intervals else None,
+            "range_checks": current.validator.range_mode if current else None,
+            "error": self.error,
+            "pid": os.getpid(),
+        }
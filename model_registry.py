@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import joblib
+
+from data_loader import file_sha256
+
+
+MODEL_REGISTRY_DIR = os.environ.get(
+    'MODEL_REGISTRY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+LEGACY_VERSION = 'legacy'
+
+
+def _write_atomic(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class ModelRegistry:
+    """Versioned model artifacts on disk.
+
+    Layout:
+        <root>/<version>/model.pkl       the fitted pipeline (joblib)
+        <root>/<version>/metadata.json   name, metrics and data of the training run
+        <root>/ACTIVE                    the version every worker should serve
+
+    Versions are never modified after registration; switching models only
+    rewrites ACTIVE (atomically), which workers watch.
+    """
+
+    def __init__(self, root=MODEL_REGISTRY_DIR):
+        self.root = root
+
+    @property
+    def active_file(self):
+        return os.path.join(self.root, 'ACTIVE')
+
+    def model_path(self, version):
+        return os.path.join(self.root, version, 'model.pkl')
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(v for v in os.listdir(self.root) if os.path.isfile(self.model_path(v)))
+
+    def metadata(self, version):
+        path = os.path.join(self.root, version, 'metadata.json')
+        if not os.path.exists(path):
+            return {"version": version}
+        with open(path) as f:
+            return json.load(f)
+
+    def active_version(self):
+        try:
+            with open(self.active_file) as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        return version if version in self.versions() else None
+
+    def activate(self, version):
+        if version not in self.versions():
+            raise KeyError(f"Unknown model version '{version}'")
+        _write_atomic(self.active_file, version + '\n')
+
+    def register(self, pipeline, name, metrics=None, extra=None, activate=True):
+        """Save a fitted pipeline as a new version; returns the version string."""
+        os.makedirs(self.root, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        tmp_model = os.path.join(tmp_dir, 'model.pkl')
+        joblib.dump(pipeline, tmp_model)
+        sha256 = file_sha256(tmp_model)
+        version = f'{stamp}-{sha256[:8]}'
+        suffix = 1
+        while os.path.exists(os.path.join(self.root, version)):
+            suffix += 1
+            version = f'{stamp}-{sha256[:8]}-{suffix}'
+
+        metadata = {
+            "version": version,
+            "name": name,
+            "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "sha256": sha256,
+            "metrics": metrics or {},
+        }
+        metadata.update(extra or {})
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        # The version directory appears complete or not at all
+        os.replace(tmp_dir, os.path.join(self.root, version))
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def describe(self):
+        return {
+            "root": self.root,
+            "active": self.active_version(),
+            "versions": [self.metadata(v) for v in self.versions()],
+        }
+
+
+if __name__ == '__main__':
+    # python model_registry.py list | activate <version>
+    registry = ModelRegistry()
+    if len(sys.argv) >= 3 and sys.argv[1] == 'activate':
+        registry.activate(sys.argv[2])
+        print(f"Active model: {sys.argv[2]}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'list':
+        active = registry.active_version()
+        for v in registry.versions():
+            meta = registry.metadata(v)
+            print(f"{'*' if v == active else ' '} {v}  {meta.get('name', '')}  {meta.get('metrics', {})}")
+    else:
+        print("Usage: python model_registry.py list | activate <version>")
@@ -0,0 +1,236 @@
+import argparse
+import glob
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import merge_agri_datasets
+from data_loader import content_sha256, file_sha256
+
+
+# Partitions, per-step keys and the state file
+PIPELINE_CACHE_DIR = os.environ.get('PIPELINE_CACHE_DIR', '.pipeline_cache')
+# Bump to invalidate cached partitions after changing how a step computes them
+MERGE_VERSION = 1
+FEATURES_VERSION = 1
+
+MERGED_OUTPUT = 'final_agri_full_dataset.csv'
+FEATURES_OUTPUT = 'final_agri_features.csv'
+# Min-max scaled copies of these columns are added as <name>_norm (layout of final_expanded_cleaned.csv)
+NORM_COLUMNS = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'year']
+FEATURE_COLUMNS = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'crop_std', 'country', 'year', 'unit',
+                   'yield', 'yield_foodgrains', 'yield_oilseeds']
+
+
+def frame_hash(df):
+    """Content hash of a DataFrame: column names, dtypes and values, not the index."""
+    return content_sha256([list(map(str, df.columns)), [str(t) for t in df.dtypes]],
+                   pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+
+
+def partition_hashes(df, key='crop_std'):
+    return {str(crop): frame_hash(group) for crop, group in df.groupby(key, observed=True)}
+
+
+class PipelineRunner:
+    """Dependency-tracked rebuild of the merged dataset, its feature table and the model.
+
+    merge     the four source CSVs -> final_agri_full_dataset.csv, one cached
+              partition per crop. A partition's key is the hash of that crop's
+              rows in every source plus the merge options, so a change to some
+              crops' FAOSTAT rows only re-merges those crops.
+    features  the merged data with lower-case columns and min-max `_norm`
+              columns -> final_agri_features.csv. The min/max are global, so
+              they are combined from per-partition values first; partitions are
+              re-normalised only when their rows or the global ranges changed.
+    train     model_comparison.py, skipped when the hash of the training matrix
+              (features and target as loaded) and the training options match
+              the last run and its model file is unchanged.
+
+    Keys and output hashes are kept in <cache>/state.json.
+    """
+
+    def __init__(self, cache_dir=PIPELINE_CACHE_DIR, log=print):
+        self.cache_dir = cache_dir
+        self.log = log
+        self.state_path = os.path.join(cache_dir, 'state.json')
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def _partition_path(self, step, crop, key):
+        safe = ''.join(ch if ch.isalnum() else '_' for ch in crop)
+        return os.path.join(self.cache_dir, step, f'{safe}-{key[:16]}.pkl')
+
+    def _load_partition(self, step, crop, key):
+        path = self._partition_path(step, crop, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _save_partition(self, step, crop, key, value):
+        path = self._partition_path(step, crop, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Superseded versions of this crop's partition
+        for old in glob.glob(path.rsplit('-', 1)[0] + '-*.pkl'):
+            os.remove(old)
+        with open(path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _write_csv(df, path):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            df.to_csv(f, index=False)
+        os.replace(tmp, path)
+        return file_sha256(path)
+
+    @staticmethod
+    def _concat(parts):
+        # Partitions carry their own (different) categories; restore category columns after concatenating
+        if not parts:
+            return pd.DataFrame()
+        categorical = [c for c in parts[0].columns if isinstance(parts[0][c].dtype, pd.CategoricalDtype)]
+        out = pd.concat(parts, ignore_index=True)
+        for c in categorical:
+            out[c] = out[c].astype('category')
+        return out
+
+    def _output_current(self, step, path):
+        recorded = self.state.get(step, {}).get('output_sha256')
+        return recorded is not None and os.path.exists(path) and file_sha256(path) == recorded
+
+    def merge(self, max_fanout=None, year_aggregation=None, output=MERGED_OUTPUT, force=False):
+        start = time.perf_counter()
+        kaggle, faostat, foodgrains, oilseeds = merge_agri_datasets.prepare_sources(
+            *merge_agri_datasets.load_sources(), max_fanout, year_aggregation)
+        options = {"max_fanout": max_fanout, "year_aggregation": year_aggregation, "version": MERGE_VERSION}
+        sources = {name: partition_hashes(df) for name, df in
+                   (('kaggle', kaggle), ('faostat', faostat), ('foodgrains', foodgrains), ('oilseeds', oilseeds))}
+        crops = sorted(set(sources['kaggle']) & set(sources['faostat']))
+        keys = {crop: content_sha256(options, [sources[name].get(crop) for name in sorted(sources)]) for crop in crops}
+
+        previous = self.state.get('merge', {})
+        if not force and previous.get('partitions') == keys and self._output_current('merge', output):
+            self.log(f"merge: up to date ({len(crops)} crops)")
+            return False
+
+        parts, rebuilt = [], []
+        for crop in crops:
+            part = None if force else self._load_partition('merge', crop, keys[crop])
+            if part is None:
+                rows = [df[df['crop_std'] == crop] for df in (kaggle, faostat, foodgrains, oilseeds)]
+                part = merge_agri_datasets.merge_prepared(*rows, log=None)
+                part['crop_std'] = part['crop_std'].cat.remove_unused_categories()
+                self._save_partition('merge', crop, keys[crop], part)
+                rebuilt.append(crop)
+            parts.append(part)
+        merged = self._concat(parts)
+        self.state['merge'] = {"partitions": keys, "rows": len(merged), "output": output,
+                               "output_sha256": self._write_csv(merged, output)}
+        self.save_state()
+        self.log(f"merge: re-merged {len(rebuilt)}/{len(crops)} crops {rebuilt}, {len(merged)} rows -> {output} "
+                 f"({time.perf_counter() - start:.2f}s)")
+        return True
+
+    def features(self, output=FEATURES_OUTPUT, force=False):
+        start = time.perf_counter()
+        merge_state = self.state.get('merge')
+        if not merge_state:
+            raise RuntimeError("Run the merge step first")
+        keys = merge_state['partitions']
+
+        # Global min/max from cached per-partition ranges
+        tables, ranges = {}, {}
+        for crop, key in keys.items():
+            part = self._load_partition('merge', crop, key)
+            if part is None:
+                raise RuntimeError(f"Merged partition for '{crop}' is missing; rerun the merge step with --force")
+            table = part.rename(columns=str.lower)[FEATURE_COLUMNS]
+            tables[crop] = table
+            ranges[crop] = {c: [float(np.nanmin(table[c])), float(np.nanmax(table[c]))] for c in NORM_COLUMNS}
+        lo = {c: min(r[c][0] for r in ranges.values()) for c in NORM_COLUMNS}
+        hi = {c: max(r[c][1] for r in ranges.values()) for c in NORM_COLUMNS}
+        norm = {"min": lo, "max": hi, "version": FEATURES_VERSION}
+        feature_keys = {crop: content_sha256(key, norm) for crop, key in keys.items()}
+
+        previous = self.state.get('features', {})
+        if not force and previous.get('partitions') == feature_keys and self._output_current('features', output):
+            self.log(f"features: up to date ({len(keys)} crops)")
+            return False
+
+        parts, rebuilt = [], []
+        for crop in sorted(keys):
+            part = None if force else self._load_partition('features', crop, feature_keys[crop])
+            if part is None:
+                part = tables[crop].copy()
+                for c in NORM_COLUMNS:
+                    span = hi[c] - lo[c]
+                    part[f'{c}_norm'] = ((part[c] - lo[c]) / span if span else 0.0)
+                    part[f'{c}_norm'] = part[f'{c}_norm'].astype(np.float32)
+                self._save_partition('features', crop, feature_keys[crop], part)
+                rebuilt.append(crop)
+            parts.append(part)
+        table = self._concat(parts)
+        self.state['features'] = {"partitions": feature_keys, "norm": norm, "rows": len(table), "output": output,
+                                  "output_sha256": self._write_csv(table, output)}
+        self.save_state()
+        self.log(f"features: re-normalised {len(rebuilt)}/{len(keys)} crops {rebuilt} -> {output} "
+                 f"({time.perf_counter() - start:.2f}s)")
+        return True
+
+    def train(self, models=None, search=False, output='crop_yield_best_model2.pkl', register=True, force=False):
+        import model_comparison
+
+        X, y = model_comparison.load_training_data()
+        key = content_sha256(frame_hash(X), frame_hash(y.to_frame()), {"models": models, "search": search})
+        if not force and self.state.get('train', {}).get('matrix') == key and self._output_current('train', output):
+            self.log("train: training matrix unchanged, keeping the current model")
+            return False
+
+        model_comparison.main(output=output, register=register, models=models, search=search)
+        self.state['train'] = {"matrix": key, "output": output,
+                               "output_sha256": file_sha256(output)}
+        self.save_state()
+        return True
+
+
+STEPS = ['merge', 'features', 'train']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the merged dataset, feature table and model where inputs changed")
+    parser.add_argument('steps', nargs='*', default=STEPS, help=f"any of {', '.join(STEPS)} (default: all)")
+    parser.add_argument('--force', action='store_true', help="ignore cached partitions and keys")
+    parser.add_argument('--max-fanout', type=int, default=None)
+    parser.add_argument('--aggregate-years', choices=['mean', 'latest'], default=None)
+    parser.add_argument('--models', help="comma-separated subset of candidates to train")
+    parser.add_argument('--search', action='store_true', help="train with hyperparameter search")
+    parser.add_argument('--no-register', action='store_true')
+    args = parser.parse_args()
+    unknown = set(args.steps) - set(STEPS)
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(sorted(unknown))}")
+
+    runner = PipelineRunner()
+    if 'merge' in args.steps:
+        runner.merge(args.max_fanout, args.aggregate_years, force=args.force)
+    if 'features' in args.steps:
+        runner.features(force=args.force)
+    if 'train' in args.steps:
+        runner.train(models=args.models.split(',') if args.models else None, search=args.search,
+                     register=not args.no_register, force=args.force)
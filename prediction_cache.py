@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from batch_predict import NUM_FEATURES
+
+
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+# Round numeric features to this many decimals before keying; unset means exact values
+PREDICTION_CACHE_DECIMALS = os.environ.get('PREDICTION_CACHE_DECIMALS')
+
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of model outputs keyed on the canonical feature vector.
+
+    The cache is bound to one model by its file hash; binding a different hash
+    (a new or reloaded model) empties it, so stale predictions are never served.
+    """
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL, decimals=PREDICTION_CACHE_DECIMALS):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl) if ttl else None
+        self.decimals = int(decimals) if decimals not in (None, '') else None
+        self.model_hash = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def bind(self, model_hash):
+        with self._lock:
+            if model_hash != self.model_hash:
+                if self._data:
+                    self.invalidations += 1
+                self._data.clear()
+                self.model_hash = model_hash
+
+    def key(self, values):
+        numbers = (float(values[name]) for name in NUM_FEATURES)
+        if self.decimals is not None:
+            numbers = (round(x, self.decimals) for x in numbers)
+        # Crop_Type arrives as the validator's canonical (encoder) spelling,
+        # so 'wheat', 'Wheat' and other aliases share one slot
+        return tuple(numbers) + (str(values['Crop_Type']).strip(),)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, values, compute, model_hash=None):
+        # The model hash is part of the key so a request still running on the
+        # previous model during a hot swap cannot store or read across models
+        key = (model_hash,) + self.key(values)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "decimals": self.decimals,
+                "model_hash": self.model_hash,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,144 @@
+"""p10/p50/p90 yield intervals for tree-ensemble models.
+
+Forests: the per-tree predictions are read out in one pass over the flattened
+trees (tree_engine.TreeEnsemble.leaves) and their quantiles taken row-wise.
+Boosted models: the trees are additive corrections, so their outputs say
+nothing about spread on their own. The point estimate is shifted by the
+quantiles of the held-out residuals (y - prediction), per crop where the
+held-out split had enough rows. model_comparison.py stores these in the
+registry metadata ("intervals"); a model file trained elsewhere gets them with
+
+    python prediction_intervals.py calibrate [model.pkl]
+
+which registers it as a new version with that metadata. Served from outside
+the registry, a boosted model has no intervals. Bounds are the model's own
+output; negative ones are reported as 0 only with CLIP_NEGATIVE_YIELDS=1.
+"""
+import logging
+import sys
+
+import numpy as np
+
+from batch_predict import clip_yields
+from tree_engine import TreeEngineRegressor, export_trees
+
+
+logger = logging.getLogger('agripredict.inference')
+
+QUANTILES = (0.1, 0.5, 0.9)
+QUANTILE_NAMES = tuple(f"p{round(q * 100)}" for q in QUANTILES)
+# Crops with fewer held-out rows than this use the overall residual quantiles
+MIN_CROP_ROWS = 50
+
+
+def residual_quantiles(y_true, y_pred, crops, quantiles=QUANTILES, min_rows=MIN_CROP_ROWS):
+    """Calibration for boosted models: quantiles of y_true - y_pred, overall and per crop."""
+    residuals = np.asarray(y_true, dtype=np.float64) - np.asarray(y_pred, dtype=np.float64)
+    crops = np.asarray(crops, dtype=object)
+    per_crop = {}
+    for crop in np.unique(crops):
+        mine = residuals[crops == crop]
+        if len(mine) >= min_rows:
+            per_crop[str(crop)] = np.quantile(mine, quantiles).round(6).tolist()
+    return {
+        "method": "residual",
+        "quantiles": list(quantiles),
+        "rows": int(len(residuals)),
+        "overall": np.quantile(residuals, quantiles).round(6).tolist(),
+        "per_crop": per_crop,
+    }
+
+
+class IntervalPredictor:
+    """Point estimate and p10/p50/p90 from the raw features, for one loaded model.
+
+    Uses the model's CompiledPipeline for preprocessing, then either the
+    forest's flattened trees (`engine`) or the residual `calibration` of a
+    boosted model.
+    """
+
+    def __init__(self, fast, engine=None, calibration=None):
+        self.fast = fast
+        self.engine = engine
+        self.method = 'trees' if engine is not None else 'residual'
+        self.crop_codes = {c: i for i, c in enumerate(fast.categories)}
+        if engine is None:
+            if list(calibration['quantiles']) != list(QUANTILES):
+                raise ValueError(f"Calibration has quantiles {calibration['quantiles']}, expected {list(QUANTILES)}")
+            # Row i: residual quantiles of category i; the last row, for unknown crops, the overall ones
+            overall = calibration['overall']
+            per_crop = {c.lower(): q for c, q in calibration.get('per_crop', {}).items()}
+            self.offsets = np.array([per_crop.get(c.lower(), overall) for c in fast.categories] + [overall])
+
+    def predict(self, X, crops):
+        """(point, intervals) for a design matrix and its rows' crops; intervals is (n, 3): p10, p50, p90."""
+        if self.engine is not None:
+            trees = self.engine.leaves(X)
+            point = trees.sum(axis=1) / self.engine.n_trees + self.engine.base
+            intervals = np.quantile(trees, QUANTILES, axis=1).T + self.engine.base
+        else:
+            point = np.asarray(self.fast.regressor.predict(X), dtype=np.float64)
+            codes = np.fromiter((self.crop_codes.get(c, -1) for c in crops), dtype=np.intp, count=len(point))
+            intervals = point[:, None] + self.offsets[codes]
+        return point, intervals
+
+    def predict_arrays(self, numeric, crops):
+        return self.predict(self.fast.transform_arrays(numeric, crops), crops)
+
+    def predict_row(self, values):
+        """p10/p50/p90 dict for one feature dict."""
+        _, intervals = self.predict(self.fast.transform_row(values), [values[self.fast.cat_feature]])
+        return dict(zip(QUANTILE_NAMES, clip_yields(intervals[0]).round(2).tolist()))
+
+
+def build_interval_predictor(fast, metadata=None):
+    """IntervalPredictor for a loaded model's CompiledPipeline, or None when it cannot give intervals."""
+    regressor = fast.regressor
+    try:
+        # Reuse the trees already flattened for INFERENCE_ENGINE=trees
+        engine = regressor.engine if isinstance(regressor, TreeEngineRegressor) else export_trees(regressor)
+    except (ValueError, AttributeError, KeyError) as e:
+        logger.info("Prediction intervals unavailable: %s", e)
+        return None
+    if engine.average:
+        return IntervalPredictor(fast, engine=engine)
+    calibration = (metadata or {}).get('intervals')
+    if not calibration:
+        logger.info("Prediction intervals unavailable: no residual calibration in this boosted model's metadata")
+        return None
+    return IntervalPredictor(fast, calibration=calibration)
+
+
+def calibrate(model_path, registry=None):
+    """Register a fitted pipeline with model_comparison's held-out calibration; returns (version, calibration)."""
+    import joblib
+    from sklearn.model_selection import train_test_split
+
+    import model_comparison
+    from drift_monitor import training_baseline
+    from model_registry import ModelRegistry
+    from validation import feature_ranges
+
+    model = joblib.load(model_path)
+    X, y = model_comparison.load_training_data()
+    # The same split model_comparison.py trains on, so the residuals are out of sample
+    X_train, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    ct = model.named_steps['preprocess']
+    calibration = model_comparison.held_out_intervals(model.steps[-1][1], ct, ct.transform(X_test), y_test)
+    version = (registry or ModelRegistry()).register(model, name=type(model.steps[-1][1]).__name__, extra={
+        "source": model_path,
+        "intervals": calibration,
+        "feature_ranges": feature_ranges(X_train),
+        "drift_baseline": training_baseline(X_train),
+    })
+    return version, calibration
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'calibrate':
+        version, calibration = calibrate(sys.argv[2] if len(sys.argv) > 2 else 'crop_yield_best_model2.pkl')
+        print(f"Residual quantiles {dict(zip(QUANTILE_NAMES, calibration['overall']))} "
+              f"({calibration['rows']} held-out rows, {len(calibration['per_crop'])} crops); "
+              f"registered and activated model version {version}")
+    else:
+        print("Usage: python prediction_intervals.py calibrate [model.pkl]")
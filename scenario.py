@@ -0,0 +1,118 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import NUM_FEATURES, clip_yields
+
+
+# Largest grid one request may ask for
+SCENARIO_MAX_CELLS = int(os.environ.get('SCENARIO_MAX_CELLS', 250000))
+# Grid rows scored per model call; bounds the design matrix held in memory at once
+SCENARIO_CHUNK_ROWS = int(os.environ.get('SCENARIO_CHUNK_ROWS', 20000))
+MAX_AXES = 2
+
+
+class ScenarioError(ValueError):
+    """Raised when a scenario request cannot be turned into a grid"""
+
+
+def axis_values(spec):
+    """Values of one sweep axis: an explicit `values` list, or start..stop (inclusive) by step."""
+    if 'values' in spec:
+        try:
+            values = np.asarray(spec['values'], dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ScenarioError(f"{spec.get('feature')}: values must be numbers")
+        if values.ndim != 1 or not len(values):
+            raise ScenarioError(f"{spec.get('feature')}: values must be a non-empty list")
+    else:
+        try:
+            start, stop, step = (float(spec[k]) for k in ('start', 'stop', 'step'))
+        except KeyError as e:
+            raise ScenarioError(f"{spec.get('feature')}: give either values or start, stop and step (missing {e})")
+        except (TypeError, ValueError):
+            raise ScenarioError(f"{spec.get('feature')}: start, stop and step must be numbers")
+        if not all(map(math.isfinite, (start, stop, step))):
+            raise ScenarioError(f"{spec.get('feature')}: start, stop and step must be finite")
+        if step <= 0 or stop < start:
+            raise ScenarioError(f"{spec.get('feature')}: need step > 0 and stop >= start")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if count > SCENARIO_MAX_CELLS:
+            raise ScenarioError(f"{spec.get('feature')}: {count} values, the limit is {SCENARIO_MAX_CELLS} cells")
+        # Computed from the index rather than by accumulation, so 4.5 + 14 * 0.25 is exactly 8.0
+        values = np.round(start + step * np.arange(count), 10)
+    if not np.isfinite(values).all():
+        raise ScenarioError(f"{spec.get('feature')}: values must be finite")
+    return values
+
+
+def parse_scenario(payload, validator):
+    """(base feature dict, [(feature, values), ...], warnings) from a request body.
+
+    The base row and every axis value go through the model's InputValidator;
+    raises ValidationError for a bad base row and ScenarioError for the rest.
+    """
+    if not isinstance(payload, dict):
+        raise ScenarioError("Expected a JSON object with 'base' and 'axes'")
+    base, axes = payload.get('base'), payload.get('axes')
+    if not isinstance(base, dict):
+        raise ScenarioError("'base' must be an object with the nine features")
+    row, warnings = validator.validate_row(base)
+
+    if not isinstance(axes, list) or not 1 <= len(axes) <= MAX_AXES:
+        raise ScenarioError(f"'axes' must be a list of 1 to {MAX_AXES} sweeps")
+    sweeps = []
+    for spec in axes:
+        if not isinstance(spec, dict) or spec.get('feature') not in NUM_FEATURES:
+            raise ScenarioError(f"Each axis needs a 'feature', one of {', '.join(NUM_FEATURES)}")
+        if spec['feature'] in (f for f, _ in sweeps):
+            raise ScenarioError(f"{spec['feature']} is swept twice")
+        sweeps.append((spec['feature'], axis_values(spec)))
+    cells = int(np.prod([len(v) for _, v in sweeps]))
+    if cells > SCENARIO_MAX_CELLS:
+        raise ScenarioError(f"Grid has {cells} cells, the limit is {SCENARIO_MAX_CELLS}")
+    for feature, values in sweeps:
+        # Each axis alone, against the base row; warnings for an axis name its first flagged value
+        block = np.tile(np.array([row[f] for f in NUM_FEATURES]), (len(values), 1))
+        block[:, NUM_FEATURES.index(feature)] = values
+        errors, axis_warnings = validator.check_numeric(block)
+        if feature in errors:
+            mask, messages = errors[feature]
+            first = int(np.argmax(mask))
+            raise ScenarioError(f"{feature}: {values[first]:g} {messages[first]}")
+        warnings.pop(feature, None)
+        if feature in axis_warnings:
+            mask, message = axis_warnings[feature]
+            warnings[feature] = f"{np.count_nonzero(mask)} of {len(values)} values {message}"
+    return row, sweeps, warnings
+
+
+def grid_block(row, sweeps, start, stop):
+    """Numeric features of grid cells start..stop (row-major over the axes) as an (n, 8) array."""
+    shape = [len(v) for _, v in sweeps]
+    block = np.tile(np.array([row[f] for f in NUM_FEATURES]), (stop - start, 1))
+    index = np.unravel_index(np.arange(start, stop), shape)
+    for (feature, values), positions in zip(sweeps, index):
+        block[:, NUM_FEATURES.index(feature)] = values[positions]
+    return block
+
+
+def sweep(loaded, row, sweeps, chunk_rows=None):
+    """Predicted yield over the whole grid, shaped like the axes, scored in chunks of grid rows."""
+    chunk_rows = chunk_rows or SCENARIO_CHUNK_ROWS
+    shape = [len(v) for _, v in sweeps]
+    cells = int(np.prod(shape))
+    out = np.empty(cells, dtype=np.float64)
+    for start in range(0, cells, chunk_rows):
+        stop = min(start + chunk_rows, cells)
+        block = grid_block(row, sweeps, start, stop)
+        crops = [row['Crop_Type']] * len(block)
+        if loaded.fast is not None:
+            out[start:stop] = loaded.fast.predict_arrays(block, crops)
+        else:
+            frame = pd.DataFrame(block, columns=NUM_FEATURES)
+            frame['Crop_Type'] = crops
+            out[start:stop] = loaded.pipeline.predict(frame)
+    return clip_yields(out).reshape(shape)
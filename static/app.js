@@ -0,0 +1,135 @@
+function showTab(tab) {
+  const predictSection = document.getElementById('predict-section');
+  const historySection = document.getElementById('history-section');
+  const buttons = document.querySelectorAll('.nav-btn');
+  if (tab === 'predict') {
+    historySection.classList.add('slide-out');
+    historySection.classList.remove('slide-in');
+    predictSection.classList.remove('slide-out');
+    predictSection.classList.add('slide-in');
+    buttons[0].classList.add('active');
+    buttons[1].classList.remove('active');
+  } else {
+    predictSection.classList.add('slide-out');
+    predictSection.classList.remove('slide-in');
+    historySection.classList.remove('slide-out');
+    historySection.classList.add('slide-in');
+    buttons[0].classList.remove('active');
+    buttons[1].classList.add('active');
+    loadHistory();
+  }
+}
+let historyCursor = null;
+function historyRow(record) {
+  return `
+        <tr style="border-bottom: 1px solid rgba(255,124,188,0.12);">
+          <td style="padding: 12px;">${record.date || 'N/A'}</td>
+          <td style="padding: 12px;">${record.Crop_Type || 'N/A'}</td>
+          <td style="padding: 12px;">${record.N || 0}-${record.P || 0}-${record.K || 0}</td>
+          <td style="padding: 12px;">${record.Soil_pH || 'N/A'}</td>
+          <td style="padding: 12px;">${record.Soil_Quality || 'N/A'}</td>
+          <td style="padding: 12px; color: #fb5693; font-weight: 600;">${record.yield || 'N/A'} tons/ha</td>
+        </tr>
+      `;
+}
+async function fetchHistoryPage(cursor) {
+  const params = new URLSearchParams({ limit: 50 });
+  if (cursor) params.set('cursor', cursor);
+  const response = await fetch(`/api/history?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const data = await response.json();
+  // Check if there's an error in the response
+  if (data.error) {
+    throw new Error(data.error);
+  }
+  historyCursor = data.next_cursor;
+  document.getElementById('history-more').style.display = historyCursor ? 'flex' : 'none';
+  return data.records;
+}
+async function loadHistory() {
+  const content = document.getElementById('history-content');
+  try {
+    historyCursor = null;
+    const history = await fetchHistoryPage(null);
+    if (!history || history.length === 0) {
+      content.innerHTML = `
+        <div class="empty-state">
+          <div class="empty-state-icon">📋</div>
+          <p>No predictions yet</p>
+        </div>
+      `;
+      return;
+    }
+    let html = '<div style="overflow-x: auto;"><table style="width: 100%; border-collapse: collapse;">';
+    html += `
+      <thead>
+        <tr style="border-bottom: 1px solid rgba(255,124,188,0.14);">
+          <th style="padding: 12px; text-align: left;">Date</th>
+          <th style="padding: 12px; text-align: left;">Crop</th>
+          <th style="padding: 12px; text-align: left;">N-P-K</th>
+          <th style="padding: 12px; text-align: left;">Soil pH</th>
+          <th style="padding: 12px; text-align: left;">Soil Quality</th>
+          <th style="padding: 12px; text-align: left;">Yield</th>
+        </tr>
+      </thead>
+      <tbody id="history-rows">
+    `;
+    html += history.map(historyRow).join('');
+    html += '</tbody></table></div>';
+    content.innerHTML = html;
+  } catch (error) {
+    console.error('Error loading history:', error);
+    content.innerHTML = `
+      <div class="empty-state">
+        <div class="empty-state-icon">⚠️</div>
+        <p>Error loading history: ${error.message}</p>
+        <p style="font-size: 12px; margin-top: 8px;">Check browser console for details</p>
+      </div>
+    `;
+  }
+}
+async function loadMoreHistory() {
+  if (!historyCursor) return;
+  try {
+    const history = await fetchHistoryPage(historyCursor);
+    document.getElementById('history-rows').insertAdjacentHTML('beforeend', history.map(historyRow).join(''));
+  } catch (error) {
+    console.error('Error loading history:', error);
+  }
+}
+
+// Count the predicted yield and soil quality bar up from zero after a prediction
+function animateResults() {
+  const yieldElement = document.getElementById('yield-value');
+  if (yieldElement) {
+    const targetYield = parseFloat(yieldElement.dataset.target);
+    let currentYield = 0;
+    const step = targetYield / 50;
+    const animateYield = () => {
+      if (currentYield < targetYield) {
+        currentYield = Math.min(currentYield + step, targetYield);
+        yieldElement.textContent = currentYield.toFixed(2);
+        requestAnimationFrame(animateYield);
+      }
+    };
+    setTimeout(animateYield, 300);
+  }
+  const progressFill = document.getElementById('progress-fill');
+  if (progressFill) {
+    const targetPercentage = parseFloat(progressFill.dataset.target);
+    const percentageText = document.getElementById('quality-percentage');
+    let currentPercentage = 0;
+    const animate = () => {
+      if (currentPercentage < targetPercentage) {
+        currentPercentage += 1;
+        percentageText.textContent = `${currentPercentage}%`;
+        progressFill.style.width = `${currentPercentage}%`;
+        requestAnimationFrame(animate);
+      }
+    };
+    setTimeout(animate, 300);
+  }
+}
+document.addEventListener('DOMContentLoaded', animateResults);
@@ -0,0 +1,72 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StaticAssets:
+    """CSS/JS served from memory, compressed once at startup.
+
+    Every file gets a content hash used both as its ETag and as a '?v=' cache
+    buster in URLs, so versioned URLs can be cached by browsers indefinitely.
+    gzip (and brotli, when the 'brotli' package is installed) bodies are built
+    once instead of per request.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, directory).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                variants = {'identity': body}
+                variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    variants['br'] = brotli.compress(body, quality=11)
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                self.assets[name] = {
+                    'etag': hashlib.sha256(body).hexdigest()[:16],
+                    'mimetype': mimetype,
+                    'variants': variants,
+                }
+
+    def url(self, name):
+        return f"/static/{name}?v={self.assets[name]['etag']}"
+
+    def response(self, name, req):
+        asset = self.assets.get(name)
+        if asset is None:
+            return Response('Not found', status=404)
+
+        if req.args.get('v') == asset['etag']:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'public, max-age=300'
+
+        if req.if_none_match.contains_weak(asset['etag']):
+            response = Response(status=304)
+        else:
+            encoding = 'identity'
+            for candidate in ('br', 'gzip'):
+                if candidate in asset['variants'] and req.accept_encodings[candidate]:
+                    encoding = candidate
+                    break
+            response = Response(asset['variants'][encoding], mimetype=asset['mimetype'])
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+
+        # The same weak ETag covers every encoding of the file
+        response.set_etag(asset['etag'], weak=True)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
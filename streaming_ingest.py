@@ -0,0 +1,263 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_CACHE_DIR
+
+
+# Working-set budget for ingestion: raw chunk, parsed frame and transformed block together
+STREAM_MEMORY_BUDGET_MB = float(os.environ.get('STREAM_MEMORY_BUDGET_MB', 256))
+# Values kept per column for the approximate medians; below this many rows the median is exact
+RESERVOIR_SIZE = int(os.environ.get('STREAM_RESERVOIR_SIZE', 100_000))
+MIN_CHUNK_ROWS = 1_000
+MAX_CHUNK_ROWS = 2_000_000
+
+
+class RunningStats:
+    """Count, mean and sum of squared deviations, merged chunk by chunk (Chan et al.)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        values = values[~np.isnan(values)].astype(np.float64)
+        if len(values):
+            mean = values.mean()
+            self.merge(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count else 0.0
+
+
+class Reservoir:
+    """Uniform fixed-size sample of a stream (algorithm R), vectorised per chunk."""
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=0):
+        self.size = size
+        self.sample = np.empty(size, dtype=np.float64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        n = len(values)
+        fill = min(max(self.size - self.seen, 0), n)
+        self.sample[self.seen:self.seen + fill] = values[:fill]
+        if n > fill:
+            # Item number t (0-based) replaces a random slot with probability size / (t + 1)
+            positions = np.arange(self.seen + fill, self.seen + n)
+            slots = (self.rng.random(n - fill) * (positions + 1)).astype(np.int64)
+            keep = slots < self.size
+            self.sample[slots[keep]] = values[fill:][keep]
+        self.seen += n
+
+    def quantile(self, q):
+        filled = self.sample[:min(self.seen, self.size)]
+        return float(np.quantile(filled, q)) if len(filled) else float('nan')
+
+
+def plan_chunk_rows(path, usecols, n_out, budget_mb=STREAM_MEMORY_BUDGET_MB):
+    """Rows per chunk so that one chunk's text, frame and output block fit in the budget."""
+    sample = pd.read_csv(path, usecols=usecols, nrows=MIN_CHUNK_ROWS)
+    if sample.empty:
+        return MIN_CHUNK_ROWS
+    frame_bytes = sample.memory_usage(deep=True).sum() / len(sample)
+    with open(path, 'rb') as f:
+        f.readline()
+        text_bytes = len(b''.join(f.readline() for _ in range(len(sample)))) / len(sample)
+    # The parser holds the text and its own buffers while building the frame; the
+    # transformed block is written out before the next chunk is read
+    per_row = 2 * text_bytes + 2 * frame_bytes + n_out * 4 + 16
+    return int(min(MAX_CHUNK_ROWS, max(MIN_CHUNK_ROWS, budget_mb * 1024 * 1024 / per_row)))
+
+
+def _split(rng, n, test_size):
+    return rng.random(n) < test_size
+
+
+class StreamedDataset:
+    """A preprocessed train/test design matrix on disk, built without loading the CSV at once.
+
+    Pass 1 streams the CSV in chunks and keeps only per-column statistics:
+    medians for filling missing values (exact up to RESERVOIR_SIZE rows,
+    reservoir-sampled beyond), the StandardScaler mean and variance of the
+    training rows, and the crop categories. Pass 2 streams it again, applies
+    the fill, scaling and one-hot encoding with NumPy and appends each block
+    to .npy files, which the regressors then read through np.load(mmap_mode='r').
+    Rows are assigned to the test split by a seeded random draw per row, so
+    both passes (and later runs) agree on the split whatever the chunk size.
+    """
+
+    def __init__(self, source, num_features, cat_feature, target, directory=None, test_size=0.2, seed=42,
+                 budget_mb=STREAM_MEMORY_BUDGET_MB):
+        self.source = source
+        self.num_features = list(num_features)
+        self.cat_feature = cat_feature
+        self.target = target
+        self.directory = directory or os.path.join(
+            DATA_CACHE_DIR, 'design-' + os.path.splitext(os.path.basename(source))[0])
+        self.test_size = test_size
+        self.seed = seed
+        self.budget_mb = budget_mb
+        self.meta = None
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.npy')
+
+    def _settings(self):
+        st = os.stat(self.source)
+        return {
+            "source": os.path.abspath(self.source), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "num_features": self.num_features, "cat_feature": self.cat_feature, "target": self.target,
+            "test_size": self.test_size, "seed": self.seed, "reservoir": RESERVOIR_SIZE,
+        }
+
+    def _read(self, chunk_rows):
+        dtypes = dict({c: np.float32 for c in self.num_features + [self.target]}, **{self.cat_feature: object})
+        return pd.read_csv(self.source, usecols=self.num_features + [self.cat_feature, self.target],
+                           dtype=dtypes, chunksize=chunk_rows)
+
+    def _clean(self, chunk):
+        return chunk[chunk[self.target].notna() & chunk[self.cat_feature].notna()]
+
+    def build(self, log=print):
+        """Run both passes unless an up-to-date matrix for the same source and settings exists."""
+        meta_path = os.path.join(self.directory, 'meta.json')
+        settings = self._settings()
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('settings') == settings and all(os.path.exists(self.path(n)) for n in meta['arrays']):
+                self.meta = meta
+                log(f"Reusing design matrix in {self.directory}")
+                return self
+        os.makedirs(self.directory, exist_ok=True)
+
+        start = time.perf_counter()
+        n_num = len(self.num_features)
+        # Output width is unknown until the categories are; plan for a generous one-hot block
+        chunk_rows = plan_chunk_rows(self.source, self.num_features + [self.cat_feature, self.target], n_num + 64,
+                                     self.budget_mb)
+
+        # Pass 1: statistics only
+        medians = [Reservoir(seed=self.seed + i) for i in range(n_num)]
+        stats = [RunningStats() for _ in range(n_num)]
+        missing = np.zeros(n_num, dtype=np.int64)
+        categories = set()
+        n_train = n_test = dropped = 0
+        rng = np.random.default_rng(self.seed)
+        for chunk in self._read(chunk_rows):
+            kept = self._clean(chunk)
+            dropped += len(chunk) - len(kept)
+            is_test = _split(rng, len(kept), self.test_size)
+            train = kept[~is_test]
+            n_test += int(is_test.sum())
+            n_train += len(train)
+            categories.update(train[self.cat_feature].unique())
+            for i, col in enumerate(self.num_features):
+                medians[i].update(kept[col].to_numpy())
+                values = train[col].to_numpy()
+                stats[i].update(values)
+                missing[i] += int(np.isnan(values).sum())
+
+        fill = np.array([m.quantile(0.5) for m in medians])
+        for i, s in enumerate(stats):
+            # Missing training values become the median before scaling, exactly as the in-memory path does
+            s.merge(int(missing[i]), fill[i], 0.0)
+        categories = sorted(categories)
+        mean = np.array([s.mean for s in stats])
+        var = np.array([s.var for s in stats])
+        scale = np.sqrt(var)
+        scale[scale == 0] = 1.0
+        n_out = n_num + len(categories)
+        log(f"Pass 1: {n_train} train / {n_test} test rows ({dropped} dropped), {len(categories)} categories, "
+            f"{chunk_rows} rows per chunk, {time.perf_counter() - start:.1f}s")
+
+        # Pass 2: transform and append to the .npy files
+        index = {c: i for i, c in enumerate(categories)}
+        files = {
+            'X_train': self._open(self.path('X_train'), (n_train, n_out)),
+            'X_test': self._open(self.path('X_test'), (n_test, n_out)),
+            'y_train': self._open(self.path('y_train'), (n_train,)),
+            'y_test': self._open(self.path('y_test'), (n_test,)),
+        }
+        rng = np.random.default_rng(self.seed)
+        try:
+            for chunk in self._read(chunk_rows):
+                kept = self._clean(chunk)
+                is_test = _split(rng, len(kept), self.test_size)
+                numeric = kept[self.num_features].to_numpy(dtype=np.float64)
+                nan_rows, nan_cols = np.nonzero(np.isnan(numeric))
+                numeric[nan_rows, nan_cols] = fill[nan_cols]
+                block = np.zeros((len(kept), n_out), dtype=np.float32)
+                block[:, :n_num] = (numeric - mean) / scale
+                codes = kept[self.cat_feature].map(index).to_numpy(dtype=np.float64)
+                known = ~np.isnan(codes)  # categories seen only in test rows encode to all zeros
+                block[np.nonzero(known)[0], n_num + codes[known].astype(np.int64)] = 1.0
+                target = kept[self.target].to_numpy(dtype=np.float32)
+                files['X_train'].write(block[~is_test].tobytes())
+                files['X_test'].write(block[is_test].tobytes())
+                files['y_train'].write(target[~is_test].tobytes())
+                files['y_test'].write(target[is_test].tobytes())
+        finally:
+            for f in files.values():
+                f.close()
+
+        self.meta = {
+            "settings": settings, "arrays": list(files), "rows": {"train": n_train, "test": n_test, "dropped": dropped},
+            "chunk_rows": chunk_rows, "medians": fill.tolist(), "mean": mean.tolist(), "var": var.tolist(),
+            "categories": categories,
+        }
+        with open(meta_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        log(f"Pass 2: design matrix {n_train + n_test} x {n_out} written to {self.directory}, "
+            f"{time.perf_counter() - start:.1f}s total")
+        return self
+
+    @staticmethod
+    def _open(path, shape):
+        # A plain append-only file rather than a writable memmap, so written pages do not
+        # count towards the process's resident set
+        f = open(path, 'wb')
+        np.lib.format.write_array_header_2_0(
+            f, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)), 'fortran_order': False, 'shape': shape})
+        return f
+
+    def arrays(self):
+        """(X_train, y_train, X_test, y_test) as read-only memory maps."""
+        return tuple(np.load(self.path(n), mmap_mode='r') for n in ('X_train', 'y_train', 'X_test', 'y_test'))
+
+    def preprocessor(self, make_preprocessor):
+        """A ColumnTransformer from make_preprocessor() carrying the streamed statistics.
+
+        It is fitted on one placeholder row per category (which sets up column
+        bookkeeping and the encoder's categories) and the scaler's statistics are
+        then replaced, so it transforms raw rows the same way as the matrix on disk.
+        """
+        meta = self.meta
+        stub = pd.DataFrame({c: [m] * len(meta['categories']) for c, m in zip(self.num_features, meta['medians'])})
+        stub[self.cat_feature] = meta['categories']
+        ct = make_preprocessor().fit(stub)
+        scaler = ct.named_transformers_['num']
+        scaler.mean_ = np.array(meta['mean'])
+        scaler.var_ = np.array(meta['var'])
+        scale = np.sqrt(scaler.var_)
+        scale[scale == 0] = 1.0
+        scaler.scale_ = scale
+        scaler.n_samples_seen_ = meta['rows']['train']
+        return ct
@@ -0,0 +1,86 @@
+"""Parity of tree_engine with the estimators it replaces, on both sides of max_rows."""
+import os
+from unittest import mock
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from data_loader import load_dataset
+from tree_engine import TREE_ENGINE_TOLERANCE, TreeEngineRegressor, compile_trees, export_trees
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(ROOT, 'crop_yield_best_model2.pkl')
+DATASET = os.path.join(ROOT, 'crop_yield_dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def design():
+    """(regressor, transformed rows) for the exported production model."""
+    if not os.path.exists(MODEL):
+        pytest.skip('crop_yield_best_model2.pkl not available')
+    model = joblib.load(MODEL)
+    X = load_dataset(DATASET, cache=False).dropna().sample(2000, random_state=0)
+    return model.steps[-1][1], model[:-1].transform(X)
+
+
+@pytest.fixture(scope='module')
+def forest(design):
+    _, rows = design
+    target = np.asarray(rows[:, :3].sum(axis=1)).ravel()
+    return RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(rows, target)
+
+
+def assert_close(got, expected):
+    np.testing.assert_allclose(got, expected, rtol=TREE_ENGINE_TOLERANCE, atol=TREE_ENGINE_TOLERANCE)
+
+
+def test_export_matches_model(design):
+    regressor, rows = design
+    assert_close(export_trees(regressor).predict(rows), regressor.predict(rows))
+
+
+def test_export_matches_forest(design, forest):
+    _, rows = design
+    assert_close(export_trees(forest).predict(rows), forest.predict(rows))
+
+
+@pytest.mark.parametrize('n', [1, 7, 32])
+def test_small_batches_use_engine(design, n):
+    regressor, rows = design
+    fast = compile_trees(regressor, rows[:100])
+    assert isinstance(fast, TreeEngineRegressor)
+    with mock.patch.object(fast.engine, 'predict', wraps=fast.engine.predict) as engine, \
+            mock.patch.object(regressor, 'predict', wraps=regressor.predict) as native:
+        got = fast.predict(rows[:n])
+    assert engine.call_count == 1 and native.call_count == 0
+    assert_close(got, regressor.predict(rows[:n]))
+
+
+@pytest.mark.parametrize('n', [33, 2000])
+def test_large_batches_fall_back(design, n):
+    regressor, rows = design
+    fast = compile_trees(regressor, rows[:100])
+    with mock.patch.object(fast.engine, 'predict', wraps=fast.engine.predict) as engine, \
+            mock.patch.object(regressor, 'predict', wraps=regressor.predict) as native:
+        got = fast.predict(rows[:n])
+    assert engine.call_count == 0 and native.call_count == 1
+    assert_close(got, regressor.predict(rows[:n]))
+
+
+def test_max_rows_override(design):
+    regressor, rows = design
+    fast = TreeEngineRegressor(export_trees(regressor), regressor, max_rows=500)
+    with mock.patch.object(fast.engine, 'predict', wraps=fast.engine.predict) as engine:
+        got = fast.predict(rows[:500])
+    assert engine.call_count == 1
+    assert_close(got, regressor.predict(rows[:500]))
+
+
+def test_compile_rejects_mismatch(design):
+    regressor, rows = design
+    engine = export_trees(regressor)
+    engine.base = engine.base + 1.0
+    with mock.patch('tree_engine.export_trees', return_value=engine):
+        assert compile_trees(regressor, rows[:50]) is None
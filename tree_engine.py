@@ -0,0 +1,389 @@
+"""Flattened tree-ensemble inference in NumPy.
+
+The fitted trees of the saved regressor (XGBoost, LightGBM or a scikit-learn
+random forest) are exported into a handful of contiguous node arrays shared by
+all trees, and a batch is scored by walking every (row, tree) pair one level
+per step with vectorised NumPy indexing:
+
+    python tree_engine.py export [model.pkl] [--output model.trees.npz] [--float64]
+    python tree_engine.py check  [model.pkl] [--rows 5000]
+
+`check` compares the engine with model.predict on rows of the training data.
+Setting INFERENCE_ENGINE=trees makes the app score with it (see model_loader.py).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+
+logger = logging.getLogger('agripredict.inference')
+
+# Rows x trees walked together; bounds the engine's working memory (about 25 bytes per element)
+TREE_ENGINE_CHUNK_ELEMENTS = int(os.environ.get('TREE_ENGINE_CHUNK_ELEMENTS', 1 << 20))
+# Batches larger than this go to the original estimator, whose compiled traversal wins on big inputs.
+# Unset uses the crossover measured with benchmarks/bench_tree_engine.py for the model's library.
+TREE_ENGINE_MAX_ROWS = os.environ.get('TREE_ENGINE_MAX_ROWS')
+DEFAULT_MAX_ROWS = {'xgboost': 32, 'lightgbm': 32, 'sklearn': 512}
+# Largest relative difference from model.predict accepted when the engine is built at load time
+TREE_ENGINE_TOLERANCE = 1e-5
+
+# XGBoost objectives whose prediction is the raw margin
+XGB_IDENTITY_OBJECTIVES = {'reg:squarederror', 'reg:squaredlogerror', 'reg:pseudohubererror', 'reg:absoluteerror',
+                           'reg:quantileerror'}
+
+
+def _strict_below(threshold, dtype):
+    """Per-element t' with (x <= threshold) == (x < t') for every x representable in dtype."""
+    threshold = np.asarray(threshold, dtype=np.float64)
+    if dtype == np.float64:
+        return np.nextafter(threshold, np.inf)
+    t32 = threshold.astype(np.float32)
+    # Largest float32 not above the threshold, then the next one up
+    t32 = np.where(t32.astype(np.float64) > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+    return np.nextafter(t32, np.float32(np.inf))
+
+
+class TreeEnsemble:
+    """All trees of an ensemble as flat node arrays.
+
+    Node i tests `x[feature[i]] < threshold[i]`. Its two children are stored
+    next to each other, so it continues at children[i] when the test holds and
+    at children[i] + 1 when it does not; a NaN (or, for LightGBM's
+    zero-as-missing splits flagged in zero_missing, an exact 0) goes to
+    children[i] + default_right[i]. Leaves point to themselves and carry the
+    output in value[i]. A fixed number of steps (`depth`) therefore lands every
+    row on its leaf in every tree without per-node branching. The prediction is
+    base + the sum of the leaves, or their mean for a forest (`average`).
+
+    `dtype` is the type features and thresholds are compared in. Splits are
+    rewritten to strict `<` tests that agree with the original model for every
+    value of that type. float32 (half the memory of float64) is therefore exact
+    for XGBoost and scikit-learn models, which compare in float32 themselves.
+    LightGBM compares in float64.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'children', 'default_right', 'zero_missing', 'value', 'roots')
+
+    def __init__(self, feature, threshold, children, default_right, value, roots, base=0.0, average=False,
+                 sum_dtype=np.float64, input_dtype=np.float64, zero_missing=None, n_features=None, source=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold)
+        self.children = np.ascontiguousarray(children, dtype=np.int32)
+        self.default_right = np.ascontiguousarray(default_right, dtype=np.uint8)
+        self.zero_missing = None if zero_missing is None or not np.any(zero_missing) else np.asarray(zero_missing, bool)
+        self.value = np.ascontiguousarray(value, dtype=sum_dtype)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.base = float(base)
+        self.average = bool(average)
+        self.dtype = self.threshold.dtype.type
+        self.input_dtype = np.dtype(input_dtype).type
+        self.n_features = int(n_features if n_features is not None else self.feature.max() + 1)
+        self.source = source
+        self.depth = self._max_depth()
+
+    def _max_depth(self):
+        nodes, depth = self.roots, 0
+        while True:
+            internal = nodes[self.children[nodes] != nodes]
+            if not len(internal):
+                return depth
+            nodes = np.concatenate([self.children[internal], self.children[internal] + 1])
+            depth += 1
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS if getattr(self, name) is not None)
+
+    def leaves(self, X):
+        """(n_rows, n_trees) leaf values for a 2-D feature array."""
+        # Round features the way the model does before comparing, e.g. to float32 for XGBoost and scikit-learn
+        X = np.ascontiguousarray(np.asarray(X, dtype=self.input_dtype), dtype=self.dtype)
+        n_rows, n_features = X.shape
+        if n_features != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {n_features}")
+        out = np.empty((n_rows, self.n_trees), dtype=self.value.dtype)
+        step = max(1, TREE_ENGINE_CHUNK_ELEMENTS // max(self.n_trees, 1))
+        flat = X.ravel()
+        check_missing = self.zero_missing is not None or np.isnan(X).any()
+        for start in range(0, n_rows, step):
+            stop = min(start + step, n_rows)
+            offsets = (np.arange(start, stop, dtype=np.intp) * n_features)[:, None]
+            node = np.broadcast_to(self.roots, (stop - start, self.n_trees)).copy()
+            for _ in range(self.depth):
+                v = flat[offsets + self.feature[node]]
+                right = v >= self.threshold[node]
+                if check_missing:
+                    miss = np.isnan(v)
+                    if self.zero_missing is not None:
+                        miss |= (v == 0) & self.zero_missing[node]
+                    right = np.where(miss, self.default_right[node], right)
+                node = self.children[node] + right
+            out[start:stop] = self.value[node]
+        return out
+
+    def predict(self, X):
+        leaves = self.leaves(X)
+        if self.average:
+            return leaves.sum(axis=1) / self.n_trees + self.base
+        if self.value.dtype == np.float32:
+            # XGBoost adds the trees to the base score one at a time in float32; do the same
+            start = np.full((len(leaves), 1), self.base, dtype=np.float32)
+            return np.cumsum(np.hstack([start, leaves]), axis=1, dtype=np.float32)[:, -1]
+        return leaves.sum(axis=1) + self.base
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+        meta = {"base": self.base, "average": self.average, "n_features": self.n_features, "source": self.source,
+                "input_dtype": np.dtype(self.input_dtype).name}
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {name: data[name] for name in cls.ARRAYS if name in data.files}
+        return cls(base=meta['base'], average=meta['average'], n_features=meta['n_features'], source=meta['source'],
+                   sum_dtype=arrays['value'].dtype, input_dtype=meta['input_dtype'], **arrays)
+
+
+class _Builder:
+    """Collects trees and lays their nodes out breadth-first with sibling nodes adjacent."""
+
+    def __init__(self):
+        self.parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_right', 'zero_missing',
+                                            'value')}
+        self.roots = []
+        self.size = 0
+
+    def add_tree(self, feature, threshold, left, right, missing, value, zero_missing=None):
+        """Arrays indexed by node id within the tree, root 0; leaves have left == -1."""
+        n = len(feature)
+        left, right = np.asarray(left), np.asarray(right)
+        leaf = left < 0
+        self.roots.append(self.size)
+        self.parts['feature'].append(np.where(leaf, 0, feature))
+        self.parts['threshold'].append(np.where(leaf, np.inf, threshold))
+        self.parts['left'].append(np.where(leaf, -1, left + self.size))
+        self.parts['right'].append(np.where(leaf, -1, right + self.size))
+        self.parts['default_right'].append(~leaf & (np.asarray(missing) == right))
+        self.parts['zero_missing'].append(np.zeros(n, bool) if zero_missing is None else ~leaf & zero_missing)
+        self.parts['value'].append(np.where(leaf, value, 0.0))
+        self.size += n
+
+    def build(self, dtype, **kwargs):
+        old = {name: np.concatenate(parts) for name, parts in self.parts.items()}
+        # Renumber level by level over all trees: roots first, then each internal node's two children as a pair
+        frontier = np.asarray(self.roots, dtype=np.intp)
+        order, new_id = [frontier], np.empty(self.size, dtype=np.intp)
+        new_id[frontier] = np.arange(len(frontier))
+        first_child = np.full(self.size, -1, dtype=np.intp)
+        size = len(frontier)
+        while len(frontier):
+            internal = frontier[old['left'][frontier] >= 0]
+            frontier = np.column_stack([old['left'][internal], old['right'][internal]]).ravel()
+            new_id[frontier] = size + np.arange(len(frontier))
+            first_child[internal] = size + 2 * np.arange(len(internal))
+            size += len(frontier)
+            order.append(frontier)
+        order = np.concatenate(order)
+        children = first_child[order]
+        children = np.where(children < 0, np.arange(len(order)), children)
+        arrays = {name: old[name][order] for name in ('feature', 'threshold', 'default_right', 'zero_missing', 'value')}
+        arrays['threshold'] = arrays['threshold'].astype(dtype)
+        return TreeEnsemble(children=children, roots=np.arange(len(self.roots)), **arrays, **kwargs)
+
+
+def from_xgboost(model, dtype=np.float32):
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    objective = learner['objective']['name']
+    if objective not in XGB_IDENTITY_OBJECTIVES:
+        raise ValueError(f"XGBoost objective '{objective}' is not supported")
+    gbm = learner['gradient_booster']
+    if gbm['name'] != 'gbtree':
+        raise ValueError(f"XGBoost booster '{gbm['name']}' is not supported")
+    trees = gbm['model']['trees']
+    # XGBRegressor.predict stops at the best iteration when early stopping was used
+    try:
+        best = model.best_iteration
+    except AttributeError:
+        best = None
+    if best is not None:
+        trees = trees[:int(gbm['model']['iteration_indptr'][best + 1])]
+
+    builder = _Builder()
+    for tree in trees:
+        if any(tree.get('split_type', [])):
+            raise ValueError("Categorical XGBoost splits are not supported")
+        left = np.asarray(tree['left_children'])
+        right = np.asarray(tree['right_children'])
+        cond = np.asarray(tree['split_conditions'], dtype=np.float32)
+        builder.add_tree(np.asarray(tree['split_indices']), cond.astype(np.float64), left, right,
+                         np.where(np.asarray(tree['default_left'], bool), left, right), cond.astype(np.float64))
+    base = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    return builder.build(dtype, base=np.float32(base), sum_dtype=np.float32, input_dtype=np.float32,
+                         n_features=int(learner['learner_model_param']['num_feature']), source='xgboost')
+
+
+def from_sklearn(model, dtype=np.float32):
+    estimators = getattr(model, 'estimators_', None)
+    estimators = [model] if estimators is None else list(estimators)
+    builder = _Builder()
+    for estimator in estimators:
+        tree = getattr(estimator, 'tree_', None)
+        if tree is None or tree.n_outputs != 1:
+            raise ValueError(f"{type(estimator).__name__} is not a single-output regression tree")
+        left, right = tree.children_left, tree.children_right
+        # Trees fitted without missing values send NaN right (NaN <= t is false)
+        go_left = getattr(tree, 'missing_go_to_left', np.zeros(len(left), np.uint8)).astype(bool)
+        builder.add_tree(tree.feature, _strict_below(tree.threshold, dtype), left, right,
+                         np.where(go_left, left, right), tree.value[:, 0, 0])
+    return builder.build(dtype, average=len(estimators) > 1, input_dtype=np.float32,
+                         n_features=model.n_features_in_, source='sklearn')
+
+
+def from_lightgbm(model, dtype=np.float64):
+    booster = model.booster_ if hasattr(model, 'booster_') else model
+    dump = booster.dump_model()
+    if dump.get('objective', 'regression').split()[0] not in ('regression', 'regression_l1', 'huber', 'fair',
+                                                             'quantile'):
+        raise ValueError(f"LightGBM objective '{dump['objective']}' is not supported")
+    best = getattr(model, 'best_iteration_', None)
+    infos = dump['tree_info'][:best] if best else dump['tree_info']
+
+    builder = _Builder()
+    for info in infos:
+        nodes = []
+
+        def visit(node):
+            # Preorder numbering; children are filled in once numbered
+            index = len(nodes)
+            nodes.append(node)
+            if 'leaf_value' not in node:
+                if node.get('decision_type', '<=') != '<=':
+                    raise ValueError("Categorical LightGBM splits are not supported")
+                node['_left'] = visit(node['left_child'])
+                node['_right'] = visit(node['right_child'])
+            return index
+
+        visit(info['tree_structure'])
+        feature, threshold, left, right, missing, zero_missing, value = ([] for _ in range(7))
+        for node in nodes:
+            if 'leaf_value' in node:
+                feature.append(0), threshold.append(np.inf), left.append(-1), right.append(-1)
+                missing.append(-1), zero_missing.append(False), value.append(node['leaf_value'])
+                continue
+            kind = node.get('missing_type', 'None')
+            default = node['_left'] if node.get('default_left') else node['_right']
+            if kind == 'None':
+                # No missing-value handling: LightGBM treats NaN as 0
+                default = node['_left'] if 0.0 <= node['threshold'] else node['_right']
+            feature.append(node['split_feature']), threshold.append(node['threshold'])
+            left.append(node['_left']), right.append(node['_right']), missing.append(default)
+            zero_missing.append(kind == 'Zero'), value.append(0.0)
+        builder.add_tree(np.asarray(feature), _strict_below(threshold, dtype), np.asarray(left), np.asarray(right),
+                         np.asarray(missing), np.asarray(value, dtype=np.float64), np.asarray(zero_missing))
+    return builder.build(dtype, n_features=dump['max_feature_idx'] + 1, source='lightgbm')
+
+
+def export_trees(model, dtype=None):
+    """Flatten a fitted regressor into a TreeEnsemble; raises ValueError for unsupported models.
+
+    dtype None picks the exact comparison type for the model: float32 for
+    XGBoost and scikit-learn, float64 for LightGBM.
+    """
+    module = type(model).__module__
+    if module.startswith('xgboost'):
+        return from_xgboost(model, dtype or np.float32)
+    if module.startswith('lightgbm'):
+        return from_lightgbm(model, dtype or np.float64)
+    if module.startswith('sklearn'):
+        return from_sklearn(model, dtype or np.float32)
+    raise ValueError(f"Cannot export trees of {type(model).__name__}")
+
+
+class TreeEngineRegressor:
+    """Drop-in for the fitted regressor: the engine scores up to max_rows rows, the estimator anything larger."""
+
+    def __init__(self, engine, regressor, max_rows=TREE_ENGINE_MAX_ROWS):
+        self.engine = engine
+        self.regressor = regressor
+        self.max_rows = int(max_rows) if max_rows else DEFAULT_MAX_ROWS.get(engine.source, 32)
+
+    def predict(self, X):
+        if len(X) <= self.max_rows:
+            return self.engine.predict(X)
+        return self.regressor.predict(X)
+
+
+def compile_trees(regressor, sample):
+    """TreeEngineRegressor for the regressor if the engine reproduces regressor.predict on `sample`; None otherwise."""
+    try:
+        engine = export_trees(regressor)
+    except (ValueError, AttributeError, KeyError) as e:
+        logger.warning("Tree engine disabled: %s", e)
+        return None
+    expected = regressor.predict(sample)
+    if not np.allclose(engine.predict(sample), expected, rtol=TREE_ENGINE_TOLERANCE, atol=TREE_ENGINE_TOLERANCE):
+        logger.warning("Tree engine disabled: result differs from model.predict")
+        return None
+    return TreeEngineRegressor(engine, regressor)
+
+
+def parity(model, X):
+    """Largest absolute and relative difference between the engine and model.predict on X."""
+    regressor = model.steps[-1][1] if hasattr(model, 'steps') else model
+    design = model[:-1].transform(X) if hasattr(model, 'steps') else X
+    expected = regressor.predict(design)
+    got = export_trees(regressor).predict(design)
+    diff = np.abs(got - expected)
+    return float(diff.max()), float((diff / np.maximum(np.abs(expected), 1e-12)).max())
+
+
+def main(argv=None):
+    import joblib
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Export a model's trees to NumPy arrays or check them against model.predict")
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('model', nargs='?', default='crop_yield_best_model2.pkl')
+    parser.add_argument('--output', help="export path (default: <model>.trees.npz)")
+    parser.add_argument('--float64', action='store_true', help="compare in float64 instead of the model's exact type")
+    parser.add_argument('--rows', type=int, default=5000, help="rows of crop_yield_dataset.csv used by check")
+    args = parser.parse_args(argv)
+
+    model = joblib.load(args.model)
+    regressor = model.steps[-1][1] if hasattr(model, 'steps') else model
+    engine = export_trees(regressor, np.float64 if args.float64 else None)
+    print(f"{engine.source}: {engine.n_trees} trees, {engine.n_nodes} nodes, depth {engine.depth}, "
+          f"{engine.dtype.__name__} thresholds, {engine.nbytes / 1e6:.2f} MB")
+    if args.command == 'export':
+        output = args.output or os.path.splitext(args.model)[0] + '.trees.npz'
+        engine.save(output)
+        print(f"Wrote {output}")
+        return
+
+    from data_loader import load_dataset
+    X = load_dataset('crop_yield_dataset.csv').dropna()
+    X = X.sample(min(args.rows, len(X)), random_state=0)
+    abs_diff, rel_diff = parity(model, X)
+    print(f"{len(X)} rows: max abs diff {abs_diff:.3g}, max rel diff {rel_diff:.3g}")
+    if rel_diff > TREE_ENGINE_TOLERANCE:
+        sys.exit("Parity check failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Input validation and crop-name normalisation shared by every prediction path.
+
+An InputValidator is built per loaded model from its fitted encoder's
+categories and the per-feature ranges of the training data. Crop names are
+case-folded and passed through the alias table of merge_agri_datasets.py
+('Soyabean', 'Maize (corn)', 'sugar cane'), then mapped to the encoder's own
+spelling. A name that maps to no category is an error instead of the all-zeros
+one-hot row OneHotEncoder(handle_unknown='ignore') would give it. Numbers must
+be finite and physically possible; values outside the training range are
+reported as warnings, or rejected with VALIDATION_RANGE_MODE=reject.
+
+Batches are checked column-wise with NumPy, and crop names are resolved once
+per distinct value. Errors use the batch API's shape, {row: {field: message}}.
+"""
+import functools
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import NUM_FEATURES
+from merge_agri_datasets import CROP_NAME_MAP, map_crop_names
+
+
+logger = logging.getLogger('agripredict.model')
+
+# 'warn' flags values outside the training range, 'reject' turns them into errors, 'off' skips the check
+VALIDATION_RANGE_MODE = os.environ.get('VALIDATION_RANGE_MODE', 'warn')
+# Slack around the training range, as a fraction of its width
+VALIDATION_RANGE_MARGIN = float(os.environ.get('VALIDATION_RANGE_MARGIN', 0.1))
+# Source of the training ranges for models whose metadata does not carry them
+TRAINING_DATA = os.environ.get('TRAINING_DATA', 'crop_yield_dataset.csv')
+
+# Values no field can take, whatever the training data looked like
+PHYSICAL_LIMITS = {
+    'Soil_pH': (0.0, 14.0),
+    'Humidity': (0.0, 100.0),
+    'N': (0.0, math.inf),
+    'P': (0.0, math.inf),
+    'K': (0.0, math.inf),
+    'Soil_Quality': (0.0, 100.0),
+}
+
+# Standard names (after map_crop_names) that the training set spells differently
+CROP_SYNONYMS = {'maize': 'corn'}
+# Distinct crop spellings remembered for the single-row path
+MAX_CACHED_NAMES = 10000
+
+
+class ValidationError(ValueError):
+    """Raised for a single row that fails validation; `errors` maps field to message."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"{field} {message}" for field, message in errors.items()))
+        self.errors = errors
+
+
+def fold(name):
+    return str(name).strip().casefold()
+
+
+def feature_ranges(frame):
+    """{feature: [min, max]} of the numeric training features, for the registry metadata."""
+    return {f: [round(float(frame[f].min()), 6), round(float(frame[f].max()), 6)] for f in NUM_FEATURES if f in frame}
+
+
+@functools.lru_cache(maxsize=4)
+def dataset_ranges(path=TRAINING_DATA):
+    """Feature ranges of the training CSV, read once per process; None when it is not available."""
+    from data_loader import load_dataset
+
+    try:
+        return feature_ranges(load_dataset(path, columns=NUM_FEATURES))
+    except (OSError, ValueError, KeyError) as e:
+        logger.info("Training ranges unavailable, range checks off: %s", e)
+        return None
+
+
+def _fmt(value):
+    return f"{value:g}"
+
+
+class InputValidator:
+    """Checks raw feature values and maps crop names onto one model's encoder categories."""
+
+    def __init__(self, categories, ranges=None, range_mode=VALIDATION_RANGE_MODE, margin=VALIDATION_RANGE_MARGIN):
+        if range_mode not in ('warn', 'reject', 'off'):
+            raise ValueError(f"VALIDATION_RANGE_MODE must be 'warn', 'reject' or 'off', not '{range_mode}'")
+        self.categories = [str(c) for c in categories]
+        self.range_mode = range_mode if ranges else 'off'
+        self._names = {fold(c): c for c in self.categories}
+        self._aliases = {fold(k): v for k, v in CROP_NAME_MAP.items()}
+        self._cache = {}
+
+        self.low = np.array([PHYSICAL_LIMITS.get(f, (-math.inf, math.inf))[0] for f in NUM_FEATURES])
+        self.high = np.array([PHYSICAL_LIMITS.get(f, (-math.inf, math.inf))[1] for f in NUM_FEATURES])
+        self.train_low = np.full(len(NUM_FEATURES), -math.inf)
+        self.train_high = np.full(len(NUM_FEATURES), math.inf)
+        for i, f in enumerate(NUM_FEATURES):
+            if ranges and f in ranges:
+                lo, hi = ranges[f]
+                slack = (hi - lo) * margin
+                self.train_low[i], self.train_high[i] = lo - slack, hi + slack
+        self.ranges = ranges
+        self._limits = list(zip(*(a.tolist() for a in (self.low, self.high, self.train_low, self.train_high))))
+
+    def canonical(self, name):
+        """The encoder's spelling of a crop name, or None when the model does not know it."""
+        key = fold(name)
+        if not self._names:
+            # A pipeline without a fitted encoder: nothing to map onto, pass the name through
+            return str(name).strip() or None
+        if key in self._names:
+            return self._names[key]
+        if key in self._cache:
+            return self._cache[key]
+        std = self._aliases.get(key) or map_crop_names(key)
+        crop = self._names.get(fold(std)) or self._names.get(CROP_SYNONYMS.get(std, ''))
+        if len(self._cache) < MAX_CACHED_NAMES:
+            self._cache[key] = crop
+        return crop
+
+    def crop_message(self, name):
+        if not str(name).strip():
+            return 'must be a non-empty string'
+        return f"unknown crop '{str(name).strip()}'; expected one of {', '.join(self.categories)}"
+
+    def normalize_crops(self, crops):
+        """Encoder spellings for an array of crop names (None where unknown), resolving each distinct name once."""
+        cat = pd.Categorical(pd.Series(crops, dtype=object).fillna('').astype(str))
+        mapped = np.array([self.canonical(c) for c in cat.categories] + [None], dtype=object)
+        return mapped[cat.codes]
+
+    def check_numeric(self, numeric):
+        """Per-field (mask, messages) pairs for an (n, 8) float array: errors, then range warnings."""
+        numeric = np.asarray(numeric, dtype=np.float64)
+        finite = np.isfinite(numeric)
+        with np.errstate(invalid='ignore'):
+            impossible = finite & ((numeric < self.low) | (numeric > self.high))
+            unusual = finite & ~impossible & ((numeric < self.train_low) | (numeric > self.train_high))
+        if self.range_mode == 'off':
+            unusual[:] = False
+        errors, warnings = {}, {}
+        for i, f in enumerate(NUM_FEATURES):
+            bad = ~finite[:, i] | impossible[:, i]
+            if self.range_mode == 'reject':
+                bad |= unusual[:, i]
+            if bad.any():
+                messages = np.full(len(numeric), 'must be a finite number', dtype=object)
+                messages[impossible[:, i]] = f"must be between {_fmt(self.low[i])} and {_fmt(self.high[i])}"
+                messages[unusual[:, i]] = self._range_message(f)
+                errors[f] = (bad, messages)
+            if self.range_mode == 'warn' and unusual[:, i].any():
+                warnings[f] = (unusual[:, i], self._range_message(f))
+        return errors, warnings
+
+    def _range_message(self, feature):
+        lo, hi = self.ranges[feature]
+        return f"outside the training range {_fmt(lo)} to {_fmt(hi)}"
+
+    def validate_frame(self, raw):
+        """Coerce and check all rows at once.
+
+        Returns the clean feature frame (only valid rows, original index kept,
+        crops in the encoder's spelling), {row: {field: message}} for the rows
+        that failed and the same for warnings on rows that passed.
+        """
+        n = len(raw)
+        missing = {}
+        numeric = np.empty((n, len(NUM_FEATURES)), dtype=np.float64)
+        for i, col in enumerate(NUM_FEATURES):
+            if col not in raw:
+                missing[col] = np.ones(n, dtype=bool)
+                numeric[:, i] = 0.0
+            else:
+                numeric[:, i] = pd.to_numeric(raw[col], errors='coerce').to_numpy(dtype=float)
+        field_errors, field_warnings = self.check_numeric(numeric)
+        for col, mask in missing.items():
+            field_errors[col] = (mask, 'missing field')
+
+        if 'Crop_Type' not in raw:
+            crops = np.full(n, None, dtype=object)
+            field_errors['Crop_Type'] = (np.ones(n, dtype=bool), 'missing field')
+        else:
+            names = raw['Crop_Type'].fillna('').astype(str).str.strip()
+            crops = self.normalize_crops(names)
+            bad = pd.isna(crops)
+            if bad.any():
+                # One message per distinct bad name rather than per row
+                messages = {name: self.crop_message(name) for name in names[bad].unique()}
+                field_errors['Crop_Type'] = (bad, names.map(messages).to_numpy(dtype=object))
+
+        valid = np.ones(n, dtype=bool)
+        for mask, _ in field_errors.values():
+            valid &= ~mask
+        frame = pd.DataFrame(numeric, columns=NUM_FEATURES)
+        frame['Crop_Type'] = crops
+        return frame[valid], _by_row(field_errors), _by_row(field_warnings, valid)
+
+    def validate_row(self, values, crop_required=True):
+        """Clean feature dict for one row of raw values, plus its warnings; raises ValidationError."""
+        row, errors, warnings = {}, {}, {}
+        # Scalar version of check_numeric: one row should not pay for NumPy's per-call overhead
+        for name, (low, high, train_low, train_high) in zip(NUM_FEATURES, self._limits):
+            value = values.get(name)
+            if value is None or value == '':
+                errors[name] = 'missing field'
+                continue
+            try:
+                value = row[name] = float(value)
+            except (TypeError, ValueError):
+                errors[name] = 'must be a finite number'
+                continue
+            if not math.isfinite(value):
+                errors[name] = 'must be a finite number'
+            elif not low <= value <= high:
+                errors[name] = f"must be between {_fmt(low)} and {_fmt(high)}"
+            elif self.range_mode != 'off' and not train_low <= value <= train_high:
+                if self.range_mode == 'reject':
+                    errors[name] = self._range_message(name)
+                else:
+                    warnings[name] = self._range_message(name)
+        if crop_required or values.get('Crop_Type') is not None:
+            name = values.get('Crop_Type')
+            crop = self.canonical(name) if name is not None else None
+            if crop is None:
+                errors['Crop_Type'] = 'missing field' if name is None else self.crop_message(name)
+            row['Crop_Type'] = crop
+        if errors:
+            raise ValidationError(errors)
+        return row, warnings
+
+    def describe(self):
+        return {
+            "categories": self.categories,
+            "range_mode": self.range_mode,
+            "training_ranges": self.ranges,
+            "physical_limits": {f: list(v) for f, v in PHYSICAL_LIMITS.items()},
+        }
+
+
+def _by_row(field_masks, keep=None):
+    """{row: {field: message}} from per-field (mask, message-or-array) pairs."""
+    out = {}
+    for field, (mask, message) in field_masks.items():
+        if keep is not None:
+            mask = mask & keep
+        for i in np.flatnonzero(mask):
+            out.setdefault(int(i), {})[field] = message if isinstance(message, str) else message[i]
+    return out
+
+
+def build_validator(categories, metadata=None):
+    """InputValidator for a model's categories, with its training ranges from the metadata or the dataset."""
+    ranges = (metadata or {}).get('feature_ranges') or dataset_ranges()
+    return InputValidator(categories, ranges)